@@ -1,25 +1,140 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import Company, UnderwritingAssessment, ChecklistKind, UnderwritingChecklist
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+from . import search
+from .checklist_kinds import get_kind, get_kinds
+from .models import Company, UnderwritingAssessment, ChecklistKind, UnderwritingChecklist, SyncJob, PortfolioAggregate, CompanyImport
+
+
+def estimate_row_count(model, using='default'):
+    """
+    Stima economica del numero di righe della tabella di `model`, senza COUNT(*),
+    dalle statistiche del planner: pg_class.reltuples su PostgreSQL, sqlite_stat1
+    (scritta da ANALYZE) su SQLite. Restituisce None se la tabella non è mai
+    stata analizzata o se il database non fornisce statistiche.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)",
+                           [connection.ops.quote_name(table)])
+            row = cursor.fetchone()
+            # reltuples vale -1 per le tabelle mai analizzate
+            return row[0] if row and row[0] is not None and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            try:
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            except DatabaseError:
+                # sqlite_stat1 esiste solo dopo il primo ANALYZE
+                return None
+            row = cursor.fetchone()
+            # Il primo numero di `stat` è il numero di righe della tabella
+            return int(row[0].split()[0]) if row and row[0] else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator che, per le liste non filtrate di tabelle grandi, usa una stima
+    del numero di righe invece di un COUNT(*) esatto a ogni caricamento. Le
+    liste filtrate (filtri, ricerca) e le tabelle senza statistiche usano il
+    COUNT(*) esatto.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not getattr(queryset, 'query', None) or queryset.query.where:
+            return super().count
+        estimate = estimate_row_count(queryset.model, queryset.db)
+        threshold = getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 10000)
+        if estimate is None or estimate < threshold:
+            return super().count
+        return estimate
+
 
 @admin.register(Company)
 class CompanyAdmin(admin.ModelAdmin):
     list_display = ('vat_number', 'legal_form', 'activity', 'city', 'country')
     search_fields = ('vat_number', 'activity', 'city')
     list_filter = ('legal_form', 'country', 'region')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Ricerca sull'indice full-text invece di icontains sui search_fields
+        if not search_term.strip():
+            return queryset, False
+        return search.search_queryset(queryset, search_term, rank=False), False
 
 @admin.register(UnderwritingAssessment)
 class UnderwritingAssessmentAdmin(admin.ModelAdmin):
     list_display = ('company', 'underwriting_year', 'risk_score', 'win_probability')
     search_fields = ('company__vat_number', 'company__activity')
     list_filter = ('underwriting_year', 'risk_score')
+    autocomplete_fields = ('company',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # __str__ usa company.vat_number: vale anche per l'autocomplete delle checklist
+        return super().get_queryset(request).select_related('company')
 
 @admin.register(ChecklistKind)
 class ChecklistKindAdmin(admin.ModelAdmin):
     list_display = ('name', 'rating')
     search_fields = ('name',)
 
+class ChecklistKindFilter(admin.SimpleListFilter):
+    """
+    Filtro per tipo con le scelte prese dal registro in memoria.
+    """
+    title = 'tipo'
+    parameter_name = 'kind'
+
+    def lookups(self, request, model_admin):
+        kinds = sorted(get_kinds().values(), key=lambda kind: kind.name)
+        return [(str(kind.uuid), kind.name) for kind in kinds]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(kind_id=self.value())
+        return queryset
+
+
 @admin.register(UnderwritingChecklist)
 class UnderwritingChecklistAdmin(admin.ModelAdmin):
-    list_display = ('assessment', 'kind', 'value', 'is_compliant', 'completed_by')
+    list_display = ('assessment', 'kind_name', 'value', 'is_compliant', 'completed_by')
     search_fields = ('assessment__company__vat_number', 'kind__name', 'completed_by')
-    list_filter = ('is_compliant', 'kind')
+    list_filter = ('is_compliant', ChecklistKindFilter)
+    autocomplete_fields = ('assessment', 'kind')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # __str__ usa assessment.company.vat_number; il tipo viene dal registro
+        return super().get_queryset(request).select_related('assessment__company')
+
+    @admin.display(description='tipo', ordering='kind__name')
+    def kind_name(self, obj):
+        kind = get_kind(obj.kind_id)
+        return kind.name if kind is not None else '-'
+
+@admin.register(SyncJob)
+class SyncJobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'status', 'processed', 'created', 'updated', 'failed', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
+
+@admin.register(PortfolioAggregate)
+class PortfolioAggregateAdmin(admin.ModelAdmin):
+    list_display = ('underwriting_year', 'region', 'legal_form', 'ateco_section', 'assessments', 'total_turnover')
+    list_filter = ('underwriting_year', 'legal_form', 'ateco_section')
+
+@admin.register(CompanyImport)
+class CompanyImportAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'dry_run', 'rows', 'created', 'updated', 'failed', 'created_at', 'duration')
+    list_filter = ('dry_run',)
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CompanyInfoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'company_info'
+
+    def ready(self):
+        # metrics registra il wrapper delle query, checklist_kinds il controllo della cache
+        from . import checklist_kinds, metrics, search  # noqa: F401
+
+        # L'indice full-text non è gestito dalle migrazioni (vedi search.install)
+        post_migrate.connect(search.install, sender=self)
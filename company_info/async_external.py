@@ -0,0 +1,242 @@
+"""
+Client asincrono del servizio esterno di informazioni aziendali, per le view
+di company_info.async_views servite via ASGI.
+
+Le chiamate HTTP usano un httpx.AsyncClient condiviso (uno per event loop) con
+un pool di connessioni keep-alive, così un processo può tenere in volo
+centinaia di ricerche senza occupare un thread per ciascuna. La logica di
+cache e di mappatura è quella di company_info.external; le parti sincrone
+(cache e database) girano in sezioni sync_to_async:
+- la cache delle ricerche in thread non legati alla connessione al database;
+- le scritture a blocchi, raccolte da più richieste concorrenti da
+  CompanyWriteBatcher ed eseguite con un unico upsert per blocco.
+
+httpx è una dipendenza opzionale, necessaria solo per queste view: senza
+httpx le route /api/async/ non vengono registrate (vedi company_info.urls).
+"""
+import asyncio
+import time
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+from . import lookup_cache, metrics
+from .external import (
+    CompanyNotFound, company_data_to_company_info, get_service_url, get_timeout, lookup_cached,
+    save_lookups, store_response,
+)
+from .models import Company
+from .serializers import CompanySerializer
+from .upsert import iter_upsert_companies
+
+try:
+    import httpx
+    HTTPError = httpx.HTTPError
+except ImportError:
+    httpx = None
+    # Senza httpx non ci sono errori HTTP da intercettare: get_client segnala la dipendenza mancante
+    HTTPError = ()
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_clients = weakref.WeakKeyDictionary()
+_batchers = weakref.WeakKeyDictionary()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def get_max_concurrency():
+    return _setting('COMPANY_INFO_ASYNC_MAX_CONCURRENCY', 200)
+
+
+def get_client():
+    """
+    Client HTTP asincrono condiviso dall'event loop corrente.
+    """
+    if httpx is None:
+        raise ImproperlyConfigured("Le view asincrone richiedono il pacchetto httpx")
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        max_connections = get_max_concurrency()
+        client = _clients[loop] = httpx.AsyncClient(
+            timeout=get_timeout(),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            # Trasporto alternativo (es. httpx.MockTransport nei test); None usa la rete
+            transport=_setting('COMPANY_INFO_ASYNC_TRANSPORT', None),
+        )
+    return client
+
+
+@receiver(setting_changed)
+def _reset_clients(setting, **kwargs):
+    # I client vengono chiusi dal garbage collector insieme al loro event loop
+    if setting.startswith(('COMPANY_INFO_SERVICE_', 'COMPANY_INFO_ASYNC_', 'COMPANY_ASYNC_')):
+        _clients.clear()
+        _batchers.clear()
+
+
+async def _get(url, **kwargs):
+    """
+    GET con retry e backoff esponenziale sugli errori transitori, come la
+    sessione sincrona di company_info.external.
+    """
+    retries = _setting('COMPANY_INFO_SERVICE_RETRIES', 3)
+    backoff = _setting('COMPANY_INFO_SERVICE_BACKOFF', 0.5)
+    client = get_client()
+    for attempt in range(retries + 1):
+        started = time.perf_counter()
+        try:
+            response = await client.get(url, **kwargs)
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+        finally:
+            metrics.record_upstream_call(url, time.perf_counter() - started)
+        await asyncio.sleep(backoff * 2 ** attempt)
+
+
+async def afetch_company_data(vat_number):
+    """
+    Versione asincrona di external.fetch_company_data. Solleva CompanyNotFound
+    per le partite IVA sconosciute e httpx.HTTPError per gli altri errori.
+    """
+    entry, company_data = await sync_to_async(lookup_cached, thread_sensitive=False)(vat_number)
+    if company_data is not None:
+        return company_data
+
+    response = await _get(
+        get_service_url(),
+        params={'vat_number': vat_number},
+        headers=lookup_cache.conditional_headers(entry),
+    )
+    if response.status_code not in (304, 404):
+        response.raise_for_status()
+    return await sync_to_async(store_response, thread_sensitive=False)(
+        vat_number, entry, response.status_code, response.headers, response.json,
+    )
+
+
+async def afetch_companies_data(vat_numbers):
+    """
+    Versione asincrona di external.fetch_companies_data, con al massimo
+    COMPANY_INFO_ASYNC_MAX_CONCURRENCY ricerche in volo.
+    """
+    get_client()
+    semaphore = asyncio.Semaphore(get_max_concurrency())
+
+    async def fetch(vat_number):
+        async with semaphore:
+            try:
+                return vat_number, await afetch_company_data(vat_number)
+            except (CompanyNotFound, HTTPError, ValueError) as e:
+                return vat_number, e
+
+    return await asyncio.gather(*(fetch(vat_number) for vat_number in vat_numbers))
+
+
+async def alookup_companies(vat_numbers):
+    """
+    Versione asincrona di external.lookup_companies: le ricerche sono
+    concorrenti e il salvataggio avviene in un'unica sezione sincrona.
+    """
+    fetched = await afetch_companies_data(vat_numbers)
+    return await sync_to_async(save_lookups)(vat_numbers, fetched)
+
+
+def save_companies(rows):
+    """
+    Salva le aziende `rows` (dizionari di campi di Company) con un upsert a
+    blocchi e restituisce, nello stesso ordine, coppie (esito, dati serializzati)
+    con esito 'created', 'updated' o 'failed' (e i dati l'errore).
+    """
+    outcomes = {}
+    errors = {}
+    with transaction.atomic():
+        for chunk_result in iter_upsert_companies(rows):
+            outcomes.update(chunk_result.outcomes)
+            errors.update((error['vat_number'], error['error']) for error in chunk_result.errors)
+        saved = [vat_number for vat_number, outcome in outcomes.items() if outcome != 'failed']
+        companies = Company.objects.in_bulk(saved, field_name='vat_number')
+    results = []
+    for row in rows:
+        vat_number = row['vat_number']
+        outcome = outcomes.get(vat_number, 'failed')
+        if outcome == 'failed':
+            results.append((outcome, errors.get(vat_number) or errors.get(None)))
+        else:
+            results.append((outcome, CompanySerializer(companies[vat_number]).data))
+    return results
+
+
+class CompanyWriteBatcher:
+    """
+    Raccoglie le aziende da salvare inviate dalle richieste concorrenti e le
+    scrive a blocchi (al massimo COMPANY_ASYNC_WRITE_BATCH_SIZE righe) in una
+    sezione sync_to_async, dopo un'attesa di COMPANY_ASYNC_WRITE_DELAY secondi
+    che permette ad altre richieste di aggiungersi al blocco.
+    """
+
+    def __init__(self, batch_size=None, delay=None):
+        self.batch_size = batch_size or _setting('COMPANY_ASYNC_WRITE_BATCH_SIZE', 100)
+        self.delay = _setting('COMPANY_ASYNC_WRITE_DELAY', 0.005) if delay is None else delay
+        self.pending = []
+        self._task = None
+
+    async def save(self, company_info):
+        """
+        Salva un'azienda; restituisce (esito, dati) come save_companies.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((company_info, future))
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._flush())
+        return await future
+
+    async def _flush(self):
+        try:
+            while self.pending:
+                await asyncio.sleep(self.delay)
+                batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+                try:
+                    results = await sync_to_async(save_companies)([row for row, _ in batch])
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for (_, future), result in zip(batch, results):
+                        # La richiesta può essere stata annullata nel frattempo
+                        if not future.done():
+                            future.set_result(result)
+        finally:
+            self._task = None
+
+
+def get_batcher():
+    """
+    Batcher delle scritture dell'event loop corrente.
+    """
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        batcher = _batchers[loop] = CompanyWriteBatcher()
+    return batcher
+
+
+async def asave_company_data(vat_number, company_data):
+    """
+    Salva i dati di un'azienda ricevuti dal servizio esterno tramite il batcher.
+    """
+    # La partita IVA richiesta è la chiave di ricerca: prevale su quella restituita
+    return await get_batcher().save(dict(company_data_to_company_info(company_data), vat_number=vat_number))
@@ -0,0 +1,129 @@
+"""
+Versioni asincrone delle azioni che chiamano i servizi esterni, da servire via
+ASGI (test_pycharm_ai/asgi.py) sotto /api/async/companies/.
+
+Stessi parametri e stesse risposte delle azioni di CompanyViewSet, ma
+l'attesa del servizio esterno non occupa un thread: le chiamate usano il
+client condiviso di company_info.async_external e le operazioni sul database
+girano in sezioni sync_to_async. Le azioni di CompanyViewSet restano
+invariate e sono quelle da usare via WSGI.
+"""
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed, JsonResponse
+from rest_framework import status
+from rest_framework.reverse import reverse
+
+from . import lookup_cache
+from .async_external import HTTPError, afetch_company_data, alookup_companies, asave_company_data
+from .external import CompanyNotFound, parse_vat_numbers
+from .jobs import SyncJobConflict, start_contractors_sync
+from .serializers import SyncJobSerializer
+
+
+def async_action(*methods):
+    """
+    Limita la view ai metodi `methods` e la esenta dal CSRF, come le azioni
+    DRF. Sostituisce require_http_methods e csrf_exempt, che in Django 4.2
+    non supportano le view asincrone.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            return await view(request, *args, **kwargs)
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+def _start_contractors_sync(request):
+    try:
+        job = start_contractors_sync()
+    except SyncJobConflict as e:
+        return JsonResponse(
+            {"error": "Sincronizzazione già in corso", "job": SyncJobSerializer(e.job).data if e.job else None},
+            status=status.HTTP_409_CONFLICT
+        )
+    response = JsonResponse(SyncJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+    response['Location'] = reverse('sync-job-detail', args=[job.pk], request=request)
+    return response
+
+
+@async_action('GET')
+async def fetch_contractors(request):
+    """
+    Avvia la sincronizzazione dei contractor (vedi CompanyViewSet.fetch_contractors).
+    """
+    return await sync_to_async(_start_contractors_sync)(request)
+
+
+@async_action('POST')
+async def fetch_from_external(request):
+    """
+    Ricerca singola sul servizio esterno (vedi CompanyViewSet.fetch_from_external).
+    Il salvataggio viene raggruppato con quello delle richieste concorrenti.
+    """
+    data = _request_data(request)
+    vat_number = data.get('vat_number') if data is not None else None
+    # Forma canonica, come in CompanyViewSet.fetch_from_external
+    vat_number = lookup_cache.normalize_vat_number(vat_number) if vat_number else None
+    if not vat_number:
+        return JsonResponse(
+            {"error": "È necessario fornire una partita IVA"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        company_data = await afetch_company_data(vat_number)
+        outcome, result = await asave_company_data(vat_number, company_data)
+    except CompanyNotFound:
+        return JsonResponse(
+            {"error": f"Nessuna azienda trovata per la partita IVA {vat_number}"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except HTTPError as e:
+        return JsonResponse(
+            {"error": f"Errore nella comunicazione con il servizio esterno: {str(e)}"},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    except Exception as e:
+        return JsonResponse(
+            {"error": f"Errore durante l'elaborazione: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+    if outcome == 'failed':
+        return JsonResponse(
+            {"error": f"Errore durante l'elaborazione: {result}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    status_code = status.HTTP_201_CREATED if outcome == 'created' else status.HTTP_200_OK
+    return JsonResponse(result, status=status_code)
+
+
+@async_action('POST')
+async def fetch_from_external_batch(request):
+    """
+    Ricerca massiva sul servizio esterno (vedi CompanyViewSet.fetch_from_external_batch),
+    con le ricerche eseguite in modo concorrente sull'event loop.
+    """
+    data = _request_data(request)
+    try:
+        vat_numbers = parse_vat_numbers(data.get('vat_numbers') if data is not None else None)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return JsonResponse(await alookup_companies(vat_numbers), status=status.HTTP_200_OK)
@@ -0,0 +1,15 @@
+"""
+Benchmark riproducibili delle letture e delle scritture principali.
+
+- data: generatore di dati sintetici (aziende, valutazioni, tipi e voci di
+  checklist) con distribuzioni realistiche di partite IVA, codici Ateco,
+  regioni e fatturati, a partire da un seed;
+- stub: server HTTP locale al posto dei servizi esterni (contractor e
+  informazioni aziendali);
+- scenarios: gli scenari cronometrati;
+- runner: esecuzione degli scenari, risultati in JSON e confronto con un
+  risultato precedente.
+
+Si eseguono con `manage.py run_benchmarks`, su un database di test creato e
+distrutto per l'occasione.
+"""
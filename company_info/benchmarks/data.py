@@ -0,0 +1,154 @@
+"""
+Dati sintetici per i benchmark. Con lo stesso seed e gli stessi conteggi il
+contenuto generato è identico (a meno di chiavi primarie e date di creazione).
+"""
+import math
+import random
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.db import transaction
+
+from ..models import ChecklistKind, Company, UnderwritingAssessment, UnderwritingChecklist
+from ..portfolio import ATECO_SECTIONS
+
+# Pesi approssimati sul numero di imprese attive in Italia
+ATECO_SECTION_WEIGHTS = {
+    'G': 25, 'C': 11, 'F': 13, 'I': 8, 'M': 8, 'L': 5, 'S': 5, 'N': 4, 'H': 3, 'A': 7,
+    'Q': 3, 'J': 2, 'K': 2, 'R': 2, 'P': 1, 'E': 0.5, 'D': 0.5, 'B': 0.2,
+}
+REGION_WEIGHTS = {
+    'Lombardia': 16, 'Lazio': 10, 'Campania': 10, 'Veneto': 8, 'Sicilia': 8, 'Emilia-Romagna': 8,
+    'Piemonte': 7, 'Puglia': 7, 'Toscana': 7, 'Calabria': 3, 'Sardegna': 3, 'Liguria': 3,
+    'Marche': 3, 'Abruzzo': 2.5, 'Friuli-Venezia Giulia': 1.8, 'Trentino-Alto Adige': 1.8,
+    'Umbria': 1.5, 'Basilicata': 1, 'Molise': 0.6, "Valle d'Aosta": 0.2,
+}
+CITIES = {
+    'Lombardia': ['Milano', 'Brescia', 'Bergamo'], 'Lazio': ['Roma', 'Latina'], 'Campania': ['Napoli', 'Salerno'],
+    'Veneto': ['Venezia', 'Verona', 'Padova'], 'Sicilia': ['Palermo', 'Catania'],
+    'Emilia-Romagna': ['Bologna', 'Forlì', 'Modena'], 'Piemonte': ['Torino', 'Cuneo'],
+    'Puglia': ['Bari', 'Lecce'], 'Toscana': ['Firenze', 'Pisa'],
+}
+LEGAL_FORM_WEIGHTS = {
+    'SRL': 45, 'DITTA_IND': 25, 'SNC': 8, 'SAS': 7, 'SRLS': 7, 'SPA': 3, 'COOP': 3, 'ALTRO': 2,
+}
+SEASONALITY_WEIGHTS = {'NONE': 70, 'SUMMER': 15, 'WINTER': 5, 'HOLIDAY': 8, 'CUSTOM': 2}
+UNDERWRITING_YEARS = (2021, 2022, 2023, 2024, 2025)
+
+
+@dataclass
+class DatasetSize:
+    companies: int = 2000
+    assessments: int = 3000
+    kinds: int = 20
+    checklist_items: int = 10  # voci per valutazione
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def _choices(rng, weights):
+    population = list(weights)
+    cumulative = list(accumulate(weights.values()))
+    return lambda: rng.choices(population, cum_weights=cumulative)[0]
+
+
+def vat_check_digit(digits):
+    """
+    Cifra di controllo della partita IVA (algoritmo di Luhn sulle prime 10 cifre).
+    """
+    total = 0
+    for position, digit in enumerate(int(char) for char in digits):
+        if position % 2:
+            digit *= 2
+            digit -= 9 if digit > 9 else 0
+        total += digit
+    return str((10 - total % 10) % 10)
+
+
+def italian_vat_number(rng, serial):
+    """
+    Partita IVA valida: matricola (dal progressivo, quindi univoca), codice
+    dell'ufficio provinciale e cifra di controllo.
+    """
+    office = rng.randint(1, 100)
+    digits = f'{serial:07d}{office:03d}'
+    return digits + vat_check_digit(digits)
+
+
+def ateco_code(rng, section):
+    first, last = ATECO_SECTIONS[section]
+    return f'{rng.randint(first, last):02d}.{rng.randint(1, 99):02d}'
+
+
+def generate_companies(rng, count):
+    section = _choices(rng, ATECO_SECTION_WEIGHTS)
+    region = _choices(rng, REGION_WEIGHTS)
+    legal_form = _choices(rng, LEGAL_FORM_WEIGHTS)
+    seasonality = _choices(rng, SEASONALITY_WEIGHTS)
+    companies = []
+    for serial in range(1, count + 1):
+        company_region = region()
+        code = ateco_code(rng, section())
+        # Fatturato log-normale: mediana di circa 400.000 €
+        turnover = Decimal(round(math.exp(rng.gauss(12.9, 1.6)), 2)).quantize(Decimal('0.01'))
+        companies.append(Company(
+            vat_number=italian_vat_number(rng, serial),
+            legal_form=legal_form(),
+            ateco_code=code,
+            activity=f'Attività {code}',
+            activity_description=f'Impresa del settore Ateco {code} in {company_region}',
+            annual_turnover=min(turnover, Decimal('9999999999999.99')),
+            employees=max(1, int(rng.lognormvariate(1.5, 1.2))),
+            seasonality=seasonality(),
+            city=rng.choice(CITIES.get(company_region, ['Capoluogo'])),
+            region=company_region,
+            postal_code=f'{rng.randint(10, 98)}{rng.randint(0, 999):03d}',
+            email=f'info{serial}@example.it',
+        ))
+    return companies
+
+
+@transaction.atomic
+def generate_dataset(size, seed=0):
+    """
+    Crea i dati del benchmark e restituisce i conteggi delle righe create.
+    """
+    rng = random.Random(seed)
+    companies = Company.objects.bulk_create(generate_companies(rng, size.companies), batch_size=1000)
+    kinds = ChecklistKind.objects.bulk_create([
+        ChecklistKind(name=f'Verifica {index + 1}', rating=rng.randint(0, 10)) for index in range(size.kinds)
+    ])
+
+    pairs = [(company, year) for company in companies for year in UNDERWRITING_YEARS]
+    pairs = rng.sample(pairs, min(size.assessments, len(pairs)))
+    # Esiti delle trattative (circa una su tre vinta) da un generatore a parte,
+    # così il resto dei dati non cambia
+    outcomes = random.Random(f'{seed}-outcomes')
+    assessments = UnderwritingAssessment.objects.bulk_create([
+        UnderwritingAssessment(
+            company=company,
+            underwriting_year=year,
+            customer_relation=rng.choice(['', 'Nuovo', 'Esistente']),
+            broker_relation=rng.choice(['', 'Diretto', 'Broker']),
+            conversion_time=timedelta(days=outcomes.randint(5, 120)) if outcomes.random() < 0.35 else None,
+        )
+        for company, year in pairs
+    ], batch_size=1000)
+
+    items_per_assessment = min(size.checklist_items, len(kinds))
+    items = []
+    for assessment in assessments:
+        for kind in rng.sample(kinds, items_per_assessment):
+            items.append(UnderwritingChecklist(
+                assessment=assessment, kind=kind, value=rng.randint(0, 10), is_compliant=rng.random() > 0.15,
+            ))
+    UnderwritingChecklist.objects.bulk_create(items, batch_size=2000)
+    return {
+        'companies': len(companies),
+        'assessments': len(assessments),
+        'kinds': len(kinds),
+        'checklist_items': len(items),
+    }
@@ -0,0 +1,113 @@
+"""
+Test di carico delle ricerche singole sul servizio esterno: confronta
+l'azione sincrona di CompanyViewSet (un thread occupato per richiesta, come
+un server WSGI con `workers` thread) con la view asincrona di
+company_info.async_views (fino a `concurrency` richieste in volo su un unico
+event loop, come un server ASGI).
+
+Le richieste passano dall'handler completo di Django (client di test) e
+arrivano allo stub locale del servizio esterno, con una latenza per risposta
+che simula la rete. Le partite IVA sono diverse per ogni modalità e la cache
+delle ricerche viene svuotata prima di ciascuna, così ogni richiesta chiama
+il servizio e crea un'azienda.
+
+Le risposte sono contate per stato: con SQLite le scritture concorrenti della
+modalità sincrona (una transazione per thread) possono fallire con "database
+is locked", mentre quelle asincrone passano da un unico thread a blocchi. Per
+confrontare i soli tempi conviene un database come PostgreSQL.
+"""
+import asyncio
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import caches
+from django.test import AsyncClient, Client, override_settings
+
+from ..async_external import httpx
+from .data import italian_vat_number
+from .runner import metadata
+from .stub import UpstreamStub
+
+SYNC_PATH = '/api/companies/fetch_from_external/'
+ASYNC_PATH = '/api/async/companies/fetch_from_external/'
+
+
+def summarize(latencies, statuses, wall_time):
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    p95_index = max(0, round(0.95 * len(latencies_ms)) - 1)
+    counts = {}
+    for status_code in statuses:
+        counts[str(status_code)] = counts.get(str(status_code), 0) + 1
+    return {
+        'requests': len(latencies_ms),
+        'wall_ms': round(wall_time * 1000, 3),
+        'requests_per_second': round(len(latencies_ms) / wall_time, 1) if wall_time else None,
+        'median_ms': round(statistics.median(latencies_ms), 3),
+        'p95_ms': round(latencies_ms[p95_index], 3),
+        'max_ms': round(latencies_ms[-1], 3),
+        'statuses': counts,
+    }
+
+
+def run_sync(vat_numbers, workers):
+    def post(vat_number):
+        started = time.perf_counter()
+        response = Client().post(SYNC_PATH, {'vat_number': vat_number}, content_type='application/json')
+        return response.status_code, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(post, vat_numbers))
+    wall_time = time.perf_counter() - started
+    return summarize([elapsed for _, elapsed in results], [code for code, _ in results], wall_time)
+
+
+def run_async(vat_numbers, concurrency):
+    async def run():
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def post(vat_number):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(ASYNC_PATH, {'vat_number': vat_number}, content_type='application/json')
+                return response.status_code, time.perf_counter() - started
+
+        return await asyncio.gather(*(post(vat_number) for vat_number in vat_numbers))
+
+    started = time.perf_counter()
+    results = asyncio.run(run())
+    wall_time = time.perf_counter() - started
+    return summarize([elapsed for _, elapsed in results], [code for code, _ in results], wall_time)
+
+
+def run_load_test(requests=500, latency=0.05, workers=16, concurrency=200, modes=('sync', 'async'), seed=0):
+    """
+    Esegue il test di carico sul database corrente nelle modalità `modes`
+    ('sync', 'async') e restituisce i risultati per modalità.
+    """
+    if 'async' in modes and httpx is None:
+        raise RuntimeError("La modalità async richiede il pacchetto httpx")
+    rng = random.Random(seed)
+    results = {}
+    with UpstreamStub(contractors=0, latency=latency, seed=seed) as stub, override_settings(
+        DEBUG=False,
+        COMPANY_RESPONSE_CACHE=None,
+        COMPANY_INFO_ASYNC_MAX_CONCURRENCY=concurrency,
+        **stub.settings()
+    ):
+        for index, mode in enumerate(modes):
+            vat_numbers = [italian_vat_number(rng, 8_000_000 + index * requests + serial) for serial in range(requests)]
+            caches['company_lookups'].clear()
+            if mode == 'sync':
+                results[mode] = run_sync(vat_numbers, workers)
+            else:
+                results[mode] = run_async(vat_numbers, concurrency)
+    return {
+        'metadata': metadata(),
+        'parameters': {'requests': requests, 'latency': latency, 'workers': workers, 'concurrency': concurrency,
+                       'seed': seed},
+        'modes': results,
+    }
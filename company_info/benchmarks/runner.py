@@ -0,0 +1,131 @@
+"""
+Esecuzione degli scenari e confronto tra risultati.
+
+Il risultato è un dizionario serializzabile in JSON con i metadati
+dell'esecuzione (commit, versioni, database), i conteggi dei dati generati e,
+per scenario, i tempi in millisecondi (min, mediana, media, p95) su `repeat`
+ripetizioni, le operazioni al secondo sulla mediana e il numero di query di
+una ripetizione.
+"""
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+
+from ..fast_serialization import orjson
+from .data import DatasetSize, generate_dataset
+from .scenarios import SCENARIOS, BenchmarkContext
+from .stub import UpstreamStub
+
+DEFAULT_THRESHOLD = 0.10
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata():
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'orjson': orjson is not None,
+        'machine': platform.machine(),
+    }
+
+
+def summarize(timings, operations, queries):
+    timings_ms = sorted(timing * 1000 for timing in timings)
+    median = statistics.median(timings_ms)
+    p95_index = max(0, round(0.95 * len(timings_ms)) - 1)
+    return {
+        'repeat': len(timings_ms),
+        'operations': operations,
+        'min_ms': round(timings_ms[0], 3),
+        'median_ms': round(median, 3),
+        'mean_ms': round(statistics.fmean(timings_ms), 3),
+        'p95_ms': round(timings_ms[p95_index], 3),
+        'ops_per_second': round(operations / median * 1000, 1) if median else None,
+        'queries': queries,
+    }
+
+
+def run_scenario(scenario, context, repeat):
+    # Una ripetizione iniziale non cronometrata scalda le cache e conta le query
+    scenario.prepare(context)
+    queries = []
+    # execute_wrapper e non CaptureQueriesContext: il client di test azzera
+    # connection.queries all'inizio di ogni richiesta
+    with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+        scenario.run(context)
+    timings = []
+    for _ in range(repeat):
+        scenario.prepare(context)
+        started = time.perf_counter()
+        scenario.run(context)
+        timings.append(time.perf_counter() - started)
+    return summarize(timings, scenario.operations, len(queries))
+
+
+def run_benchmarks(size=None, names=None, repeat=5, seed=0, contractors=1000, latency=0.0, log=None):
+    """
+    Genera i dati, avvia lo stub ed esegue gli scenari `names` (tutti se None)
+    sul database corrente. Restituisce il risultato (vedi modulo).
+    """
+    size = size or DatasetSize()
+    unknown = set(names or ()) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Scenari sconosciuti: {', '.join(sorted(unknown))}")
+    scenarios = [SCENARIOS[name] for name in (names or SCENARIOS)]
+
+    with UpstreamStub(contractors=contractors, latency=latency, seed=seed) as stub, override_settings(
+        DEBUG=False,
+        SYNC_JOB_RUNNER='db',
+        RISK_SCORE_RECOMPUTE_RUNNER='command',
+        COMPANY_RESPONSE_CACHE=None,
+        **stub.settings()
+    ):
+        dataset = generate_dataset(size, seed)
+        context = BenchmarkContext()
+        results = {}
+        for scenario in scenarios:
+            if log:
+                log(f"{scenario.name}: {scenario.description}")
+            results[scenario.name] = run_scenario(scenario, context, repeat)
+
+    return {
+        'metadata': metadata(),
+        'parameters': {**size.as_dict(), 'repeat': repeat, 'seed': seed, 'contractors': contractors,
+                       'latency': latency},
+        'dataset': dataset,
+        'scenarios': results,
+    }
+
+
+def compare(result, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Confronto delle mediane con un risultato precedente: righe (scenario, mediana
+    precedente, mediana attuale, rapporto, regressione) per gli scenari comuni.
+    """
+    rows = []
+    for name, current in result['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous or not previous.get('median_ms'):
+            continue
+        ratio = current['median_ms'] / previous['median_ms']
+        rows.append((name, previous['median_ms'], current['median_ms'], ratio, ratio > 1 + threshold))
+    return rows
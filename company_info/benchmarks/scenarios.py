@@ -0,0 +1,180 @@
+"""
+Scenari cronometrati. Ogni scenario ha una preparazione (non cronometrata,
+eseguita prima di ogni ripetizione) e un'esecuzione di `operations` operazioni.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import Client
+
+from .. import scoring, similarity
+from ..jobs import claim_next_job, run_sync_job
+from ..models import Company, UnderwritingAssessment, UnderwritingChecklist
+from .data import UNDERWRITING_YEARS
+
+SCENARIOS = {}
+
+
+class Scenario:
+
+    def __init__(self, name, run, operations=1, prepare=None, description=''):
+        self.name = name
+        self.run = run
+        self.operations = operations
+        self.prepare = prepare or (lambda context: None)
+        self.description = description
+
+
+def scenario(name, operations=1, prepare=None):
+    def register(function):
+        SCENARIOS[name] = Scenario(name, function, operations, prepare, (function.__doc__ or '').strip())
+        return function
+    return register
+
+
+class BenchmarkContext:
+    """
+    Client HTTP (con un superutente per l'admin) e campioni di chiavi dei dati generati.
+    """
+
+    def __init__(self, sample_size=200):
+        self.client = Client()
+        user = get_user_model().objects.create_superuser('benchmark', 'benchmark@example.it', 'benchmark')
+        self.client.force_login(user)
+        self.company_ids = list(Company.objects.order_by('vat_number').values_list('pk', flat=True)[:sample_size])
+        self.vat_numbers = list(Company.objects.order_by('vat_number').values_list('vat_number', flat=True)[:sample_size])
+
+    def get(self, path, data=None):
+        response = self.client.get(path, data)
+        if response.status_code not in (200, 202):
+            raise AssertionError(f"GET {path}: {response.status_code}")
+        return response
+
+    def post(self, path, data):
+        response = self.client.post(path, data, content_type='application/json')
+        if response.status_code not in (200, 201, 404):
+            raise AssertionError(f"POST {path}: {response.status_code}")
+        return response
+
+
+# Letture API
+
+@scenario('list', operations=20)
+def list_companies(context):
+    """Prima pagina della lista aziende (50 righe)."""
+    for _ in range(20):
+        context.get('/api/companies/')
+
+
+@scenario('list_filtered', operations=20)
+def list_filtered(context):
+    """Lista filtrata per regione, forma giuridica e fatturato."""
+    for _ in range(20):
+        context.get('/api/companies/', {'region': 'Lombardia,Lazio', 'legal_form': 'SRL', 'turnover_min': '100000'})
+
+
+@scenario('list_search', operations=20)
+def list_search(context):
+    """Ricerca full-text nella lista aziende."""
+    for _ in range(20):
+        context.get('/api/companies/', {'search': 'settore Ateco Lombardia'})
+
+
+@scenario('list_deep', operations=10)
+def list_deep(context):
+    """Dieci pagine consecutive seguendo i cursori."""
+    url = '/api/companies/'
+    for _ in range(10):
+        url = context.get(url).json()['next'] or '/api/companies/'
+
+
+@scenario('retrieve', operations=100)
+def retrieve(context):
+    """Dettaglio di 100 aziende diverse."""
+    for pk in context.company_ids[:100]:
+        context.get(f'/api/companies/{pk}/')
+
+
+# Servizi esterni (stub locale)
+
+@scenario('fetch_contractors')
+def fetch_contractors(context):
+    """Sincronizzazione completa del feed dei contractor (richiesta e job)."""
+    context.get('/api/companies/fetch_contractors/')
+    run_sync_job(claim_next_job())
+
+
+def _clear_lookups(context):
+    caches['company_lookups'].clear()
+
+
+@scenario('fetch_from_external', operations=20, prepare=_clear_lookups)
+def fetch_from_external(context):
+    """20 ricerche singole senza cache."""
+    for vat_number in context.vat_numbers[:20]:
+        context.post('/api/companies/fetch_from_external/', {'vat_number': vat_number})
+
+
+@scenario('fetch_from_external_batch', operations=200, prepare=_clear_lookups)
+def fetch_from_external_batch(context):
+    """Ricerca in blocco di 200 partite IVA senza cache."""
+    context.post('/api/companies/fetch_from_external_batch/', {'vat_numbers': context.vat_numbers})
+
+
+# Admin
+
+@scenario('admin_changelists', operations=3)
+def admin_changelists(context):
+    """Changelist di aziende, valutazioni e voci di checklist."""
+    for model in ('company', 'underwritingassessment', 'underwritingchecklist'):
+        context.get(f'/admin/company_info/{model}/')
+
+
+# Scoring
+
+def _clear_scores(context):
+    UnderwritingAssessment.objects.update(risk_score=None)
+
+
+@scenario('scoring_full', prepare=_clear_scores)
+def scoring_full(context):
+    """Ricalcolo di tutti i risk_score (tutti da scrivere)."""
+    scoring.recompute_risk_scores()
+
+
+def _touch_checklists(context):
+    # Circa un decimo delle valutazioni diventa da ricalcolare
+    assessments = UnderwritingAssessment.objects.order_by('uuid').values('pk')
+    count = assessments.count()
+    UnderwritingChecklist.objects.filter(assessment__in=assessments[:max(1, count // 10)]).update(value=5)
+
+
+@scenario('scoring_dirty', prepare=_touch_checklists)
+def scoring_dirty(context):
+    """Ricalcolo incrementale dopo la modifica di un decimo delle checklist."""
+    scoring.recompute_dirty()
+
+
+# Trattative simili
+
+def _load_similarity_index(context):
+    context.similarity_index = similarity.SimilarityIndex.load()
+
+
+@scenario('similar_nearest', operations=100, prepare=_load_similarity_index)
+def similar_nearest(context):
+    """100 ricerche delle 20 aziende più simili sull'indice in memoria."""
+    index = context.similarity_index
+    for pk in context.company_ids[:100]:
+        index.nearest(index.features[pk], 20, exclude={pk})
+
+
+def _clear_similar_deals(context):
+    UnderwritingAssessment.objects.filter(underwriting_year=UNDERWRITING_YEARS[-1]).update(
+        similar_deals_won=None, average_deal_size=None, win_probability=None,
+    )
+
+
+@scenario('similar_deals', prepare=_clear_similar_deals)
+def similar_deals(context):
+    """Trattative simili per tutte le valutazioni di un anno (tutte da scrivere)."""
+    similarity.fill_similar_deals(UNDERWRITING_YEARS[-1])
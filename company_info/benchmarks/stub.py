@@ -0,0 +1,137 @@
+"""
+Server HTTP locale che sostituisce i servizi esterni durante i benchmark:
+- GET /contractors/?page=N: feed paginato dei contractor (PAGE_SIZE per pagina);
+- GET /company-info?vat_number=...: dati dell'azienda, 404 per le partite IVA
+  che iniziano con '404', con ETag e risposte 304 alle richieste condizionali.
+Una latenza fissa per risposta simula la rete.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from .data import REGION_WEIGHTS, ateco_code, italian_vat_number
+
+PAGE_SIZE = 500
+
+
+def generate_contractors(count, seed=0):
+    """
+    Contractor del feed, nel formato del servizio esterno.
+    """
+    rng = random.Random(seed)
+    regions = list(REGION_WEIGHTS)
+    contractors = []
+    for serial in range(1, count + 1):
+        code = ateco_code(rng, rng.choice('CFGIM'))
+        contractors.append({
+            # Matricole oltre quelle dei dati sintetici: aziende nuove
+            'vat_number': italian_vat_number(rng, 5_000_000 + serial),
+            'activity': code,
+            'activity_full_description': f'Contractor del settore Ateco {code}',
+            'yearly_revenues': f'{rng.randint(50_000, 20_000_000)}.00',
+            'address': f'Via Roma {serial}',
+            'city': 'Milano',
+            'postcode': '20100',
+            'province': rng.choice(regions),
+            'country': 'Italia',
+        })
+    return contractors
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if url.path.rstrip('/') == '/contractors':
+            return self.contractors(int(query.get('page', ['1'])[0]))
+        if url.path.rstrip('/') == '/company-info':
+            return self.company_info(query['vat_number'][0])
+        self.send_json(404, {'detail': 'Not found'})
+
+    def contractors(self, page):
+        start = (page - 1) * PAGE_SIZE
+        contractors = self.server.contractors
+        has_next = start + PAGE_SIZE < len(contractors)
+        self.send_json(200, {
+            'next': f'{self.server.base_url}/contractors/?page={page + 1}' if has_next else None,
+            'results': contractors[start:start + PAGE_SIZE],
+        })
+
+    def company_info(self, vat_number):
+        if vat_number.startswith('404'):
+            return self.send_json(404, {'detail': 'Not found'})
+        etag = f'"{vat_number}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            return self.end_headers()
+        # Record completo: la ricerca singola salva tutti i campi ricevuti
+        self.send_json(200, {
+            'vat_number': vat_number,
+            'legal_form': 'SRL',
+            'ateco_code': '47.11',
+            'activity': 'Commercio al dettaglio',
+            'activity_description': 'Commercio al dettaglio in esercizi non specializzati',
+            'annual_turnover': '1250000.00',
+            'employees': 12,
+            'seasonality': 'NONE',
+            'address': 'Via Roma 1',
+            'city': 'Milano',
+            'postal_code': '20100',
+            'region': 'Lombardia',
+            'country': 'Italia',
+            'email': 'info@example.it',
+            'phone': '02 1234567',
+            'contact_person': 'Mario Rossi',
+        }, etag=etag)
+
+    def send_json(self, status_code, data, etag=None):
+        body = json.dumps(data).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class UpstreamStub:
+    """
+    Avvia lo stub su una porta libera; `settings()` restituisce le impostazioni
+    che vi puntano i client dei servizi esterni.
+    """
+
+    def __init__(self, contractors=1000, latency=0.0, seed=0):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.latency = latency
+        self.server.contractors = generate_contractors(contractors, seed)
+        self.server.base_url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def settings(self):
+        return {
+            'CONTRACTORS_SERVICE_URL': f'{self.server.base_url}/contractors/',
+            'CONTRACTORS_SERVICE_AUTHORIZATION': '',
+            'COMPANY_INFO_SERVICE_URL': f'{self.server.base_url}/company-info',
+            'COMPANY_INFO_SERVICE_BACKOFF': 0,
+        }
@@ -0,0 +1,185 @@
+"""
+Registro in memoria dei tipi di checklist (ChecklistKind).
+
+La tabella è piccola e cambia di rado: il processo ne tiene una copia
+(uuid, nome, rating) da cui __str__ delle voci, serializer, admin e
+validazione leggono i tipi senza query. Lo scoring invece legge il rating con
+un join in SQL, sempre esatto: una copia in ritardo di qualche secondo va bene
+per mostrare un nome, non per scrivere un risk_score.
+
+Invalidazione:
+- nel processo che scrive, la copia viene scartata subito a ogni modifica
+  (save/delete e operazioni massive, vedi i QuerySet in company_info.models)
+  e di nuovo al commit;
+- negli altri processi tramite una versione nella cache condivisa
+  (CHECKLIST_KIND_CACHE), incrementata al commit: ogni processo la confronta
+  con quella della propria copia al più ogni CHECKLIST_KIND_CACHE_CHECK_INTERVAL
+  secondi, oppure subito con `check=True`. Con una cache locale al processo
+  (locmem, dummy) la versione non raggiunge gli altri processi: la copia
+  viene allora ricaricata a ogni intervallo, e `manage.py check --deploy`
+  segnala la configurazione.
+Un uuid non presente nella copia provoca una ricarica, così un tipo appena
+creato in un altro processo è subito disponibile.
+
+Una copia caricata dentro una transazione con modifiche ai tipi non ancora
+confermate è provvisoria (la transazione potrebbe essere annullata): non ha
+versione e viene ricaricata al controllo successivo.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from uuid import UUID
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+VERSION_KEY = 'checklist_kinds:version'
+DEFAULT_CHECK_INTERVAL = 5
+# Backend di cache non condivisi tra processi
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@dataclass(frozen=True)
+class Kind:
+    uuid: UUID
+    name: str
+    rating: int
+
+    def __str__(self):
+        return self.name
+
+
+def get_cache():
+    return caches[get_cache_alias()]
+
+
+def get_cache_alias():
+    return getattr(settings, 'CHECKLIST_KIND_CACHE', 'default')
+
+
+def is_shared_cache():
+    return settings.CACHES.get(get_cache_alias(), {}).get('BACKEND') not in LOCAL_CACHE_BACKENDS
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_cache(app_configs, **kwargs):
+    if is_shared_cache():
+        return []
+    return [checks.Warning(
+        f"CHECKLIST_KIND_CACHE ('{get_cache_alias()}') non è condivisa tra i processi",
+        hint="Usare una cache condivisa (es. Redis o Memcached): altrimenti ogni processo "
+             "ricarica i tipi di checklist a ogni CHECKLIST_KIND_CACHE_CHECK_INTERVAL.",
+        id='company_info.W001',
+    )]
+
+
+def get_version():
+    # Come in company_info.conditional: la versione iniziale dipende dall'ora
+    return get_cache().get_or_set(VERSION_KEY, time.time_ns(), None)
+
+
+class KindRegistry:
+
+    def __init__(self):
+        self._kinds = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def all(self, check=False):
+        """
+        Dizionario uuid -> Kind di tutti i tipi.
+        """
+        kinds = self._kinds
+        interval = getattr(settings, 'CHECKLIST_KIND_CACHE_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL)
+        if kinds is not None and (check or time.monotonic() - self._checked_at >= interval):
+            # Con una cache locale la versione non vede le modifiche degli altri processi
+            if not is_shared_cache() or get_version() != self._version:
+                kinds = None
+            self._checked_at = time.monotonic()
+        if kinds is None:
+            kinds = self._load()
+        return kinds
+
+    def get(self, pk):
+        """
+        Tipo con chiave `pk`, oppure None se non esiste.
+        """
+        kind = self.all().get(pk)
+        if kind is None:
+            kind = self._load().get(pk)
+        return kind
+
+    def invalidate(self):
+        self._kinds = None
+
+    def _load(self):
+        from .models import ChecklistKind
+
+        with self._lock:
+            # La versione è letta prima della query: una modifica a cavallo
+            # della lettura viene rilevata al controllo successivo
+            version = get_version()
+            # Sempre dal primario: una replica in ritardo lascerebbe la copia
+            # indietro fino alla modifica successiva
+            kinds = {
+                pk: Kind(pk, name, rating)
+                for pk, name, rating in ChecklistKind.objects.using(DEFAULT_DB_ALIAS).order_by().values_list(
+                    'uuid', 'name', 'rating',
+                )
+            }
+            self._kinds = kinds
+            self._version = None if _has_uncommitted_changes() else version
+            self._checked_at = time.monotonic()
+        return kinds
+
+
+REGISTRY = KindRegistry()
+
+
+def get_kind(pk):
+    return REGISTRY.get(pk)
+
+
+def get_kinds(check=False):
+    return REGISTRY.all(check)
+
+
+# Modifiche ai tipi in attesa del commit nella transazione del thread corrente
+_uncommitted = threading.local()
+
+
+def _has_uncommitted_changes():
+    # Fuori da una transazione le modifiche sono state confermate (il callback
+    # ha azzerato il contrassegno) oppure annullate
+    return getattr(_uncommitted, 'changed', False) and connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+def _committed():
+    _uncommitted.changed = False
+    _bump_version()
+
+
+def _bump_version():
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+    REGISTRY.invalidate()
+
+
+def kinds_changed(using=None):
+    """
+    Da chiamare a ogni modifica dei tipi: scarta subito la copia del processo
+    e incrementa la versione condivisa al commit.
+    """
+    REGISTRY.invalidate()
+    if connections[using or DEFAULT_DB_ALIAS].in_atomic_block:
+        _uncommitted.changed = True
+    transaction.on_commit(_committed, using=using)
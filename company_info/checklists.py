@@ -0,0 +1,68 @@
+"""
+Invio in blocco della checklist di un assessment.
+
+La checklist inviata sostituisce quella esistente: le voci vengono confrontate
+con quelle salvate (per tipo) e applicate con un bulk_create, un bulk_update
+e un delete, in un'unica transazione. Le voci invariate non vengono riscritte.
+
+Gli invii concorrenti per lo stesso assessment sono serializzati dal lock sulla
+riga dell'assessment, preso prima di leggere le voci salvate. Sui database che
+non supportano SELECT ... FOR UPDATE (SQLite) un invio concorrente può comunque
+violare il vincolo di unicità: in quel caso viene sollevato ChecklistConflict.
+"""
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import UnderwritingAssessment, UnderwritingChecklist
+
+ITEM_FIELDS = ('value', 'is_compliant', 'notes', 'completed_by')
+
+
+class ChecklistConflict(Exception):
+    """
+    La checklist è stata modificata da un altro invio concorrente.
+    """
+
+
+def submit_checklist(assessment, items):
+    """
+    Applica la checklist `items` (dati validati da ChecklistSubmissionSerializer)
+    all'assessment. Restituisce i conteggi per esito; solleva ChecklistConflict
+    se un invio concorrente ha già creato le stesse voci.
+    """
+    try:
+        with transaction.atomic():
+            return _submit(assessment, items)
+    except IntegrityError as e:
+        raise ChecklistConflict(str(e))
+
+
+def _submit(assessment, items):
+    UnderwritingAssessment.objects.select_for_update().filter(pk=assessment.pk).values_list('pk').get()
+    existing = {item.kind_id: item for item in assessment.checklist_items.all()}
+
+    to_create, to_update = [], []
+    now = timezone.now()
+    for data in items:
+        values = {field: data[field] for field in ITEM_FIELDS if field in data}
+        item = existing.pop(data['kind'], None)
+        if item is None:
+            to_create.append(UnderwritingChecklist(assessment=assessment, kind_id=data['kind'], **values))
+        elif any(getattr(item, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(item, field, value)
+            item.updated_at = now
+            to_update.append(item)
+
+    if to_create:
+        UnderwritingChecklist.objects.bulk_create(to_create)
+    if to_update:
+        UnderwritingChecklist.objects.bulk_update(to_update, [*ITEM_FIELDS, 'updated_at'])
+    if existing:
+        UnderwritingChecklist.objects.filter(pk__in=[item.pk for item in existing.values()]).delete()
+    return {
+        'created': len(to_create),
+        'updated': len(to_update),
+        'deleted': len(existing),
+        'unchanged': len(items) - len(to_create) - len(to_update),
+    }
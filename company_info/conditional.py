@@ -0,0 +1,150 @@
+"""
+GET condizionali (ETag / Last-Modified) e cache condivisa delle risposte per le
+letture delle aziende.
+
+I validatori vengono ricavati senza serializzare nulla:
+- dettaglio: updated_at dell'azienda (una query sulla chiave primaria);
+- lista: MAX(updated_at) e COUNT(*) del queryset filtrato (il conteggio
+  intercetta le cancellazioni).
+L'ETag comprende anche l'URL completo e il formato della risposta, perché
+filtri, `?fields=` e cursore cambiano il contenuto. Se If-None-Match o
+If-Modified-Since corrispondono, la risposta è un 304 senza corpo.
+
+Con COMPANY_RESPONSE_CACHE (alias di cache, disattivata di default) le risposte
+JSON 200 già renderizzate vengono salvate nella cache condivisa, con una chiave
+che comprende una versione incrementata al commit di ogni scrittura su Company
+(vedi company_info.models): le voci precedenti non vengono più lette e scadono
+con COMPANY_RESPONSE_CACHE_TTL. La versione è letta prima delle query, per cui
+una risposta calcolata a cavallo di una scrittura finisce sotto una versione
+già superata.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+VERSION_KEY = 'company_responses:version'
+KEY_PREFIX = 'company_responses:'
+DEFAULT_TTL = 300
+CACHEABLE_FORMATS = {'json'}
+
+
+def get_cache():
+    alias = getattr(settings, 'COMPANY_RESPONSE_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def get_version(cache):
+    # La versione iniziale dipende dall'ora: se la chiave va persa (evizione,
+    # riavvio della cache) non vengono riusate versioni già viste
+    return cache.get_or_set(VERSION_KEY, time.time_ns(), None)
+
+
+def invalidate():
+    """
+    Invalida tutte le risposte in cache. Chiamata al commit delle scritture su Company.
+    """
+    cache = get_cache()
+    if cache is None:
+        return
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def _digest(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode(), usedforsecurity=False).hexdigest()
+
+
+def _variant(request):
+    return request.build_absolute_uri(), request.accepted_media_type
+
+
+def detail_validators(queryset, pk, request):
+    """
+    (etag, last_modified) dell'azienda `pk`, oppure None se non esiste.
+    """
+    try:
+        updated_at = queryset.filter(pk=pk).values_list('updated_at', flat=True).first()
+    except (TypeError, ValueError, ValidationError):
+        return None
+    if updated_at is None:
+        return None
+    return f'W/"{_digest(*_variant(request), updated_at.isoformat())}"', int(updated_at.timestamp())
+
+
+def list_validators(queryset, request):
+    """
+    (etag, last_modified) della lista filtrata; last_modified è None se la lista è vuota.
+    """
+    state = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+    last_modified = state['last_modified']
+    etag = f'W/"{_digest(*_variant(request), last_modified and last_modified.isoformat(), state["count"])}"'
+    return etag, last_modified and int(last_modified.timestamp())
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified, risposte 304 e cache condivisa per `list` e `retrieve`.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional_response(
+            request, lambda: list_validators(self.filter_queryset(self.get_queryset()), request),
+            super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self._conditional_response(
+            request, lambda: detail_validators(self.get_queryset(), lookup, request),
+            super().retrieve, *args, **kwargs
+        )
+
+    def _conditional_response(self, request, get_validators, handler, *args, **kwargs):
+        cache = get_cache()
+        if cache is not None and request.accepted_renderer.format in CACHEABLE_FORMATS:
+            self._response_cache_key = KEY_PREFIX + _digest(get_version(cache), *_variant(request))
+            entry = cache.get(self._response_cache_key)
+            if entry is not None:
+                self._validators = entry['etag'], entry['last_modified']
+                return self._not_modified(request) or HttpResponse(
+                    entry['content'], content_type=entry['content_type']
+                )
+
+        self._validators = get_validators()
+        return self._not_modified(request) or handler(request, *args, **kwargs)
+
+    def _not_modified(self, request):
+        if self._validators is None:
+            return None
+        etag, last_modified = self._validators
+        return get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, '_validators', None)
+        if validators is None or response.status_code not in (200, 304):
+            return response
+        etag, last_modified = validators
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+
+        cache_key = getattr(self, '_response_cache_key', None)
+        if cache_key is not None and response.status_code == 200 and hasattr(response, 'render'):
+            response.render()
+            get_cache().set(cache_key, {
+                'content': response.content,
+                'content_type': response['Content-Type'],
+                'etag': etag,
+                'last_modified': last_modified,
+            }, getattr(settings, 'COMPANY_RESPONSE_CACHE_TTL', DEFAULT_TTL))
+        return response
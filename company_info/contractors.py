@@ -0,0 +1,181 @@
+"""
+Lettura in streaming del feed dei contractor dal servizio esterno.
+
+Il feed può essere un unico array JSON (letto in modo incrementale, un
+elemento alla volta) oppure una risposta paginata in stile DRF
+({"next": ..., "results": [...]}), di cui si segue il link `next`.
+In entrambi i casi la memoria occupata è limitata alla pagina o al
+blocco di byte corrente, indipendentemente dalla dimensione del feed.
+"""
+import codecs
+import json
+
+import requests
+from django.conf import settings
+
+from .metrics import instrument_session
+
+DEFAULT_CONTRACTORS_SERVICE_URL = "https://staging-ayako.riskapp.it/midori/v02/negotiation/contractors/"
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\n\r'
+# Caratteri che chiudono un numero o un letterale all'interno dell'array
+_DELIMITERS = _WHITESPACE + ',]'
+
+
+class ContractorsServiceError(Exception):
+    """
+    Il servizio esterno ha risposto con uno stato diverso da 200.
+    """
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+        super().__init__(f"API returned status code {status_code}: {text}")
+
+
+def contractor_to_company_info(contractor):
+    """
+    Mappatura dei dati di un contractor del servizio esterno sui campi di Company.
+    """
+    return {
+        'vat_number': contractor.get('vat_number'),
+        'legal_form': 'ALTRO',  # Default value since it's not provided in the API
+        'ateco_code': contractor.get('activity'),  # Using activity as ateco_code
+        'activity': contractor.get('activity_full_description'),
+        'activity_description': contractor.get('activity_full_description'),
+        'annual_turnover': contractor.get('yearly_revenues'),
+        'address': contractor.get('address'),
+        'city': contractor.get('city'),
+        'postal_code': contractor.get('postcode'),
+        'region': contractor.get('province'),  # Using province as region
+        'country': contractor.get('country'),
+    }
+
+
+def iter_json_array(chunks):
+    """
+    Decodifica in modo incrementale un array JSON ricevuto a blocchi di testo,
+    restituendo un elemento alla volta.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in chunks:
+        buffer += chunk
+        pos = _skip(buffer, 0, _WHITESPACE)
+        if not started:
+            if pos == len(buffer):
+                buffer = ''
+                continue
+            if buffer[pos] != '[':
+                raise ValueError("Expected a list of contractors in the response")
+            started = True
+            pos += 1
+        while True:
+            pos = _skip(buffer, pos, _WHITESPACE + ',')
+            if pos == len(buffer):
+                break
+            if buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Elemento incompleto: servono altri dati
+                break
+            if not isinstance(item, (dict, list, str)) and (end == len(buffer) or buffer[end] not in _DELIMITERS):
+                # Un numero o un letterale è completo solo se seguito da un
+                # delimitatore: '2' in '2.5' o '1' in '1e3' sono troncati
+                break
+            yield item
+            pos = end
+        buffer = buffer[pos:]
+    raise ValueError("Unexpected end of the contractors list")
+
+
+def _skip(buffer, pos, characters):
+    while pos < len(buffer) and buffer[pos] in characters:
+        pos += 1
+    return pos
+
+
+class ContractorsFeed:
+    """
+    Feed dei contractor. `open()` esegue la prima richiesta (così gli errori del
+    servizio emergono subito); l'iterazione restituisce i contractor uno alla volta.
+    """
+
+    def __init__(self, url=None, headers=None, session=None, timeout=30):
+        self.url = url or getattr(settings, 'CONTRACTORS_SERVICE_URL', DEFAULT_CONTRACTORS_SERVICE_URL)
+        if headers is None:
+            authorization = getattr(settings, 'CONTRACTORS_SERVICE_AUTHORIZATION', '')
+            headers = {'Authorization': authorization} if authorization else {}
+        self.headers = headers
+        self.session = session or instrument_session(requests.Session())
+        self.timeout = timeout
+        self.pages = 0
+        self._response = None
+
+    def open(self):
+        if self._response is None:
+            self._response = self._get(self.url)
+        return self
+
+    def _get(self, url):
+        # Disable SSL verification warnings
+        import urllib3
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+        response = self.session.get(
+            url,
+            headers=self.headers,
+            verify=False,  # Disable SSL verification for development
+            timeout=self.timeout,
+            stream=True,
+        )
+        if response.status_code != 200:
+            text = response.text
+            response.close()
+            raise ContractorsServiceError(response.status_code, text)
+        self.pages += 1
+        return response
+
+    def __iter__(self):
+        response = self.open()._response
+        self._response = None
+        while response is not None:
+            with response:
+                chunks = _iter_text(response)
+                first = ''
+                for chunk in chunks:
+                    first += chunk
+                    if first.strip(_WHITESPACE):
+                        break
+                if first.lstrip(_WHITESPACE).startswith('{'):
+                    # Risposta paginata: la singola pagina ha dimensione limitata
+                    page = json.loads(first + ''.join(chunks))
+                    results = page.get('results')
+                    if not isinstance(results, list):
+                        raise ValueError("Expected a list of contractors in the response")
+                    yield from results
+                    next_url = page.get('next')
+                else:
+                    yield from iter_json_array(_prepend(first, chunks))
+                    next_url = None
+            response = self._get(next_url) if next_url else None
+
+
+def _iter_text(response):
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')()
+    for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def _prepend(first, chunks):
+    yield first
+    yield from chunks
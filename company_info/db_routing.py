@@ -0,0 +1,216 @@
+"""
+Instradamento delle letture su una replica in sola lettura.
+
+Le letture vanno sulla replica (alias DATABASE_REPLICA_ALIAS) solo se:
+- la view lo consente esplicitamente (ReplicaReadMixin, per le azioni di sola
+  lettura come lista, dettaglio, export e riepiloghi);
+- la richiesta non ha scritto nulla e non è "agganciata" al primario: dopo una
+  richiesta che scrive, ReplicaRoutingMiddleware imposta un cookie che per
+  DATABASE_REPLICA_PIN_SECONDS secondi manda tutte le letture al primario,
+  così un client rilegge subito quello che ha scritto nonostante il ritardo
+  di replica;
+- non c'è una transazione aperta sul primario;
+- la replica è raggiungibile: il controllo (una query su django_migrations)
+  viene ripetuto al più ogni DATABASE_REPLICA_HEALTH_CHECK_INTERVAL secondi e,
+  se fallisce, le letture tornano sul primario.
+Le scritture vanno sempre sul primario. Fuori dalle richieste (job, comandi)
+tutto resta sul primario.
+
+Lo stato della richiesta è in una contextvar, quindi vale anche nei thread
+avviati con una copia del contesto e nelle sezioni sync_to_async.
+"""
+import logging
+import threading
+import time
+from contextvars import ContextVar, copy_context
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'db_primary_pin'
+DEFAULT_PIN_SECONDS = 5
+DEFAULT_HEALTH_CHECK_INTERVAL = 10
+
+_state = ContextVar('company_info_db_routing', default=None)
+_health = {}
+_health_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class RoutingState:
+    """
+    Stato dell'instradamento di una richiesta.
+    """
+
+    def __init__(self, pinned=False):
+        # Letture su replica consentite dalla view
+        self.replica = False
+        # Scrittura recente (cookie) o in questa richiesta: tutto sul primario
+        self.pinned = pinned
+        self.wrote = False
+
+
+def get_replica_alias():
+    alias = _setting('DATABASE_REPLICA_ALIAS', None)
+    return alias if alias in settings.DATABASES else None
+
+
+def check_replica(alias, log_failure=True):
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1 FROM django_migrations LIMIT 1')
+        return True
+    except DatabaseError as e:
+        if log_failure:
+            logger.warning("Replica %s non disponibile, letture sul primario: %s", alias, e)
+        connections[alias].close()
+        return False
+
+
+def replica_available(alias):
+    """
+    Esito dell'ultimo controllo della replica, ripetuto se più vecchio dell'intervallo.
+    """
+    interval = _setting('DATABASE_REPLICA_HEALTH_CHECK_INTERVAL', DEFAULT_HEALTH_CHECK_INTERVAL)
+    healthy, checked_at = _health.get(alias, (False, None))
+    if checked_at is not None and time.monotonic() - checked_at < interval:
+        return healthy
+    # Il guasto viene registrato solo al primo controllo fallito
+    healthy = check_replica(alias, log_failure=healthy or checked_at is None)
+    with _health_lock:
+        _health[alias] = (healthy, time.monotonic())
+    return healthy
+
+
+def reset_health():
+    with _health_lock:
+        _health.clear()
+
+
+def read_alias():
+    """
+    Alias della replica se le letture correnti possono andarci, altrimenti None.
+    """
+    state = _state.get()
+    if state is None or not state.replica or state.pinned or state.wrote:
+        return None
+    alias = get_replica_alias()
+    if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return None
+    return alias if replica_available(alias) else None
+
+
+def use_replica():
+    """
+    Consente le letture su replica per il resto della richiesta corrente.
+    """
+    state = _state.get()
+    if state is not None:
+        state.replica = True
+
+
+class ReplicaRouter:
+    """
+    Router del database (DATABASE_ROUTERS): vedi modulo.
+    """
+
+    def db_for_read(self, model, **hints):
+        # None: il comportamento predefinito di Django (database dell'istanza o default)
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, get_replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # La replica riceve lo schema dal primario
+        if db == get_replica_alias():
+            return False
+        return None
+
+
+def _iter_in_context(context, iterator):
+    iterator = iter(iterator)
+    while True:
+        try:
+            yield context.run(next, iterator)
+        except StopIteration:
+            return
+
+
+class ReplicaReadMixin:
+    """
+    Mixin per i ViewSet: le azioni in `replica_actions` con metodi sicuri
+    leggono dalla replica. Le risposte in streaming vengono generate nello
+    stesso contesto, così anche le letture fatte durante lo streaming usano la replica.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and self.action in self.replica_actions:
+            use_replica()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if response.streaming and _state.get() is not None:
+            response.streaming_content = _iter_in_context(copy_context(), response.streaming_content)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Crea lo stato di instradamento di ogni richiesta e gestisce il cookie che
+    aggancia al primario le letture dopo una scrittura.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.pin(request, response, state)
+
+    async def __acall__(self, request):
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.pin(request, response, state)
+
+    def pin(self, request, response, state):
+        if get_replica_alias() is not None and (state.wrote or request.method not in SAFE_METHODS):
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=_setting('DATABASE_REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS),
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,136 @@
+"""
+Esportazione in streaming delle aziende con le relative valutazioni di underwriting.
+
+Ogni riga è un'azienda unita a una sua valutazione (LEFT JOIN: le aziende senza
+valutazioni compaiono una volta, con le colonne della valutazione vuote). Le
+righe vengono lette con `.iterator(chunk_size=...)` (cursore lato server dove
+disponibile) e scritte a blocchi, per cui la memoria resta costante e il primo
+blocco è disponibile subito, indipendentemente dal numero di righe.
+
+Formati: 'csv' e 'ndjson' (un oggetto JSON per riga, prodotto con orjson se
+disponibile), opzionalmente compressi con gzip.
+"""
+import csv
+import io
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.duration import duration_iso_string
+
+from .fast_serialization import dumps
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+DEFAULT_CHUNK_SIZE = 2000
+
+COMPANY_COLUMNS = [
+    'uuid', 'vat_number', 'legal_form', 'ateco_code', 'activity', 'activity_description',
+    'annual_turnover', 'employees', 'seasonality', 'address', 'city', 'postal_code', 'region',
+    'country', 'email', 'phone', 'contact_person', 'created_at', 'updated_at',
+]
+ASSESSMENT_COLUMNS = [
+    'uuid', 'underwriting_year', 'risk_score', 'win_probability', 'customer_relation',
+    'broker_relation', 'similar_deals_won', 'average_deal_size', 'conversion_time',
+]
+COLUMNS = COMPANY_COLUMNS + [f'assessment_{column}' for column in ASSESSMENT_COLUMNS]
+
+
+def get_chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def iter_rows(companies, chunk_size=None):
+    """
+    Righe (tuple nell'ordine di COLUMNS) delle aziende di `companies` unite alle
+    loro valutazioni, lette a blocchi.
+    """
+    lookups = COMPANY_COLUMNS + [f'underwriting_assessments__{column}' for column in ASSESSMENT_COLUMNS]
+    # Solo l'ordinamento dell'indice company_created_uuid_idx: un ordinamento sulle
+    # colonne della valutazione costringerebbe il database a ordinare tutto prima
+    # di restituire la prima riga
+    rows = companies.order_by('created_at', 'uuid').values_list(*lookups)
+    return rows.iterator(chunk_size=chunk_size or get_chunk_size())
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, timedelta):
+        return duration_iso_string(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(rows, chunk_size=None):
+    """
+    Blocchi di byte CSV (con intestazione), uno ogni `chunk_size` righe.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    # L'intestazione parte subito, prima della lettura delle righe
+    yield _drain(buffer)
+    count = 0
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        count += 1
+        if count % chunk_size == 0:
+            yield _drain(buffer)
+    chunk = _drain(buffer)
+    if chunk:
+        yield chunk
+
+
+def iter_ndjson(rows, chunk_size=None):
+    """
+    Blocchi di byte NDJSON, uno ogni `chunk_size` righe.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    lines = []
+    for row in rows:
+        lines.append(dumps(dict(zip(COLUMNS, row)), encoder))
+        if len(lines) == chunk_size:
+            lines.append(b'')
+            yield b'\n'.join(lines)
+            lines = []
+    if lines:
+        lines.append(b'')
+        yield b'\n'.join(lines)
+
+
+def _drain(buffer):
+    data = buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def iter_gzip(chunks):
+    """
+    Comprime in gzip un flusso di blocchi. Ogni blocco viene scaricato subito
+    (Z_SYNC_FLUSH), così il client riceve i dati man mano.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_companies(companies, output='csv', compress=False, chunk_size=None):
+    """
+    Flusso di byte dell'esportazione di `companies` nel formato `output`.
+    """
+    if output not in FORMATS:
+        raise ValueError(f"Formato non supportato: {output}")
+    rows = iter_rows(companies, chunk_size)
+    chunks = iter_csv(rows, chunk_size) if output == 'csv' else iter_ndjson(rows, chunk_size)
+    return iter_gzip(chunks) if compress else chunks
@@ -0,0 +1,240 @@
+"""
+Client del servizio esterno di informazioni aziendali.
+
+Tutte le chiamate condividono una requests.Session con un pool di connessioni
+keep-alive, timeout per chiamata e retry con backoff esponenziale sugli errori
+transitori. Le ricerche multiple vengono eseguite in parallelo con un numero
+limitato di worker.
+"""
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import lookup_cache
+from .metrics import instrument_session
+from .upsert import iter_upsert_companies
+
+DEFAULT_COMPANY_INFO_SERVICE_URL = "https://api.esempio-servizio.it/company-info"
+
+_session = None
+
+
+class CompanyNotFound(Exception):
+    """
+    Il servizio esterno non conosce la partita IVA richiesta.
+    """
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def get_max_workers():
+    return _setting('COMPANY_INFO_SERVICE_MAX_WORKERS', 16)
+
+
+def get_session():
+    """
+    Sessione HTTP condivisa dal processo, con pool di connessioni e retry.
+    """
+    global _session
+    if _session is None:
+        retry = Retry(
+            total=_setting('COMPANY_INFO_SERVICE_RETRIES', 3),
+            backoff_factor=_setting('COMPANY_INFO_SERVICE_BACKOFF', 0.5),
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=('GET',),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=get_max_workers(), max_retries=retry)
+        session = instrument_session(requests.Session())
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+    return _session
+
+
+@receiver(setting_changed)
+def _reset_session(setting, **kwargs):
+    global _session
+    if setting.startswith('COMPANY_INFO_SERVICE_') and _session is not None:
+        _session.close()
+        _session = None
+
+
+def company_data_to_company_info(company_data):
+    """
+    Mappatura dei dati ricevuti dal servizio esterno sui campi di Company.
+    """
+    return {
+        'vat_number': company_data.get('vat_number'),
+        'legal_form': company_data.get('legal_form'),
+        'ateco_code': company_data.get('ateco_code'),
+        'activity': company_data.get('activity'),
+        'activity_description': company_data.get('activity_description'),
+        'annual_turnover': company_data.get('annual_turnover'),
+        'employees': company_data.get('employees'),
+        'seasonality': company_data.get('seasonality'),
+        'address': company_data.get('address'),
+        'city': company_data.get('city'),
+        'postal_code': company_data.get('postal_code'),
+        'region': company_data.get('region'),
+        'country': company_data.get('country'),
+        'email': company_data.get('email'),
+        'phone': company_data.get('phone'),
+        'contact_person': company_data.get('contact_person'),
+    }
+
+
+def get_service_url():
+    return _setting('COMPANY_INFO_SERVICE_URL', DEFAULT_COMPANY_INFO_SERVICE_URL)
+
+
+def get_timeout():
+    return _setting('COMPANY_INFO_SERVICE_TIMEOUT', 10)
+
+
+def lookup_cached(vat_number):
+    """
+    Prima metà di una ricerca: restituisce (voce di cache, dati) con i dati
+    presi dalla cache se ancora validi, altrimenti (voce, None) e la chiamata
+    al servizio è a carico del chiamante. Solleva CompanyNotFound per le voci
+    negative valide.
+    """
+    entry = lookup_cache.get_entry(vat_number)
+    if lookup_cache.is_fresh(entry):
+        if entry['status'] == lookup_cache.NOT_FOUND:
+            lookup_cache.increment('negative_hits')
+            raise CompanyNotFound(vat_number)
+        lookup_cache.increment('hits')
+        return entry, entry['data']
+
+    lookup_cache.increment('misses')
+    lookup_cache.increment('upstream_calls')
+    return entry, None
+
+
+def store_response(vat_number, entry, status_code, headers, load_json):
+    """
+    Seconda metà di una ricerca: interpreta la risposta del servizio (304, 404
+    o dati), aggiorna la cache e restituisce i dati dell'azienda.
+    `load_json` decodifica il corpo, che viene letto solo se serve.
+    """
+    if status_code == 304 and entry is not None:
+        lookup_cache.increment('revalidated')
+        return lookup_cache.refresh(vat_number, entry)['data']
+    if status_code == 404:
+        lookup_cache.store_not_found(vat_number)
+        raise CompanyNotFound(vat_number)
+    company_data = load_json()
+    lookup_cache.store_found(
+        vat_number, company_data,
+        etag=headers.get('ETag'),
+        last_modified=headers.get('Last-Modified'),
+    )
+    return company_data
+
+
+def fetch_company_data(vat_number):
+    """
+    Recupera i dati di un'azienda dal servizio esterno, passando per la cache
+    delle ricerche (vedi lookup_cache). Solleva CompanyNotFound per le partite
+    IVA sconosciute e requests.exceptions.RequestException per gli altri errori.
+    """
+    entry, company_data = lookup_cached(vat_number)
+    if company_data is not None:
+        return company_data
+
+    response = get_session().get(
+        get_service_url(),
+        params={'vat_number': vat_number},
+        headers=lookup_cache.conditional_headers(entry),
+        timeout=get_timeout(),
+    )
+    if response.status_code not in (304, 404):
+        response.raise_for_status()  # Solleva un'eccezione per risposte HTTP di errore
+    return store_response(vat_number, entry, response.status_code, response.headers, response.json)
+
+
+def fetch_companies_data(vat_numbers):
+    """
+    Recupera in parallelo i dati di più aziende. Restituisce, nello stesso ordine
+    di `vat_numbers`, coppie (vat_number, esito) dove l'esito è il dizionario dei
+    dati oppure l'eccezione sollevata per quella partita IVA.
+    """
+    def fetch(vat_number):
+        try:
+            return vat_number, fetch_company_data(vat_number)
+        except (CompanyNotFound, requests.exceptions.RequestException, ValueError) as e:
+            return vat_number, e
+
+    with ThreadPoolExecutor(max_workers=get_max_workers()) as executor:
+        # Ogni chiamata gira in una copia del contesto, così le metriche della
+        # richiesta (vedi company_info.metrics) includono le chiamate esterne
+        futures = [executor.submit(contextvars.copy_context().run, fetch, vat_number) for vat_number in vat_numbers]
+        return [future.result() for future in futures]
+
+
+def parse_vat_numbers(vat_numbers):
+    """
+    Valida la lista di partite IVA di una ricerca massiva, le porta in forma
+    canonica (lookup_cache.normalize_vat_number) ed elimina i duplicati
+    mantenendo l'ordine. Solleva ValueError con il messaggio da restituire al
+    client.
+    """
+    if not isinstance(vat_numbers, list) or not vat_numbers:
+        raise ValueError("È necessario fornire una lista di partite IVA")
+    max_batch_size = _setting('COMPANY_INFO_BATCH_MAX_SIZE', 10000)
+    if len(vat_numbers) > max_batch_size:
+        raise ValueError(f"È possibile cercare al massimo {max_batch_size} partite IVA per richiesta")
+    normalized = (lookup_cache.normalize_vat_number(vat_number) for vat_number in vat_numbers if vat_number)
+    return list(dict.fromkeys(vat_number for vat_number in normalized if vat_number))
+
+
+def lookup_companies(vat_numbers):
+    """
+    Recupera in parallelo le aziende indicate e le salva con un upsert massivo.
+    Restituisce l'esito per ogni partita IVA ('created', 'updated', 'not_found',
+    'failed', 'error') e i conteggi complessivi.
+    """
+    return save_lookups(vat_numbers, fetch_companies_data(vat_numbers))
+
+
+def save_lookups(vat_numbers, fetched):
+    """
+    Salva gli esiti `fetched` delle ricerche (coppie come quelle di
+    fetch_companies_data) e costruisce il risultato di lookup_companies.
+    """
+    results = {}
+    rows = []
+    for vat_number, outcome in fetched:
+        if isinstance(outcome, CompanyNotFound):
+            results[vat_number] = {'vat_number': vat_number, 'status': 'not_found'}
+        elif isinstance(outcome, Exception):
+            results[vat_number] = {'vat_number': vat_number, 'status': 'error', 'error': str(outcome)}
+        else:
+            # La partita IVA richiesta è la chiave di ricerca: prevale su quella restituita
+            rows.append(dict(company_data_to_company_info(outcome), vat_number=vat_number))
+
+    with transaction.atomic():
+        for chunk_result in iter_upsert_companies(rows):
+            errors = {error['vat_number']: error['error'] for error in chunk_result.errors}
+            for vat_number, outcome in chunk_result.outcomes:
+                results[vat_number] = {'vat_number': vat_number, 'status': outcome}
+                if vat_number in errors:
+                    results[vat_number]['error'] = errors[vat_number]
+
+    counts = {}
+    for result in results.values():
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    return {
+        'results': [results[vat_number] for vat_number in vat_numbers],
+        'summary': counts,
+    }
@@ -0,0 +1,170 @@
+"""
+Percorso di lettura veloce per gli endpoint di lista ed esportazione.
+
+Invece di istanziare i modelli e passare dal serializer campo per campo, le
+righe vengono lette con `.values()` e convertite con funzioni preparate una
+volta per campo a partire dai campi del serializer (stessa semantica di
+`to_representation`: UUID, date con fuso orario, Decimal quantizzati, scelte).
+Il JSON viene prodotto con orjson, se installato, altrimenti con json della
+libreria standard; l'output è identico byte per byte a quello di
+rest_framework.renderers.JSONRenderer.
+
+I campi che non corrispondono a una colonna del modello (relazioni, campi
+calcolati, source con '.') non sono supportati: in quel caso si usa il
+serializer.
+"""
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import ISO_8601, api_settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+def dumps(data, encoder):
+    """
+    JSON di `data` in byte, identico a `encoder.encode(data)`. orjson delega a
+    `encoder.default` i tipi che json non gestisce nativamente (datetime
+    compresi, per avere lo stesso formato); se orjson non riesce a codificare
+    i dati (interi oltre 64 bit, chiavi non stringa) si usa `encoder`.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            pass
+    return encoder.encode(data).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer con orjson per l'output compatto (il default delle API).
+    L'output indentato (es. `application/json; indent=4`) usa il renderer standard.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        encoder = self.encoder_class(ensure_ascii=False, allow_nan=not self.strict, separators=(',', ':'))
+        ret = dumps(data, encoder)
+        # Come JSONRenderer: U+2028 e U+2029 sempre con escape
+        for separator, escaped in _LINE_SEPARATORS:
+            if separator in ret:
+                ret = ret.replace(separator, escaped)
+        return ret
+
+
+# Convertitori per campo
+
+def field_converter(field):
+    """
+    Funzione che converte un valore non nullo letto dal database come
+    `field.to_representation`, senza i controlli generici per valore.
+    """
+    if isinstance(field, serializers.ChoiceField):
+        choices = field.choice_strings_to_values
+        return lambda value: value if value == '' else choices.get(str(value), value)
+    if isinstance(field, serializers.DateTimeField):
+        return _datetime_converter(field)
+    if isinstance(field, serializers.DecimalField):
+        coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        if coerce_to_string and not field.localize:
+            quantize = field.quantize
+            return lambda value: '{:f}'.format(quantize(value))
+    if isinstance(field, serializers.UUIDField) and field.uuid_format == 'hex_verbose':
+        return str
+    if isinstance(field, serializers.CharField):
+        return str
+    if isinstance(field, serializers.IntegerField):
+        return int
+    return field.to_representation
+
+
+def _datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+    to_representation = field.to_representation
+
+    def convert(value):
+        if value.tzinfo is None:
+            return to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    return convert
+
+
+class RowSerializer:
+    """
+    Rappresentazione delle righe di `.values()` equivalente a quella di
+    `serializer` (con i soli campi rimasti, ad esempio dopo `?fields=`).
+    """
+
+    def __init__(self, serializer):
+        self.fields = [
+            (name, field.source, field_converter(field))
+            for name, field in serializer.fields.items()
+            if not field.write_only
+        ]
+
+    @staticmethod
+    def supports(serializer):
+        """
+        True se tutti i campi leggibili del serializer sono colonne semplici del modello.
+        """
+        model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+        if model is None:
+            return False
+        columns = {field.name for field in model._meta.concrete_fields if not field.is_relation}
+        return all(
+            field.source in columns
+            for field in serializer.fields.values()
+            if not field.write_only
+        )
+
+    def values(self, queryset, *extra):
+        """
+        `queryset.values()` con le colonne dei campi più `extra` (ad esempio la
+        chiave di paginazione).
+        """
+        return queryset.values(*dict.fromkeys([source for name, source, convert in self.fields] + list(extra)))
+
+    def to_representation(self, rows):
+        fields = self.fields
+        data = []
+        for row in rows:
+            item = {}
+            for name, source, convert in fields:
+                value = row[source]
+                item[name] = None if value is None else convert(value)
+            data.append(item)
+        return data
+
+
+class ValuesListMixin:
+    """
+    `list` sul percorso veloce quando la risposta è JSON e il serializer lo
+    consente; altrimenti il normale ListModelMixin.
+    """
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer()
+        if not isinstance(request.accepted_renderer, JSONRenderer) or not RowSerializer.supports(serializer):
+            return super().list(request, *args, **kwargs)
+
+        rows = RowSerializer(serializer)
+        queryset = self.filter_queryset(self.get_queryset())
+        # I campi della chiave di paginazione servono a costruire i cursori
+        ordering = [field.lstrip('-') for field in getattr(self, 'keyset_ordering', ())]
+        page = self.paginate_queryset(rows.values(queryset, *ordering))
+        if page is None:
+            return Response(rows.to_representation(rows.values(queryset)))
+        return self.get_paginated_response(rows.to_representation(page))
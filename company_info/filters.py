@@ -0,0 +1,174 @@
+"""
+Filtri lato server per la lista delle aziende.
+
+Ogni parametro corrisponde a un indice su Company (vedi Company.Meta.indexes):
+- ateco_code: codice esatto, oppure prefisso con `*` finale (es. `47.*`),
+  tradotto in un intervallo [prefisso, successore) per poter usare l'indice;
+- region, legal_form, seasonality: uno o più valori separati da virgola;
+- turnover_min, turnover_max: estremi (inclusi) del fatturato annuo.
+
+La ricerca testuale (`?search=`) usa l'indice full-text di company_info.search.
+"""
+from decimal import Decimal, InvalidOperation
+
+from rest_framework import serializers
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.filters import BaseFilterBackend
+
+from . import search
+
+MULTI_VALUE_FILTERS = {
+    'region': 'Regione (uno o più valori separati da virgola)',
+    'legal_form': 'Forma giuridica (uno o più valori separati da virgola)',
+    'seasonality': 'Stagionalità (uno o più valori separati da virgola)',
+}
+RANGE_FILTERS = {
+    'turnover_min': ('annual_turnover__gte', 'Fatturato annuo minimo'),
+    'turnover_max': ('annual_turnover__lte', 'Fatturato annuo massimo'),
+}
+ATECO_DESCRIPTION = "Codice Ateco esatto, oppure prefisso terminato da '*' (es. 47.*)"
+
+
+def ateco_prefix_range(prefix):
+    """
+    Intervallo [inizio, fine) dei codici che iniziano con `prefix`.
+    """
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def ateco_filter(value):
+    """
+    Condizioni di filtro per un valore del parametro ateco_code.
+    """
+    if value.endswith('*'):
+        prefix = value.rstrip('*').rstrip('.')
+        if not prefix:
+            return {}
+        start, end = ateco_prefix_range(prefix)
+        return {'ateco_code__gte': start, 'ateco_code__lt': end}
+    return {'ateco_code': value}
+
+
+def company_filter_conditions(params):
+    """
+    Condizioni di filtro della lista aziende a partire dai parametri (un dict o
+    una QueryDict). Solleva ValidationError per i valori non validi.
+    """
+    conditions = {}
+
+    ateco_code = params.get('ateco_code', '').strip()
+    if ateco_code:
+        conditions.update(ateco_filter(ateco_code))
+
+    for name in MULTI_VALUE_FILTERS:
+        values = [value.strip() for value in params.get(name, '').split(',') if value.strip()]
+        if len(values) == 1:
+            conditions[name] = values[0]
+        elif values:
+            conditions[f'{name}__in'] = values
+
+    for name, (lookup, description) in RANGE_FILTERS.items():
+        if params.get(name):
+            try:
+                value = Decimal(params[name])
+            except InvalidOperation:
+                value = None
+            # Decimal accetta anche NaN e Infinity, che il database non può confrontare
+            if value is None or not value.is_finite():
+                raise serializers.ValidationError({name: ["Importo non valido"]})
+            conditions[lookup] = value
+
+    return conditions
+
+
+def filter_companies(queryset, params, rank=False):
+    """
+    Applica a `queryset` gli stessi filtri e la stessa ricerca (`search`) della
+    lista aziende, fuori da una richiesta (esportazioni, comandi).
+    """
+    conditions = company_filter_conditions(params)
+    if conditions:
+        queryset = queryset.filter(**conditions)
+    text = params.get(CompanySearchFilter.search_param, '').strip()
+    if text:
+        queryset = search.search_queryset(queryset, text, rank=rank)
+    return queryset
+
+
+class CompanyFilterBackend(BaseFilterBackend):
+
+    def filter_queryset(self, request, queryset, view):
+        conditions = company_filter_conditions(request.query_params)
+        return queryset.filter(**conditions) if conditions else queryset
+
+    def get_schema_fields(self, view):
+        assert coreapi is not None, 'coreapi must be installed to use `get_schema_fields()`'
+        assert coreschema is not None, 'coreschema must be installed to use `get_schema_fields()`'
+        fields = [('ateco_code', ATECO_DESCRIPTION, coreschema.String)]
+        fields += [(name, description, coreschema.String) for name, description in MULTI_VALUE_FILTERS.items()]
+        fields += [(name, description, coreschema.Number) for name, (lookup, description) in RANGE_FILTERS.items()]
+        return [
+            coreapi.Field(
+                name=name,
+                required=False,
+                location='query',
+                schema=schema_class(title=name, description=description),
+            )
+            for name, description, schema_class in fields
+        ]
+
+    def get_schema_operation_parameters(self, view):
+        parameters = [('ateco_code', ATECO_DESCRIPTION, 'string')]
+        parameters += [(name, description, 'string') for name, description in MULTI_VALUE_FILTERS.items()]
+        parameters += [(name, description, 'number') for name, (lookup, description) in RANGE_FILTERS.items()]
+        return [
+            {
+                'name': name,
+                'required': False,
+                'in': 'query',
+                'description': description,
+                'schema': {'type': schema_type},
+            }
+            for name, description, schema_type in parameters
+        ]
+
+
+class CompanySearchFilter(BaseFilterBackend):
+    """
+    Ricerca full-text con `?search=`; i risultati vengono annotati con `search_rank`.
+    """
+    search_param = 'search'
+    search_description = "Ricerca full-text su attività, descrizione, indirizzo, città e contatti"
+
+    @classmethod
+    def get_search_text(cls, request):
+        return request.query_params.get(cls.search_param, '').strip()
+
+    def filter_queryset(self, request, queryset, view):
+        text = self.get_search_text(request)
+        if not text:
+            return queryset
+        return search.search_queryset(queryset, text)
+
+    def get_schema_fields(self, view):
+        assert coreapi is not None, 'coreapi must be installed to use `get_schema_fields()`'
+        assert coreschema is not None, 'coreschema must be installed to use `get_schema_fields()`'
+        return [
+            coreapi.Field(
+                name=self.search_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(title=self.search_param, description=self.search_description),
+            )
+        ]
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.search_param,
+                'required': False,
+                'in': 'query',
+                'description': self.search_description,
+                'schema': {'type': 'string'},
+            },
+        ]
@@ -0,0 +1,350 @@
+"""
+Importazione massiva di aziende da file CSV o XLSX, con upsert per partita IVA.
+
+Il file viene letto in streaming e gestito a blocchi di COMPANY_IMPORT_BATCH_SIZE
+righe:
+- la validazione usa un convertitore per colonna, ricavato una sola volta dai
+  campi di Company, invece di un serializer per riga;
+- le righe valide del blocco vengono scritte dall'upsert massivo
+  (upsert.iter_upsert_companies), aggiornando solo le colonne presenti nel
+  file: aggregati di portafoglio, indice di similarità e cache seguono quindi
+  gli stessi hook di ogni altra scrittura; le aziende nuove vengono aggiunte
+  all'indice full-text con un'unica istruzione (search.bulk_indexing);
+- le righe scartate finiscono nel report CSV degli errori (riga, partita IVA,
+  campo, errore), scaricabile da /api/company-imports/<id>/errors/.
+
+In modalità dry_run il file viene solo validato e i conteggi di aziende create
+e aggiornate sono stimati sulle partite IVA già presenti.
+
+Le intestazioni possono essere i nomi dei campi (es. vat_number) o le loro
+etichette (es. P.IVA). I CSV sono letti come UTF-8 o, se non lo sono, come
+cp1252. I file XLSX richiedono il pacchetto opzionale openpyxl.
+"""
+import codecs
+import csv
+import io
+import re
+import time
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import chain, islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import EmailValidator, validate_email
+from django.db import models, transaction
+
+from . import search
+from .models import Company, CompanyImport
+from .upsert import iter_upsert_companies
+
+DEFAULT_BATCH_SIZE = 2000
+REQUIRED_COLUMNS = ('vat_number', 'legal_form', 'ateco_code')
+# Campi gestiti dall'importazione, mai letti dal file
+AUTOMATIC_FIELDS = ('uuid', 'created_at', 'updated_at')
+ERROR_REPORT_HEADER = ['row', 'vat_number', 'field', 'error']
+# Righe lette per riconoscere il separatore dei CSV
+SNIFF_LINES = 20
+
+
+class ImportFileError(Exception):
+    """
+    File illeggibile o privo delle colonne obbligatorie.
+    """
+
+
+def get_batch_size(batch_size=None):
+    return batch_size or getattr(settings, 'COMPANY_IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+# Lettura dei file
+
+def read_rows(fileobj, filename):
+    """
+    Restituisce l'intestazione e un iteratore (pigro) sulle righe del file.
+    """
+    if filename.lower().endswith('.xlsx'):
+        header, rows = _read_xlsx(fileobj)
+    else:
+        header, rows = _read_csv(fileobj)
+    if header is None:
+        raise ImportFileError("Il file è vuoto")
+    return header, rows
+
+
+def _decode_lines(fileobj):
+    """
+    Righe del CSV come testo: UTF-8 (con o senza BOM) oppure, dalla prima riga
+    che non lo è, cp1252 (i CSV di Excel in italiano). Solleva ImportFileError
+    per i byte non validi in nessuna delle due codifiche.
+    """
+    encoding = 'utf-8'
+    for number, line in enumerate(fileobj, start=1):
+        if number == 1 and line.startswith(codecs.BOM_UTF8):
+            line = line[len(codecs.BOM_UTF8):]
+        try:
+            yield line.decode(encoding)
+            continue
+        except UnicodeDecodeError:
+            if encoding != 'utf-8':
+                raise ImportFileError(f"CSV non leggibile: codifica non riconosciuta alla riga {number}")
+        encoding = 'cp1252'
+        try:
+            yield line.decode(encoding)
+        except UnicodeDecodeError:
+            raise ImportFileError(f"CSV non leggibile: codifica non riconosciuta alla riga {number}")
+
+
+def _read_csv(fileobj):
+    lines = _decode_lines(fileobj)
+    sample = list(islice(lines, SNIFF_LINES))
+    try:
+        # Excel in italiano esporta i CSV con il punto e virgola
+        dialect = csv.Sniffer().sniff(''.join(sample), delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(chain(sample, lines), dialect)
+    try:
+        return next(reader, None), _guarded(reader)
+    except csv.Error as e:
+        raise ImportFileError(f"CSV non leggibile: {e}")
+
+
+def _guarded(reader):
+    try:
+        yield from reader
+    except csv.Error as e:
+        raise ImportFileError(f"CSV non leggibile: {e}")
+
+
+def _read_xlsx(fileobj):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFileError("Per importare file XLSX è necessario il pacchetto openpyxl")
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFileError(f"XLSX non leggibile: {e}")
+    rows = workbook.active.iter_rows(values_only=True)
+    return next(rows, None), rows
+
+
+def map_columns(header):
+    """
+    Associa le colonne del file ai campi di Company: restituisce le coppie
+    (indice, campo) riconosciute e le intestazioni ignorate.
+    """
+    names = {}
+    for field in Company._meta.concrete_fields:
+        if field.name not in AUTOMATIC_FIELDS:
+            names[str(field.verbose_name).strip().lower()] = field.name
+            names[field.name] = field.name
+    columns, ignored, seen = [], [], set()
+    for index, title in enumerate(header):
+        name = names.get(str(title or '').strip().lower())
+        if name is None or name in seen:
+            ignored.append(title)
+            continue
+        seen.add(name)
+        columns.append((index, name))
+    missing = [name for name in REQUIRED_COLUMNS if name not in seen]
+    if missing:
+        raise ImportFileError(f"Colonne obbligatorie mancanti: {', '.join(missing)}")
+    return columns, ignored
+
+
+# Validazione
+
+# Le stesse espressioni di EmailValidator, compilate subito: l'accesso alle
+# espressioni pigre del validatore costa più del confronto stesso
+_EMAIL_USER = re.compile(EmailValidator.user_regex.pattern, EmailValidator.user_regex.flags)
+_EMAIL_DOMAIN = re.compile(EmailValidator.domain_regex.pattern, EmailValidator.domain_regex.flags)
+
+
+def _is_valid_email(value):
+    user, separator, domain = value.rpartition('@')
+    if separator and _EMAIL_USER.match(user) and _EMAIL_DOMAIN.match(domain):
+        return True
+    # Casi meno comuni (domini internazionalizzati, indirizzi IP): validatore completo
+    try:
+        validate_email(value)
+    except ValidationError:
+        return False
+    return True
+
+
+def _text_converter(field):
+    choices = {key for key, label in field.choices} if field.choices else None
+    max_length = field.max_length
+    is_email = isinstance(field, models.EmailField)
+    required = not field.blank
+    empty = None if field.null else ''
+
+    def convert(raw):
+        value = '' if raw is None else str(raw).strip()
+        if not value:
+            if required:
+                raise ValidationError("Campo obbligatorio")
+            return empty
+        if choices is not None:
+            value = value.upper()
+            if value not in choices:
+                raise ValidationError(f"Valore non ammesso: {value}")
+        if max_length and len(value) > max_length:
+            raise ValidationError(f"Massimo {max_length} caratteri")
+        if is_email and not _is_valid_email(value):
+            raise ValidationError("Email non valida")
+        return value
+
+    return convert
+
+
+def _number(raw):
+    if isinstance(raw, (int, float, Decimal)):
+        return Decimal(str(raw))
+    text = str(raw).strip().replace(' ', '')
+    if ',' in text:
+        # Formato italiano: 1.234,50
+        text = text.replace('.', '').replace(',', '.')
+    return Decimal(text)
+
+
+def _decimal_converter(field):
+    quantum = Decimal(1).scaleb(-field.decimal_places)
+    limit = Decimal(10) ** (field.max_digits - field.decimal_places)
+
+    def convert(raw):
+        if raw is None or str(raw).strip() == '':
+            return None
+        try:
+            value = _number(raw).quantize(quantum)
+        except InvalidOperation:
+            raise ValidationError("Importo non valido")
+        if abs(value) >= limit:
+            raise ValidationError("Importo troppo grande")
+        return value
+
+    return convert
+
+
+def _integer_converter(field):
+    minimum = 0 if isinstance(field, models.PositiveIntegerField) else None
+
+    def convert(raw):
+        if raw is None or str(raw).strip() == '':
+            return None
+        try:
+            value = _number(raw)
+        except InvalidOperation:
+            raise ValidationError("Numero intero non valido")
+        if value != value.to_integral_value():
+            raise ValidationError("Numero intero non valido")
+        if minimum is not None and value < minimum:
+            raise ValidationError("Il valore non può essere negativo")
+        return int(value)
+
+    return convert
+
+
+class RowValidator:
+    """
+    Validatore snello delle righe: i convertitori delle colonne vengono
+    preparati una volta per file, non per riga.
+    """
+
+    def __init__(self, columns):
+        self.converters = []
+        for index, name in columns:
+            field = Company._meta.get_field(name)
+            if isinstance(field, models.DecimalField):
+                converter = _decimal_converter(field)
+            elif isinstance(field, models.IntegerField):
+                converter = _integer_converter(field)
+            else:
+                converter = _text_converter(field)
+            self.converters.append((index, name, converter))
+
+    def __call__(self, row):
+        """
+        Restituisce i valori convertiti e gli errori (campo -> messaggio) della riga.
+        """
+        values, errors = {}, {}
+        for index, name, convert in self.converters:
+            try:
+                values[name] = convert(row[index] if index < len(row) else None)
+            except ValidationError as e:
+                errors[name] = e.messages[0]
+        return values, errors
+
+
+# Importazione
+
+def import_companies(fileobj, filename, dry_run=False, batch_size=None):
+    """
+    Importa le aziende dal file e restituisce il CompanyImport salvato, con
+    conteggi e report degli errori. Solleva ImportFileError se il file non è
+    utilizzabile.
+    """
+    started = time.monotonic()
+    batch_size = get_batch_size(batch_size)
+    header, rows = read_rows(fileobj, filename)
+    columns, ignored = map_columns(header)
+    names = [name for index, name in columns]
+    vat_index = next(index for index, name in columns if name == 'vat_number')
+    validate = RowValidator(columns)
+
+    result = CompanyImport(filename=filename, dry_run=dry_run)
+    report = io.StringIO()
+    report_writer = csv.writer(report)
+    report_writer.writerow(ERROR_REPORT_HEADER)
+
+    # La riga 1 è l'intestazione
+    numbered_rows = enumerate(rows, start=2)
+    with transaction.atomic(), search.bulk_indexing() as index_new_rows:
+        while True:
+            chunk = list(islice(numbered_rows, batch_size))
+            if not chunk:
+                break
+            companies, numbers = {}, {}
+            for number, row in chunk:
+                if not any(value not in (None, '') for value in row):
+                    continue
+                result.rows += 1
+                values, errors = validate(row)
+                if errors:
+                    result.failed += 1
+                    vat_number = row[vat_index] if vat_index < len(row) else ''
+                    for name, message in errors.items():
+                        report_writer.writerow([number, vat_number, name, message])
+                    continue
+                # A parità di partita IVA vince l'ultima riga
+                companies[values['vat_number']] = values
+                numbers[values['vat_number']] = number
+            if not companies:
+                continue
+
+            if dry_run:
+                existing = Company.objects.filter(vat_number__in=companies.keys()).count()
+                result.updated += existing
+                result.created += len(companies) - existing
+                continue
+            for chunk_result in iter_upsert_companies(
+                companies.values(), batch_size=len(companies), update_fields=names,
+            ):
+                result.created += chunk_result.created
+                result.updated += chunk_result.updated
+                result.failed += chunk_result.failed
+                # Righe già validate: restano gli errori del database (chiave None)
+                messages = {error['vat_number']: error['error'] for error in chunk_result.errors}
+                for vat_number, outcome in chunk_result.outcomes:
+                    if outcome == 'failed':
+                        message = messages.get(vat_number, messages.get(None))
+                        report_writer.writerow([numbers[vat_number], vat_number, '', message])
+            index_new_rows()
+
+        result.error_report = report.getvalue() if result.failed else ''
+        result.duration = timedelta(seconds=time.monotonic() - started)
+        result.save()
+    result.ignored_columns = ignored
+    return result
@@ -0,0 +1,165 @@
+"""
+Job di sincronizzazione in background, senza broker esterni.
+
+Il job viene registrato su SyncJob ed eseguito da un worker locale:
+- 'thread': un thread del processo che ha avviato il job (default);
+- 'db': il job resta PENDING finché `manage.py sync_contractors --worker`
+  non lo preleva dal database.
+
+A differenza dell'upsert sincrono, ogni blocco viene scritto nella propria
+transazione insieme ai contatori di avanzamento, così lo stato del job è
+visibile dall'endpoint /api/sync-jobs/<id>/ mentre la sincronizzazione procede.
+L'upsert è idempotente: un job interrotto può essere semplicemente rilanciato.
+I contractor identici all'ultima sincronizzazione non vengono riscritti e, con
+CONTRACTORS_SYNC_FLAG_MISSING, quelli spariti dal feed vengono marcati a fine
+job (vedi company_info.upsert).
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .contractors import ContractorsFeed, contractor_to_company_info
+from .models import SyncJob
+from .upsert import iter_upsert_companies, mark_missing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STALE_AFTER = 600
+
+
+class SyncJobConflict(Exception):
+    """
+    Esiste già un job attivo dello stesso tipo.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        super().__init__(f"Sincronizzazione già in corso: {job.pk}")
+
+
+def fail_stale_jobs():
+    """
+    Marca come falliti, liberando il vincolo di unicità:
+    - i job RUNNING che non danno segni di vita da troppo tempo (ad esempio per
+      un riavvio del processo);
+    - i job PENDING creati da troppo tempo e mai avviati (il processo è terminato
+      prima del commit del thread, oppure nessun worker 'db' è attivo).
+    Restituisce il numero di job marcati.
+    """
+    stale_after = getattr(settings, 'SYNC_JOB_STALE_AFTER', DEFAULT_STALE_AFTER)
+    now = timezone.now()
+    threshold = now - timedelta(seconds=stale_after)
+    stale = SyncJob.objects.filter(status=SyncJob.STATUS_RUNNING, heartbeat_at__lt=threshold).update(
+        status=SyncJob.STATUS_FAILED,
+        error="Job interrotto: nessun heartbeat",
+        finished_at=now,
+    )
+    return stale + SyncJob.objects.filter(status=SyncJob.STATUS_PENDING, created_at__lt=threshold).update(
+        status=SyncJob.STATUS_FAILED,
+        error="Job scaduto: mai avviato",
+        finished_at=now,
+    )
+
+
+def start_contractors_sync(runner=None):
+    """
+    Registra un nuovo job di sincronizzazione dei contractor e lo affida al worker.
+    Solleva SyncJobConflict se un'altra sincronizzazione è già attiva.
+    """
+    runner = runner or getattr(settings, 'SYNC_JOB_RUNNER', 'thread')
+    fail_stale_jobs()
+    try:
+        with transaction.atomic():
+            job = SyncJob.objects.create(kind='CONTRACTORS')
+    except IntegrityError:
+        active = SyncJob.objects.filter(kind='CONTRACTORS', status__in=SyncJob.ACTIVE_STATUSES).first()
+        raise SyncJobConflict(active)
+
+    if runner == 'thread':
+        transaction.on_commit(lambda: _start_thread(job.pk))
+    return job
+
+
+def _start_thread(job_pk):
+    thread = threading.Thread(target=_run_in_thread, args=(job_pk,), name=f'sync-job-{job_pk}', daemon=True)
+    thread.start()
+
+
+def _run_in_thread(job_pk):
+    try:
+        run_sync_job(SyncJob.objects.get(pk=job_pk))
+    finally:
+        # Il thread ha una propria connessione al database, da chiudere al termine
+        connection.close()
+
+
+def claim_next_job():
+    """
+    Preleva il job PENDING più vecchio, se presente. L'update condizionale
+    garantisce che due worker non prelevino lo stesso job.
+    """
+    fail_stale_jobs()
+    for job in SyncJob.objects.filter(status=SyncJob.STATUS_PENDING).order_by('created_at')[:5]:
+        now = timezone.now()
+        claimed = SyncJob.objects.filter(pk=job.pk, status=SyncJob.STATUS_PENDING).update(
+            status=SyncJob.STATUS_RUNNING, started_at=now, heartbeat_at=now,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def run_sync_job(job, feed=None):
+    """
+    Esegue il job: legge il feed in streaming e scrive un blocco alla volta,
+    aggiornando i contatori. Restituisce il job aggiornato.
+    """
+    with metrics.track('sync_job', job.kind.lower()) as job_metrics:
+        _run_sync_job(job, feed)
+    metrics.finish(job_metrics, f'job {job.pk}')
+    job.refresh_from_db()
+    return job
+
+
+def _run_sync_job(job, feed):
+    now = timezone.now()
+    SyncJob.objects.filter(pk=job.pk).update(status=SyncJob.STATUS_RUNNING, started_at=now, heartbeat_at=now)
+    try:
+        feed = feed or ContractorsFeed()
+        chunks = iter_upsert_companies(
+            (contractor_to_company_info(contractor) for contractor in feed), skip_unchanged=True, sync_id=job.pk,
+        )
+        while True:
+            with transaction.atomic():
+                chunk_result = next(chunks, None)
+                if chunk_result is None:
+                    break
+                SyncJob.objects.filter(pk=job.pk).update(
+                    processed=F('processed') + len(chunk_result.outcomes),
+                    created=F('created') + chunk_result.created,
+                    updated=F('updated') + chunk_result.updated,
+                    unchanged=F('unchanged') + chunk_result.unchanged,
+                    failed=F('failed') + chunk_result.failed,
+                    pages=feed.pages,
+                    heartbeat_at=timezone.now(),
+                )
+            for error in chunk_result.errors:
+                logger.warning("Error processing contractor %s: %s", error['vat_number'], error['error'])
+        # Solo un feed letto per intero dice quali aziende sono sparite
+        if getattr(settings, 'CONTRACTORS_SYNC_FLAG_MISSING', False):
+            with transaction.atomic():
+                SyncJob.objects.filter(pk=job.pk).update(missing=mark_missing(job.pk), heartbeat_at=timezone.now())
+    except Exception as e:
+        logger.exception("Sync job %s failed", job.pk)
+        SyncJob.objects.filter(pk=job.pk).update(
+            status=SyncJob.STATUS_FAILED, error=str(e), finished_at=timezone.now(),
+        )
+    else:
+        SyncJob.objects.filter(pk=job.pk).update(status=SyncJob.STATUS_SUCCEEDED, finished_at=timezone.now())
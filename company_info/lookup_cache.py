@@ -0,0 +1,121 @@
+"""
+Cache delle ricerche sul servizio esterno di informazioni aziendali.
+
+Le voci sono indicizzate per partita IVA normalizzata e salvate nell'alias di
+cache COMPANY_LOOKUP_CACHE (locmem di default, con evizione LRU limitata da
+MAX_ENTRIES). Le risposte 404 vengono memorizzate come voci negative con un
+TTL dedicato. Scaduto il TTL, una voce con ETag/Last-Modified viene conservata
+per COMPANY_LOOKUP_CACHE_REVALIDATE_WINDOW secondi e rivalidata con una
+richiesta condizionale invece di essere riscaricata.
+
+I contatori di hit/miss sono salvati nella cache di default, così da essere
+condivisi tra processi quando questa è un backend condiviso.
+"""
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+FOUND = 'found'
+NOT_FOUND = 'not_found'
+
+STATS = ('hits', 'negative_hits', 'misses', 'revalidated', 'upstream_calls')
+STATS_KEY_PREFIX = 'company_lookup_stats:'
+
+_VAT_SEPARATORS = re.compile(r'[\s.\-]')
+_ITALIAN_VAT = re.compile(r'^IT(\d{11})$')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def get_cache():
+    return caches[_setting('COMPANY_LOOKUP_CACHE', 'default')]
+
+
+def normalize_vat_number(vat_number):
+    """
+    Forma canonica della partita IVA: maiuscola, senza separatori e senza il
+    prefisso 'IT' per le partite IVA italiane.
+    """
+    vat_number = _VAT_SEPARATORS.sub('', str(vat_number)).upper()
+    match = _ITALIAN_VAT.match(vat_number)
+    return match.group(1) if match else vat_number
+
+
+def cache_key(vat_number):
+    return f'company_lookup:{normalize_vat_number(vat_number)}'
+
+
+def get_entry(vat_number):
+    return get_cache().get(cache_key(vat_number))
+
+
+def is_fresh(entry):
+    return entry is not None and entry['expires_at'] > time.time()
+
+
+def store_found(vat_number, data, etag=None, last_modified=None):
+    ttl = _setting('COMPANY_LOOKUP_CACHE_TTL', 3600)
+    retention = ttl
+    if etag or last_modified:
+        # La voce scaduta resta disponibile per la rivalidazione condizionale
+        retention += _setting('COMPANY_LOOKUP_CACHE_REVALIDATE_WINDOW', 86400)
+    entry = {
+        'status': FOUND,
+        'data': data,
+        'etag': etag,
+        'last_modified': last_modified,
+        'expires_at': time.time() + ttl,
+    }
+    get_cache().set(cache_key(vat_number), entry, retention)
+    return entry
+
+
+def store_not_found(vat_number):
+    ttl = _setting('COMPANY_LOOKUP_CACHE_NEGATIVE_TTL', 600)
+    entry = {'status': NOT_FOUND, 'expires_at': time.time() + ttl}
+    get_cache().set(cache_key(vat_number), entry, ttl)
+    return entry
+
+
+def refresh(vat_number, entry):
+    """
+    Rinnova il TTL di una voce confermata dal servizio esterno (risposta 304).
+    """
+    return store_found(vat_number, entry['data'], entry['etag'], entry['last_modified'])
+
+
+def conditional_headers(entry):
+    headers = {}
+    if entry is not None and entry['status'] == FOUND:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def increment(stat):
+    stats_cache = caches['default']
+    key = STATS_KEY_PREFIX + stat
+    if not stats_cache.add(key, 1, None):
+        try:
+            stats_cache.incr(key)
+        except ValueError:
+            # Chiave rimossa nel frattempo
+            stats_cache.add(key, 1, None)
+
+
+def get_stats():
+    stats_cache = caches['default']
+    values = stats_cache.get_many([STATS_KEY_PREFIX + stat for stat in STATS])
+    stats = {stat: values.get(STATS_KEY_PREFIX + stat, 0) for stat in STATS}
+    stats['saved_calls'] = stats['hits'] + stats['negative_hits']
+    return stats
+
+
+def reset_stats():
+    caches['default'].delete_many([STATS_KEY_PREFIX + stat for stat in STATS])
@@ -0,0 +1,61 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from company_info.fast_serialization import FastJSONRenderer, RowSerializer
+from company_info.models import Company
+from company_info.serializers import CompanySerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Confronta la serializzazione della lista aziende con CompanySerializer e con il "
+        "percorso veloce (.values() e FastJSONRenderer) su dati sintetici, poi annulla le scritture."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help="Aziende sintetiche da creare")
+        parser.add_argument('--repeat', type=int, default=5, help="Ripetizioni (vale il tempo migliore)")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            Company.objects.bulk_create([
+                Company(
+                    vat_number=f'{index:011d}', legal_form='SRL', ateco_code=f'{10 + index % 80}.{index % 100:02d}',
+                    activity=f'Attività {index}', activity_description='Produzione e vendita al dettaglio',
+                    annual_turnover=Decimal(index * 1000 + 250) / 100, employees=index % 250,
+                    seasonality='NONE', city='Forlì', region='Emilia-Romagna', email=f'info{index}@example.com',
+                )
+                for index in range(options['rows'])
+            ], batch_size=1000)
+            queryset = Company.objects.order_by('-created_at', '-uuid')
+
+            serializer_time, expected = self.measure(options['repeat'], lambda: JSONRenderer().render(
+                CompanySerializer(list(queryset), many=True).data
+            ))
+            rows = RowSerializer(CompanySerializer())
+            fast_time, content = self.measure(options['repeat'], lambda: FastJSONRenderer().render(
+                rows.to_representation(rows.values(queryset))
+            ))
+            transaction.set_rollback(True)
+
+        if content != expected:
+            self.stderr.write(self.style.ERROR("Le risposte dei due percorsi sono diverse"))
+            return
+        self.stdout.write(f"Righe: {options['rows']}, risposta: {len(content)} byte")
+        self.stdout.write(f"Serializer:        {serializer_time * 1000:.1f} ms")
+        self.stdout.write(f"Percorso veloce:   {fast_time * 1000:.1f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {serializer_time / fast_time:.1f}x"))
+
+    @staticmethod
+    def measure(repeat, function):
+        best, result = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = function()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
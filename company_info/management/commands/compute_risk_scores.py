@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from company_info.scoring import recompute_dirty, recompute_risk_scores
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricalcola il risk_score delle valutazioni di underwriting a partire dalle checklist. "
+        "Con --dirty ricalcola solo quelle modificate dall'ultimo ricalcolo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int,
+                            help="Anno di underwriting da ricalcolare (default: tutti)")
+        parser.add_argument('--batch-size', type=int,
+                            help="Righe per blocco di scrittura (default: RISK_SCORE_BATCH_SIZE)")
+        parser.add_argument('--dirty', action='store_true',
+                            help="Ricalcola solo le valutazioni segnate come da ricalcolare")
+        parser.add_argument('--watch', action='store_true',
+                            help="Con --dirty, resta in attesa di nuove modifiche")
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Con --watch, secondi di attesa tra due controlli")
+
+    def handle(self, *args, **options):
+        if not options['dirty']:
+            self.report(recompute_risk_scores(underwriting_year=options['year'], batch_size=options['batch_size']))
+            return
+
+        while True:
+            result = recompute_dirty(batch_size=options['batch_size'])
+            if result['scored'] or not options['watch']:
+                self.report(result)
+            if not options['watch']:
+                return
+            time.sleep(options['poll_interval'])
+
+    def report(self, result):
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['scored']} valutazioni calcolate, {result['updated']} aggiornate"
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from company_info.similarity import fill_similar_deals, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Compila similar_deals_won, average_deal_size e win_probability delle valutazioni di un anno "
+        "di underwriting dalle trattative delle aziende più simili (vedi company_info.similarity)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, required=True, help="Anno di underwriting da compilare")
+        parser.add_argument('--neighbours', type=int,
+                            help="Aziende simili considerate (default: SIMILAR_DEALS_NEIGHBOURS)")
+        parser.add_argument('--batch-size', type=int,
+                            help="Righe per blocco di scrittura (default: SIMILARITY_BATCH_SIZE)")
+        parser.add_argument('--rebuild-index', action='store_true',
+                            help="Ricalcola prima le caratteristiche di tutte le aziende")
+
+    def handle(self, *args, **options):
+        if options['neighbours'] is not None and options['neighbours'] < 1:
+            raise CommandError("--neighbours deve essere almeno 1")
+        if options['rebuild_index']:
+            companies = rebuild(batch_size=options['batch_size'])
+            self.stdout.write(f"Indice di similarità ricostruito: {companies} aziende")
+        result = fill_similar_deals(
+            options['year'], neighbours=options['neighbours'], batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['scored']} valutazioni calcolate, {result['updated']} aggiornate"
+        ))
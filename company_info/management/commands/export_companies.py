@@ -0,0 +1,47 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from company_info import exports
+from company_info.filters import filter_companies
+from company_info.models import Company
+
+
+class Command(BaseCommand):
+    help = (
+        "Esporta in streaming le aziende con le relative valutazioni di underwriting, "
+        "in CSV o NDJSON, con gli stessi filtri della lista aziende."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', choices=sorted(exports.FORMATS), default='csv',
+                            help="Formato del file (default: csv)")
+        parser.add_argument('--gzip', action='store_true', help="Comprime il file in gzip")
+        parser.add_argument('--file', help="File di destinazione (default: standard output)")
+        parser.add_argument('--filter', action='append', default=[], metavar='NOME=VALORE',
+                            help="Filtro della lista aziende, es. --filter ateco_code=47.* (ripetibile)")
+        parser.add_argument('--chunk-size', type=int,
+                            help="Righe per blocco (default: EXPORT_CHUNK_SIZE)")
+
+    def handle(self, *args, **options):
+        params = {}
+        for item in options['filter']:
+            name, separator, value = item.partition('=')
+            if not separator:
+                raise CommandError(f"Filtro non valido: {item}")
+            params[name] = value
+        try:
+            companies = filter_companies(Company.objects.all(), params)
+        except ValidationError as e:
+            raise CommandError(str(e.detail))
+
+        chunks = exports.export_companies(companies, options['output'], options['gzip'], options['chunk_size'])
+        if options['file']:
+            with open(options['file'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
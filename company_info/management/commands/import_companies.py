@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from company_info.imports import ImportFileError, import_companies
+
+
+class Command(BaseCommand):
+    help = "Importa (crea o aggiorna per partita IVA) le aziende da un file CSV o XLSX."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File CSV o XLSX da importare")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Valida il file senza salvare le aziende")
+        parser.add_argument('--batch-size', type=int,
+                            help="Righe per blocco (default: COMPANY_IMPORT_BATCH_SIZE)")
+        parser.add_argument('--errors', help="File in cui scrivere il report CSV delle righe scartate")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as source:
+                result = import_companies(source, options['path'], options['dry_run'], options['batch_size'])
+        except (OSError, ImportFileError) as e:
+            raise CommandError(str(e))
+
+        if options['errors'] and result.failed:
+            with open(options['errors'], 'w', encoding='utf-8', newline='') as report:
+                report.write(result.error_report)
+        message = (
+            f"Importazione {result.pk}{' (prova)' if result.dry_run else ''}: {result.rows} righe, "
+            f"{result.created} create, {result.updated} aggiornate, {result.failed} scartate "
+            f"in {result.duration.total_seconds():.1f}s"
+        )
+        if result.ignored_columns:
+            message += f"\nColonne ignorate: {', '.join(str(column) for column in result.ignored_columns)}"
+        self.stdout.write(self.style.SUCCESS(message))
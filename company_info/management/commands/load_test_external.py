@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from company_info.benchmarks.load import run_load_test
+
+
+class Command(BaseCommand):
+    help = (
+        "Test di carico delle ricerche sul servizio esterno (vedi company_info.benchmarks.load): "
+        "confronta la view sincrona con quella asincrona su un database di test e uno stub locale."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Richieste per modalità")
+        parser.add_argument('--latency', type=float, default=0.05,
+                            help="Latenza (secondi) di ogni risposta dello stub")
+        parser.add_argument('--workers', type=int, default=16,
+                            help="Thread della modalità sincrona (come i worker di un server WSGI)")
+        parser.add_argument('--concurrency', type=int, default=200,
+                            help="Richieste in volo nella modalità asincrona")
+        parser.add_argument('--mode', action='append', dest='modes', choices=['sync', 'async'],
+                            help="Modalità da eseguire (ripetibile, default: entrambe)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="File JSON dei risultati (default: standard output)")
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError("--requests deve essere almeno 1")
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            result = run_load_test(
+                requests=options['requests'], latency=options['latency'], workers=options['workers'],
+                concurrency=options['concurrency'], modes=options['modes'] or ('sync', 'async'),
+                seed=options['seed'],
+            )
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        content = json.dumps(result, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(content + '\n')
+        else:
+            self.stdout.write(content)
+        modes = result['modes']
+        if 'sync' in modes and 'async' in modes:
+            ratio = modes['async']['requests_per_second'] / modes['sync']['requests_per_second']
+            self.stderr.write(f"Throughput async/sync: {ratio:.2f}x")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from company_info.portfolio import rebuild
+
+
+class Command(BaseCommand):
+    help = "Ricostruisce da zero gli aggregati di portafoglio a partire da aziende e valutazioni."
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f"{rebuild()} gruppi ricostruiti"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from company_info.search import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricostruisce l'indice full-text delle aziende. Con --vacuum compatta prima il database: "
+        "su SQLite VACUUM può rinumerare le righe a cui fa riferimento l'indice."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vacuum', action='store_true', help="Esegue VACUUM prima della ricostruzione")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help="Database su cui operare")
+
+    def handle(self, *args, **options):
+        rebuild(options['database'], vacuum=options['vacuum'])
+        self.stdout.write(self.style.SUCCESS("Indice full-text ricostruito"))
@@ -0,0 +1,87 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from company_info.benchmarks.data import DatasetSize
+from company_info.benchmarks.runner import DEFAULT_THRESHOLD, compare, run_benchmarks
+from company_info.benchmarks.scenarios import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = (
+        "Esegue i benchmark (vedi company_info.benchmarks) su un database di test con dati "
+        "sintetici e uno stub locale dei servizi esterni, e scrive i risultati in JSON."
+    )
+
+    def add_arguments(self, parser):
+        defaults = DatasetSize()
+        parser.add_argument('--companies', type=int, default=defaults.companies)
+        parser.add_argument('--assessments', type=int, default=defaults.assessments)
+        parser.add_argument('--kinds', type=int, default=defaults.kinds)
+        parser.add_argument('--checklist-items', type=int, default=defaults.checklist_items,
+                            help="Voci di checklist per valutazione")
+        parser.add_argument('--contractors', type=int, default=1000, help="Contractor nel feed dello stub")
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help="Latenza (secondi) di ogni risposta dello stub")
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=sorted(SCENARIOS),
+                            help="Scenario da eseguire (ripetibile, default: tutti)")
+        parser.add_argument('--repeat', type=int, default=5, help="Ripetizioni cronometrate per scenario")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="File JSON dei risultati (default: standard output)")
+        parser.add_argument('--baseline', help="File JSON di un'esecuzione precedente da confrontare")
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help="Peggioramento relativo della mediana oltre il quale segnalare una regressione")
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help="Esce con errore se il confronto rileva regressioni")
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat deve essere almeno 1")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        size = DatasetSize(
+            companies=options['companies'],
+            assessments=options['assessments'],
+            kinds=options['kinds'],
+            checklist_items=options['checklist_items'],
+        )
+        log = (lambda message: self.stderr.write(message)) if options['verbosity'] > 1 else None
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            result = run_benchmarks(
+                size, options['scenarios'], repeat=options['repeat'], seed=options['seed'],
+                contractors=options['contractors'], latency=options['latency'], log=log,
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        content = json.dumps(result, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(content + '\n')
+        else:
+            self.stdout.write(content)
+
+        if baseline is not None:
+            self.report(compare(result, baseline, options['threshold']), options['fail_on_regression'])
+
+    def report(self, rows, fail_on_regression):
+        regressions = 0
+        for name, previous, current, ratio, regression in rows:
+            line = f"{name:<28} {previous:>10.1f} ms -> {current:>10.1f} ms  ({ratio:.2f}x)"
+            if regression:
+                regressions += 1
+                self.stderr.write(self.style.ERROR(line + "  REGRESSIONE"))
+            else:
+                self.stderr.write(line)
+        if regressions and fail_on_regression:
+            raise CommandError(f"{regressions} scenari peggiorati oltre la soglia")
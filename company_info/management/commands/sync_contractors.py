@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from company_info.jobs import SyncJobConflict, claim_next_job, run_sync_job, start_contractors_sync
+
+
+class Command(BaseCommand):
+    help = (
+        "Sincronizza le aziende dal servizio esterno dei contractor. "
+        "Con --worker preleva ed esegue i job in attesa registrati dall'API."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--worker', action='store_true',
+                            help="Esegue i job PENDING invece di avviarne uno nuovo")
+        parser.add_argument('--once', action='store_true',
+                            help="Con --worker, termina quando non ci sono più job in attesa")
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help="Con --worker, secondi di attesa tra due controlli")
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self.run_worker(options['once'], options['poll_interval'])
+
+        try:
+            job = start_contractors_sync(runner='db')
+        except SyncJobConflict as e:
+            raise CommandError(str(e))
+        job = claim_next_job()
+        if job is None:
+            raise CommandError("Job preso in carico da un altro worker")
+        self.report(run_sync_job(job))
+
+    def run_worker(self, once, poll_interval):
+        while True:
+            job = claim_next_job()
+            if job is not None:
+                self.report(run_sync_job(job))
+            elif once:
+                return
+            else:
+                time.sleep(poll_interval)
+
+    def report(self, job):
+        message = (
+            f"Job {job.pk}: {job.get_status_display()} - "
+            f"{job.created} create, {job.updated} aggiornate, {job.unchanged} invariate, "
+            f"{job.failed} scartate, {job.missing} assenti dal feed"
+        )
+        if job.error:
+            self.stderr.write(f"{message}\n{job.error}")
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,372 @@
+"""
+Strumentazione delle richieste ed endpoint /metrics in formato Prometheus.
+
+MetricsMiddleware registra per ogni richiesta, in un oggetto RequestMetrics
+legato a una contextvar:
+- numero e durata delle query (execute_wrapper installato su ogni nuova
+  connessione, attivo solo se c'è una richiesta in corso);
+- numero e latenza delle chiamate HTTP ai servizi esterni (hook di risposta
+  delle sessioni requests, vedi `instrument_session`, oppure
+  `record_upstream_call` per i client asincroni);
+- tempo di serializzazione (rendering delle risposte DRF e TemplateResponse,
+  qualunque sia il renderer) e dimensione della risposta.
+Le operazioni eseguite in altri thread (ad esempio le ricerche parallele sul
+servizio esterno, o le sezioni sync_to_async delle view asincrone) vengono
+attribuite alla richiesta se eseguite in una copia del contesto
+(`contextvars.copy_context().run`, già usata da asgiref). Il middleware
+supporta sia WSGI sia ASGI. Anche i job di
+sincronizzazione usano `track()`, con view 'sync_job'.
+
+I valori confluiscono nel registro del processo, esposto da `metrics_view`:
+istogrammi delle durate per view e action e contatori per query, chiamate
+esterne, serializzazione e byte. Il registro è per processo: con più worker
+ognuno va interrogato separatamente.
+
+Le richieste più lente di METRICS_SLOW_REQUEST_THRESHOLD secondi vengono
+registrate (logger 'company_info.metrics') con le query più costose.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DEFAULT_SLOW_REQUEST_THRESHOLD = 1.0
+DEFAULT_SLOW_REQUEST_TOP_QUERIES = 5
+# Oltre questo numero di statement distinti le query vengono solo contate
+MAX_TRACKED_STATEMENTS = 200
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current = ContextVar('company_info_request_metrics', default=None)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class RequestMetrics:
+    """
+    Misure di una richiesta (o di un job). I metodi record_* possono essere
+    chiamati da più thread.
+    """
+
+    def __init__(self, view='unresolved', action=''):
+        self.view = view
+        self.action = action
+        self.duration = 0.0
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.upstream_calls = 0
+        self.upstream_time = 0.0
+        self.serialization_time = 0.0
+        self.response_size = 0
+        self.statements = {}
+        self._lock = threading.Lock()
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.db_queries += 1
+                self.db_time += elapsed
+                totals = self.statements.get(sql)
+                if totals is not None:
+                    totals[0] += 1
+                    totals[1] += elapsed
+                elif len(self.statements) < MAX_TRACKED_STATEMENTS:
+                    self.statements[sql] = [1, elapsed]
+
+    def record_upstream(self, elapsed):
+        with self._lock:
+            self.upstream_calls += 1
+            self.upstream_time += elapsed
+
+    def record_serialization(self, elapsed):
+        with self._lock:
+            self.serialization_time += elapsed
+
+    def top_statements(self, limit):
+        """
+        (sql, esecuzioni, secondi totali) degli statement più costosi.
+        """
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return [(sql, count, total) for sql, (count, total) in ranked[:limit]]
+
+
+def current():
+    return _current.get()
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.record_query(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def _install_query_recorder(sender, connection, **kwargs):
+    # La lista dei wrapper sopravvive alle riconnessioni
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+for _connection in connections.all(initialized_only=True):
+    _install_query_recorder(None, _connection)
+
+
+@contextmanager
+def track(view='unresolved', action=''):
+    """
+    Raccoglie le misure delle operazioni eseguite nel blocco (e nelle copie del contesto).
+    """
+    metrics = RequestMetrics(view, action)
+    token = _current.set(metrics)
+    started = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        metrics.duration = time.perf_counter() - started
+        _current.reset(token)
+
+
+def record_upstream_call(url, elapsed):
+    """
+    Registra una chiamata a un servizio esterno durata `elapsed` secondi.
+    """
+    REGISTRY.record_upstream(urlsplit(str(url)).hostname or '', elapsed)
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.record_upstream(elapsed)
+
+
+def _record_response(response, *args, **kwargs):
+    record_upstream_call(response.url, response.elapsed.total_seconds())
+
+
+def instrument_session(session):
+    """
+    Registra le chiamate fatte con `session` (requests) nelle metriche.
+    """
+    session.hooks['response'].append(_record_response)
+    return session
+
+
+# Registro in formato Prometheus
+
+def _labels(names, values, extra=''):
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.values = {}
+
+    def inc(self, labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{_labels(self.label_names, labels)} {value}')
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, labels, value):
+        counts = self.values.get(labels)
+        if counts is None:
+            # Conteggi per bucket, somma e conteggio totale
+            counts = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[0][index] += 1
+        counts[1] += value
+        counts[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, (bucket_counts, total, count) in sorted(self.values.items()):
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le)} {bucket_count}')
+            le = 'le="+Inf"'
+            lines.append(f'{self.name}_bucket{_labels(self.label_names, labels, le)} {count}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, labels)} {count}')
+        return lines
+
+
+class Registry:
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        labels = ('view', 'action')
+        self.request_duration = Histogram(
+            'company_info_request_duration_seconds', 'Durata delle richieste e dei job.', labels, buckets)
+        self.db_queries = Counter('company_info_db_queries_total', 'Query eseguite.', labels)
+        self.db_seconds = Counter('company_info_db_seconds_total', 'Tempo speso nelle query.', labels)
+        self.upstream_calls = Counter(
+            'company_info_upstream_calls_total', 'Chiamate ai servizi esterni.', labels)
+        self.upstream_seconds = Counter(
+            'company_info_upstream_seconds_total', 'Latenza delle chiamate ai servizi esterni.', labels)
+        self.serialization_seconds = Counter(
+            'company_info_serialization_seconds_total', 'Tempo di serializzazione delle risposte.', labels)
+        self.response_bytes = Counter('company_info_response_bytes_total', 'Byte delle risposte.', labels)
+        self.upstream_duration = Histogram(
+            'company_info_upstream_duration_seconds', 'Latenza delle chiamate ai servizi esterni per host.',
+            ('host',), buckets)
+        self._lock = threading.Lock()
+
+    @property
+    def families(self):
+        return [
+            self.request_duration, self.db_queries, self.db_seconds, self.upstream_calls,
+            self.upstream_seconds, self.serialization_seconds, self.response_bytes, self.upstream_duration,
+        ]
+
+    def record(self, metrics):
+        labels = (metrics.view, metrics.action)
+        with self._lock:
+            self.request_duration.observe(labels, metrics.duration)
+            self.db_queries.inc(labels, metrics.db_queries)
+            self.db_seconds.inc(labels, metrics.db_time)
+            self.upstream_calls.inc(labels, metrics.upstream_calls)
+            self.upstream_seconds.inc(labels, metrics.upstream_time)
+            self.serialization_seconds.inc(labels, metrics.serialization_time)
+            self.response_bytes.inc(labels, metrics.response_size)
+
+    def record_upstream(self, host, elapsed):
+        with self._lock:
+            self.upstream_duration.observe((host,), elapsed)
+
+    def render(self):
+        with self._lock:
+            lines = [line for family in self.families for line in family.render()]
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry(_setting('METRICS_HISTOGRAM_BUCKETS', DEFAULT_BUCKETS))
+
+
+def finish(metrics, label=None):
+    """
+    Registra le misure e, se l'operazione è lenta, le scrive nel log.
+    """
+    REGISTRY.record(metrics)
+    threshold = _setting('METRICS_SLOW_REQUEST_THRESHOLD', DEFAULT_SLOW_REQUEST_THRESHOLD)
+    if threshold is None or metrics.duration < threshold:
+        return
+    top = metrics.top_statements(_setting('METRICS_SLOW_REQUEST_TOP_QUERIES', DEFAULT_SLOW_REQUEST_TOP_QUERIES))
+    logger.warning(
+        "Richiesta lenta %s (%s.%s): %.3fs; %d query in %.3fs, %d chiamate esterne in %.3fs, "
+        "serializzazione %.3fs, %d byte%s",
+        label or '-', metrics.view, metrics.action, metrics.duration,
+        metrics.db_queries, metrics.db_time, metrics.upstream_calls, metrics.upstream_time,
+        metrics.serialization_time, metrics.response_size,
+        ''.join(f"\n  {total * 1000:.1f} ms / {count}x: {sql}" for sql, count, total in top),
+    )
+
+
+def view_labels(view_func, method):
+    """
+    (view, action) di una view: classe e action DRF, altrimenti il nome della funzione.
+    """
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__name__}', ''
+    actions = getattr(view_func, 'actions', None) or {}
+    return cls.__name__, actions.get(method.lower(), method.lower())
+
+
+class MetricsMiddleware:
+    """
+    Misura ogni richiesta (vedi modulo). Va messo per primo in MIDDLEWARE.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not _setting('METRICS_ENABLED', True):
+            return self.get_response(request)
+        with track() as metrics:
+            response = self.get_response(request)
+        self.finish(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        if not _setting('METRICS_ENABLED', True):
+            return await self.get_response(request)
+        with track() as metrics:
+            response = await self.get_response(request)
+        self.finish(request, response, metrics)
+        return response
+
+    def finish(self, request, response, metrics):
+        if not response.streaming:
+            metrics.response_size = len(response.content)
+        elif response.has_header('Content-Length'):
+            metrics.response_size = int(response['Content-Length'])
+        finish(metrics, f'{request.method} {request.path}')
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.view, metrics.action = view_labels(view_func, request.method)
+
+    def process_template_response(self, request, response):
+        # Essendo il primo middleware, questo hook è l'ultimo prima di
+        # response.render(): la callback misura il rendering di ogni risposta
+        metrics = _current.get()
+        if metrics is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(
+                lambda response: metrics.record_serialization(time.perf_counter() - started)
+            )
+        return response
+
+
+def metrics_view(request):
+    """
+    Metriche del processo in formato testo Prometheus.
+    """
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
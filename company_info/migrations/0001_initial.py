@@ -0,0 +1,102 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:23
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChecklistKind',
+            fields=[
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('rating', models.IntegerField(help_text='Valore di valutazione da 0 a 10', validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(10)])),
+            ],
+            options={
+                'verbose_name': 'Tipo di Checklist',
+                'verbose_name_plural': 'Tipi di Checklist',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Company',
+            fields=[
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('vat_number', models.CharField(max_length=16, verbose_name='P.IVA')),
+                ('legal_form', models.CharField(choices=[('SPA', 'Società per Azioni'), ('SRL', 'Società a Responsabilità Limitata'), ('SRLS', 'Società a Responsabilità Limitata Semplificata'), ('SNC', 'Società in Nome Collettivo'), ('SAS', 'Società in Accomandita Semplice'), ('DITTA_IND', 'Ditta Individuale'), ('COOP', 'Società Cooperativa'), ('ALTRO', 'Altro')], max_length=10, verbose_name='Forma giuridica')),
+                ('ateco_code', models.CharField(max_length=10, verbose_name='Codice Ateco')),
+                ('activity', models.CharField(blank=True, max_length=100, verbose_name='Attività')),
+                ('activity_description', models.TextField(blank=True, verbose_name='Descrizione Attività')),
+                ('annual_turnover', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True, verbose_name='Fatturato annuo')),
+                ('employees', models.PositiveIntegerField(blank=True, null=True, verbose_name='Numero di addetti')),
+                ('seasonality', models.CharField(blank=True, choices=[('NONE', 'Nessuna stagionalità'), ('SUMMER', 'Estiva'), ('WINTER', 'Invernale'), ('HOLIDAY', 'Periodi festivi'), ('CUSTOM', 'Personalizzata')], max_length=10, verbose_name='Stagionalità')),
+                ('address', models.CharField(blank=True, max_length=255, verbose_name='Indirizzo')),
+                ('city', models.CharField(blank=True, max_length=100, verbose_name='Città')),
+                ('postal_code', models.CharField(blank=True, max_length=10, verbose_name='Codice Postale')),
+                ('region', models.CharField(blank=True, max_length=100, verbose_name='Regione')),
+                ('country', models.CharField(blank=True, default='Italia', max_length=100, verbose_name='Paese')),
+                ('email', models.EmailField(blank=True, max_length=254, verbose_name='Email')),
+                ('phone', models.CharField(blank=True, max_length=20, verbose_name='Telefono')),
+                ('contact_person', models.CharField(blank=True, max_length=100, verbose_name='Persona di contatto')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Data di creazione')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Data di modifica')),
+            ],
+            options={
+                'verbose_name': 'Azienda',
+                'verbose_name_plural': 'Aziende',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UnderwritingAssessment',
+            fields=[
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('underwriting_year', models.IntegerField()),
+                ('risk_score', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('win_probability', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('customer_relation', models.CharField(blank=True, max_length=100, null=True)),
+                ('broker_relation', models.CharField(blank=True, max_length=100, null=True)),
+                ('similar_deals_won', models.IntegerField(blank=True, null=True)),
+                ('average_deal_size', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True)),
+                ('conversion_time', models.DurationField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='underwriting_assessments', to='company_info.company')),
+            ],
+            options={
+                'verbose_name': 'Underwriting Assessment',
+                'verbose_name_plural': 'Underwriting Assessments',
+                'ordering': ['-underwriting_year'],
+                'unique_together': {('company', 'underwriting_year')},
+            },
+        ),
+        migrations.CreateModel(
+            name='UnderwritingChecklist',
+            fields=[
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('value', models.IntegerField(help_text='Valore da 0 a 10', validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(10)])),
+                ('notes', models.TextField(blank=True, help_text='Note aggiuntive sulla verifica', null=True)),
+                ('is_compliant', models.BooleanField(default=True, help_text="Indica se l'azienda è conforme per questo aspetto")),
+                ('completed_by', models.CharField(blank=True, help_text='Nome della persona che ha completato la verifica', max_length=100, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('assessment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checklist_items', to='company_info.underwritingassessment')),
+                ('kind', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checklist_items', to='company_info.checklistkind')),
+            ],
+            options={
+                'verbose_name': 'Checklist Item',
+                'verbose_name_plural': 'Checklist Items',
+                'ordering': ['-created_at'],
+                'unique_together': {('assessment', 'kind')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company_info', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='company',
+            name='vat_number',
+            field=models.CharField(max_length=16, unique=True, verbose_name='P.IVA'),
+        ),
+    ]
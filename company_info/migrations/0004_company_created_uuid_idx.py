@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company_info', '0003_syncjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='company',
+            index=models.Index(fields=['created_at', 'uuid'], name='company_created_uuid_idx'),
+        ),
+    ]
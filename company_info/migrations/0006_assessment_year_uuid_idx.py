@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company_info', '0005_company_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='underwritingassessment',
+            index=models.Index(fields=['underwriting_year', 'uuid'], name='assessment_year_uuid_idx'),
+        ),
+    ]
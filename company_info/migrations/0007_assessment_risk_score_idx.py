@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company_info', '0006_assessment_year_uuid_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='underwritingassessment',
+            index=models.Index(fields=['risk_score'], name='assessment_risk_score_idx'),
+        ),
+    ]
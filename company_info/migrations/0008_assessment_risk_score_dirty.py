@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company_info', '0007_assessment_risk_score_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='underwritingassessment',
+            name='risk_score_dirty',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='underwritingassessment',
+            index=models.Index(condition=models.Q(('risk_score_dirty', True)), fields=['risk_score_dirty'], name='assessment_dirty_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:38
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company_info', '0008_assessment_risk_score_dirty'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioAggregate',
+            fields=[
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('underwriting_year', models.IntegerField()),
+                ('region', models.CharField(blank=True, max_length=100)),
+                ('legal_form', models.CharField(max_length=10)),
+                ('ateco_section', models.CharField(blank=True, max_length=1)),
+                ('assessments', models.PositiveIntegerField(default=0)),
+                ('total_turnover', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('risk_score_sum', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('risk_score_count', models.PositiveIntegerField(default=0)),
+                ('win_probability_sum', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('win_probability_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Aggregato di portafoglio',
+                'verbose_name_plural': 'Aggregati di portafoglio',
+                'ordering': ['underwriting_year', 'region', 'legal_form', 'ateco_section'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='portfolioaggregate',
+            constraint=models.UniqueConstraint(fields=('underwriting_year', 'region', 'legal_form', 'ateco_section'), name='portfolio_aggregate_key'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:43
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company_info', '0009_portfolioaggregate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyImport',
+            fields=[
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('dry_run', models.BooleanField(default=False)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('created', models.PositiveIntegerField(default=0)),
+                ('updated', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('error_report', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('duration', models.DurationField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Importazione aziende',
+                'verbose_name_plural': 'Importazioni aziende',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company_info', '0010_companyimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='content_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Impronta dati del feed'),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='missing_from_feed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Assente dal feed dal'),
+        ),
+        migrations.AddField(
+            model_name='syncjob',
+            name='missing',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='syncjob',
+            name='unchanged',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
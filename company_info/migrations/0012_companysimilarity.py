@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company_info', '0011_company_feed_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanySimilarity',
+            fields=[
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('ateco_code', models.CharField(blank=True, max_length=10)),
+                ('ateco_division', models.CharField(blank=True, max_length=2)),
+                ('ateco_section', models.CharField(blank=True, max_length=1)),
+                ('log_turnover', models.FloatField(blank=True, null=True)),
+                ('log_employees', models.FloatField(blank=True, null=True)),
+                ('region', models.CharField(blank=True, max_length=100)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='similarity', to='company_info.company')),
+            ],
+            options={
+                'verbose_name': 'Indice di similarità',
+                'verbose_name_plural': 'Indice di similarità',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:58
+
+import uuid
+
+from django.db import migrations, models
+
+
+def mark_synced_companies(apps, schema_editor):
+    # Le aziende già sincronizzate (con impronta) restano candidate a essere
+    # marcate come assenti dal feed: nessun job reale ha questo id
+    Company = apps.get_model('company_info', 'Company')
+    Company.objects.exclude(content_fingerprint='').update(last_seen_sync=uuid.UUID(int=0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('company_info', '0012_companysimilarity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='last_seen_sync',
+            field=models.UUIDField(blank=True, editable=False, null=True, verbose_name='Ultima sincronizzazione'),
+        ),
+        migrations.RunPython(mark_synced_companies, migrations.RunPython.noop),
+    ]
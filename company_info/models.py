@@ -1,10 +1,10 @@
-from django.db import models
-
-# company_info/models/base.py
-from django.db import models
-from django.db import models
 import uuid
-from django.core.validators import MaxLengthValidator, MinValueValidator, MaxValueValidator
+from contextlib import ExitStack, contextmanager
+from decimal import Decimal
+
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, transaction
+from django.utils import timezone
 
 
 class UUIDMixin(models.Model):
@@ -14,6 +14,137 @@ class UUIDMixin(models.Model):
         abstract = True
 
 
+# Campi che concorrono agli aggregati di portafoglio (vedi company_info.portfolio)
+PORTFOLIO_COMPANY_FIELDS = ('region', 'legal_form', 'ateco_code', 'annual_turnover')
+PORTFOLIO_ASSESSMENT_FIELDS = ('company_id', 'underwriting_year', 'risk_score', 'win_probability')
+PORTFOLIO_ASSESSMENT_FIELD_NAMES = {'company', *PORTFOLIO_ASSESSMENT_FIELDS}
+# Campi che concorrono all'indice di similarità (vedi company_info.similarity)
+SIMILARITY_COMPANY_FIELDS = ('ateco_code', 'annual_turnover', 'employees', 'region')
+COMPANY_DERIVED_FIELDS = tuple(dict.fromkeys(PORTFOLIO_COMPANY_FIELDS + SIMILARITY_COMPANY_FIELDS))
+# Campi scritti dalla sincronizzazione con il feed (vedi company_info.upsert):
+# ogni altra modifica azzera l'impronta, così la sincronizzazione successiva
+# riscrive i dati del feed
+FEED_SYNC_FIELDS = {'content_fingerprint', 'last_seen_sync', 'missing_from_feed_at', 'updated_at'}
+
+
+def refreshing_portfolio(assessments):
+    from .portfolio import refreshing
+
+    return refreshing(assessments)
+
+
+def refreshing_similarity(companies):
+    from .similarity import refreshing
+
+    return refreshing(companies)
+
+
+@contextmanager
+def refreshing_company_data(pks, fields, using=None):
+    """
+    Aggiorna, al termine del blocco, i dati derivati dalle aziende `pks`
+    (aggregati di portafoglio e indice di similarità) che dipendono da `fields`.
+    """
+    fields = set(fields)
+    with transaction.atomic(using=using), ExitStack() as stack:
+        if set(PORTFOLIO_COMPANY_FIELDS) & fields:
+            stack.enter_context(refreshing_portfolio(
+                UnderwritingAssessment.objects.using(using).filter(company__in=pks)
+            ))
+        if set(SIMILARITY_COMPANY_FIELDS) & fields:
+            stack.enter_context(refreshing_similarity(Company.objects.using(using).filter(pk__in=pks)))
+        yield
+
+
+def companies_changed(using=None):
+    """
+    Invalida al commit le risposte in cache delle aziende (vedi company_info.conditional).
+    """
+    from .conditional import invalidate
+
+    transaction.on_commit(invalidate, using=using)
+
+
+def checklist_kinds_changed(using=None):
+    """
+    Invalida il registro in memoria dei tipi di checklist (vedi company_info.checklist_kinds).
+    """
+    from .checklist_kinds import kinds_changed
+
+    kinds_changed(using=using)
+
+
+class CompanyQuerySet(models.QuerySet):
+    """
+    Le operazioni massive invalidano le risposte in cache, aggiornano updated_at
+    (da cui derivano i validatori dei GET condizionali) e, se toccano i campi
+    da cui dipendono, i gruppi di portafoglio e l'indice di similarità delle
+    aziende coinvolte.
+    """
+
+    def _refreshing_portfolio(self, companies):
+        return refreshing_portfolio(UnderwritingAssessment.objects.using(self.db).filter(company__in=companies))
+
+    def update(self, **kwargs):
+        kwargs.setdefault('updated_at', timezone.now())
+        if set(kwargs) - FEED_SYNC_FIELDS:
+            kwargs.setdefault('content_fingerprint', '')
+        companies_changed(self.db)
+        if not set(COMPANY_DERIVED_FIELDS) & set(kwargs):
+            return super().update(**kwargs)
+        with refreshing_company_data(list(self.values_list('pk', flat=True)), kwargs, self.db):
+            return super().update(**kwargs)
+
+    update.alters_data = True
+
+    def delete(self):
+        companies_changed(self.db)
+        # L'indice di similarità delle aziende eliminate si svuota in cascata
+        with self._refreshing_portfolio(list(self.values_list('pk', flat=True))):
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        companies_changed(self.db)
+        objs = list(objs)
+        if kwargs.get('update_conflicts') and 'content_fingerprint' not in (kwargs.get('update_fields') or ()):
+            # Upsert fuori dalla sincronizzazione: le righe senza impronta la azzerano
+            kwargs['update_fields'] = [*kwargs['update_fields'], 'content_fingerprint']
+        update_fields = set(kwargs.get('update_fields') or ())
+        companies = Company.objects.using(self.db).filter(vat_number__in=[obj.vat_number for obj in objs])
+        indexed = companies
+        if not kwargs.get('update_conflicts') or not set(SIMILARITY_COMPANY_FIELDS) & update_fields:
+            # Vanno indicizzate solo le aziende nuove
+            indexed = companies.filter(similarity__isnull=True)
+        with transaction.atomic(using=self.db), ExitStack() as stack:
+            if kwargs.get('update_conflicts') and set(PORTFOLIO_COMPANY_FIELDS) & update_fields:
+                # Solo le aziende già presenti (aggiornate) possono avere assessment
+                stack.enter_context(self._refreshing_portfolio(companies.values('pk')))
+            stack.enter_context(refreshing_similarity(indexed))
+            return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if 'updated_at' not in fields:
+            now = timezone.now()
+            for obj in objs:
+                obj.updated_at = now
+            fields = [*fields, 'updated_at']
+        if set(fields) - FEED_SYNC_FIELDS and 'content_fingerprint' not in fields:
+            for obj in objs:
+                obj.content_fingerprint = ''
+            fields = [*fields, 'content_fingerprint']
+        companies_changed(self.db)
+        if not set(COMPANY_DERIVED_FIELDS) & set(fields):
+            return super().bulk_update(objs, fields, *args, **kwargs)
+        with refreshing_company_data([obj.pk for obj in objs], fields, self.db):
+            return super().bulk_update(objs, fields, *args, **kwargs)
+
+    bulk_update.alters_data = True
+
+
 class Company(UUIDMixin, models.Model):
     # Scelte per campi con opzioni predefinite
     LEGAL_FORM_CHOICES = [
@@ -36,7 +167,7 @@ class Company(UUIDMixin, models.Model):
     ]
 
     # Informazioni Generali sul Rischio
-    vat_number = models.CharField(max_length=16, verbose_name="P.IVA", blank=False, null=False)
+    vat_number = models.CharField(max_length=16, verbose_name="P.IVA", blank=False, null=False, unique=True)
     legal_form = models.CharField(max_length=10, choices=LEGAL_FORM_CHOICES, verbose_name="Forma giuridica",
                                   blank=False, null=False)
     ateco_code = models.CharField(max_length=10, verbose_name="Codice Ateco", blank=False, null=False)
@@ -61,19 +192,123 @@ class Company(UUIDMixin, models.Model):
     phone = models.CharField(max_length=20, verbose_name="Telefono", blank=True)
     contact_person = models.CharField(max_length=100, verbose_name="Persona di contatto", blank=True)
 
+    # Sincronizzazione con il feed dei contractor (vedi company_info.upsert):
+    # impronta dei campi ricevuti, ultimo job che ha visto l'azienda e data da
+    # cui l'azienda non compare nel feed
+    content_fingerprint = models.CharField(max_length=64, verbose_name="Impronta dati del feed", blank=True,
+                                           editable=False)
+    last_seen_sync = models.UUIDField(verbose_name="Ultima sincronizzazione", blank=True, null=True,
+                                      editable=False)
+    missing_from_feed_at = models.DateTimeField(verbose_name="Assente dal feed dal", blank=True, null=True,
+                                                editable=False)
+
     # Metadati
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Data di creazione")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Data di modifica")
 
+    objects = CompanyQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Azienda"
         verbose_name_plural = "Aziende"
         ordering = ['-created_at']
+        indexes = [
+            # Chiave della paginazione keyset della lista aziende
+            models.Index(fields=['created_at', 'uuid'], name='company_created_uuid_idx'),
+            # Filtri della lista aziende (vedi company_info/filters.py)
+            models.Index(fields=['ateco_code'], name='company_ateco_idx'),
+            models.Index(fields=['region', 'ateco_code'], name='company_region_ateco_idx'),
+            models.Index(fields=['legal_form', 'annual_turnover'], name='company_legal_turnover_idx'),
+            models.Index(fields=['seasonality'], name='company_seasonality_idx'),
+            models.Index(fields=['annual_turnover'], name='company_turnover_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_derived_values = tuple(instance.__dict__.get(field) for field in COMPANY_DERIVED_FIELDS)
+        return instance
+
+    def save(self, *args, **kwargs):
+        companies_changed(kwargs.get('using'))
+        # La sincronizzazione non passa da save: ogni salvataggio è una modifica locale
+        self.content_fingerprint = ''
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'content_fingerprint'}
+        current = tuple(self.__dict__.get(field) for field in COMPANY_DERIVED_FIELDS)
+        loaded = getattr(self, '_loaded_derived_values', None)
+        if self._state.adding:
+            # Un'azienda nuova non ha ancora assessment da aggregare, va solo indicizzata
+            changed = SIMILARITY_COMPANY_FIELDS
+        elif loaded is None:
+            changed = COMPANY_DERIVED_FIELDS
+        else:
+            changed = [field for field, old, new in zip(COMPANY_DERIVED_FIELDS, loaded, current) if old != new]
+        if not changed:
+            super().save(*args, **kwargs)
+        else:
+            with refreshing_company_data([self.pk], changed, kwargs.get('using')):
+                super().save(*args, **kwargs)
+        self._loaded_derived_values = current
+
+    def delete(self, *args, **kwargs):
+        companies_changed(kwargs.get('using'))
+        with refreshing_portfolio(UnderwritingAssessment.objects.filter(company_id=self.pk)):
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"{self.vat_number} - {self.activity}"
 
 
+class UnderwritingAssessmentQuerySet(models.QuerySet):
+
+    def mark_risk_score_dirty(self):
+        """
+        Segna gli assessment come da ricalcolare e pianifica il ricalcolo al commit
+        (vedi company_info.scoring.schedule_recompute).
+        """
+        from .scoring import schedule_recompute
+
+        count = self.filter(risk_score_dirty=False).update(risk_score_dirty=True)
+        transaction.on_commit(schedule_recompute, using=self.db)
+        return count
+
+    # Le operazioni massive che toccano i campi aggregati aggiornano i gruppi di portafoglio
+
+    def _refreshing_portfolio(self, pks):
+        return refreshing_portfolio(UnderwritingAssessment.objects.using(self.db).filter(pk__in=pks))
+
+    def update(self, **kwargs):
+        if not PORTFOLIO_ASSESSMENT_FIELD_NAMES & set(kwargs):
+            return super().update(**kwargs)
+        with self._refreshing_portfolio(list(self.values_list('pk', flat=True))):
+            return super().update(**kwargs)
+
+    update.alters_data = True
+
+    def delete(self):
+        with self._refreshing_portfolio(list(self.values_list('pk', flat=True))):
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with self._refreshing_portfolio([obj.pk for obj in objs]):
+            return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if not PORTFOLIO_ASSESSMENT_FIELD_NAMES & set(fields):
+            return super().bulk_update(objs, fields, *args, **kwargs)
+        with self._refreshing_portfolio([obj.pk for obj in objs]):
+            # I gruppi vengono aggiornati una volta sola, non a ogni blocco di update
+            return models.QuerySet(self.model, using=self.db).bulk_update(objs, fields, *args, **kwargs)
+
+    bulk_update.alters_data = True
+
+
 class UnderwritingAssessment(UUIDMixin, models.Model):
     # Nuovo modello per i campi restanti, legati alla valutazione di underwriting
 
@@ -88,21 +323,94 @@ class UnderwritingAssessment(UUIDMixin, models.Model):
     similar_deals_won = models.IntegerField(blank=True, null=True)
     average_deal_size = models.DecimalField(max_digits=15, decimal_places=2, blank=True, null=True)
     conversion_time = models.DurationField(blank=True, null=True)
+    # risk_score non più allineato alla checklist, in attesa di ricalcolo
+    risk_score_dirty = models.BooleanField(default=False, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = UnderwritingAssessmentQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Underwriting Assessment'
         verbose_name_plural = 'Underwriting Assessments'
         # Garantire che ogni valutazione sia unica per compagnia e anno
         unique_together = ['company', 'underwriting_year']
         ordering = ['-underwriting_year']
+        indexes = [
+            # Chiave della paginazione keyset e delle elaborazioni per anno
+            models.Index(fields=['underwriting_year', 'uuid'], name='assessment_year_uuid_idx'),
+            # Filtro per risk_score nell'admin
+            models.Index(fields=['risk_score'], name='assessment_risk_score_idx'),
+            # Coda degli assessment da ricalcolare: indice parziale, resta piccolo
+            models.Index(fields=['risk_score_dirty'], condition=models.Q(risk_score_dirty=True),
+                         name='assessment_dirty_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_portfolio_values = tuple(
+            instance.__dict__.get(field) for field in PORTFOLIO_ASSESSMENT_FIELDS
+        )
+        return instance
+
+    def save(self, *args, **kwargs):
+        current = tuple(self.__dict__.get(field) for field in PORTFOLIO_ASSESSMENT_FIELDS)
+        if current == getattr(self, '_loaded_portfolio_values', None):
+            super().save(*args, **kwargs)
+        else:
+            with refreshing_portfolio(UnderwritingAssessment.objects.filter(pk=self.pk)):
+                super().save(*args, **kwargs)
+        self._loaded_portfolio_values = current
+
+    def delete(self, *args, **kwargs):
+        with refreshing_portfolio(UnderwritingAssessment.objects.filter(pk=self.pk)):
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"{self.company.vat_number} - Assessment {self.underwriting_year}"
 
 
+class ChecklistKindQuerySet(models.QuerySet):
+    """
+    Anche le operazioni massive invalidano il registro dei tipi.
+    """
+
+    def update(self, **kwargs):
+        checklist_kinds_changed(self.db)
+        if 'rating' not in kwargs:
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            UnderwritingAssessment.objects.using(self.db).filter(
+                checklist_items__kind__in=self.values('pk')
+            ).mark_risk_score_dirty()
+            return super().update(**kwargs)
+
+    update.alters_data = True
+
+    def delete(self):
+        checklist_kinds_changed(self.db)
+        with transaction.atomic(using=self.db):
+            UnderwritingAssessment.objects.using(self.db).filter(
+                checklist_items__kind__in=self.values('pk')
+            ).mark_risk_score_dirty()
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        checklist_kinds_changed(self.db)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        checklist_kinds_changed(self.db)
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    bulk_update.alters_data = True
+
+
 class ChecklistKind(UUIDMixin, models.Model):
     """
     Rappresenta i diversi tipi di verifiche che possono essere eseguite nella checklist.
@@ -114,6 +422,31 @@ class ChecklistKind(UUIDMixin, models.Model):
         help_text="Valore di valutazione da 0 a 10"
     )
 
+    objects = ChecklistKindQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rating = instance.__dict__.get('rating')
+        return instance
+
+    def save(self, *args, **kwargs):
+        rating_changed = not self._state.adding and self.rating != getattr(self, '_loaded_rating', None)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            checklist_kinds_changed(kwargs.get('using'))
+            if rating_changed:
+                # Il rating è il peso del tipo nel risk_score di chi lo usa
+                UnderwritingAssessment.objects.filter(checklist_items__kind=self).mark_risk_score_dirty()
+        self._loaded_rating = self.rating
+
+    def delete(self, *args, **kwargs):
+        # Le voci di checklist vengono eliminate in cascata senza passare da delete()
+        with transaction.atomic(using=kwargs.get('using')):
+            UnderwritingAssessment.objects.filter(checklist_items__kind=self).mark_risk_score_dirty()
+            checklist_kinds_changed(kwargs.get('using'))
+            return super().delete(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -123,6 +456,60 @@ class ChecklistKind(UUIDMixin, models.Model):
         ordering = ['name']
 
 
+# Campi della checklist che concorrono al risk_score dell'assessment
+RISK_SCORE_FIELDS = ('assessment_id', 'kind_id', 'value', 'is_compliant')
+RISK_SCORE_FIELD_NAMES = {'assessment', 'kind', *RISK_SCORE_FIELDS}
+
+
+class UnderwritingChecklistQuerySet(models.QuerySet):
+    """
+    Le operazioni massive (che non passano da save/delete) segnano anch'esse
+    come da ricalcolare gli assessment coinvolti.
+    """
+
+    def _mark_dirty(self, assessments):
+        UnderwritingAssessment.objects.using(self.db).filter(pk__in=assessments).mark_risk_score_dirty()
+
+    def update(self, **kwargs):
+        if not RISK_SCORE_FIELD_NAMES & set(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            self._mark_dirty(list(self.order_by().values_list('assessment_id', flat=True).distinct()))
+            rows = super().update(**kwargs)
+            new_assessment = kwargs.get('assessment', kwargs.get('assessment_id'))
+            if new_assessment is not None:
+                self._mark_dirty([getattr(new_assessment, 'pk', new_assessment)])
+            return rows
+
+    update.alters_data = True
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            self._mark_dirty(list(self.order_by().values_list('assessment_id', flat=True).distinct()))
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            self._mark_dirty({obj.assessment_id for obj in objs})
+        return created
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if not RISK_SCORE_FIELD_NAMES & set(fields):
+            return super().bulk_update(objs, fields, *args, **kwargs)
+        with transaction.atomic(using=self.db):
+            previous = self.filter(pk__in=[obj.pk for obj in objs]).values_list('assessment_id', flat=True)
+            self._mark_dirty(set(previous) | {obj.assessment_id for obj in objs})
+            return super().bulk_update(objs, fields, *args, **kwargs)
+
+    bulk_update.alters_data = True
+
+
 class UnderwritingChecklist(UUIDMixin, models.Model):
     """
     Rappresenta le righe della checklist di sottoscrizione associate a una valutazione di underwriting.
@@ -156,6 +543,8 @@ class UnderwritingChecklist(UUIDMixin, models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = UnderwritingChecklistQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Checklist Item'
         verbose_name_plural = 'Checklist Items'
@@ -163,5 +552,188 @@ class UnderwritingChecklist(UUIDMixin, models.Model):
         # Evita duplicazione dello stesso tipo di checklist per lo stesso assessment
         unique_together = ['assessment', 'kind']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_score_values = tuple(instance.__dict__.get(field) for field in RISK_SCORE_FIELDS)
+        return instance
+
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, '_loaded_score_values', None)
+        current = tuple(self.__dict__.get(field) for field in RISK_SCORE_FIELDS)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if current != loaded:
+                assessments = {self.assessment_id, loaded[0] if loaded else None} - {None}
+                UnderwritingAssessment.objects.filter(pk__in=assessments).mark_risk_score_dirty()
+        self._loaded_score_values = current
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            UnderwritingAssessment.objects.filter(pk=self.assessment_id).mark_risk_score_dirty()
+            return super().delete(*args, **kwargs)
+
+    def __str__(self):
+        # Il nome del tipo viene dal registro in memoria, senza query
+        from .checklist_kinds import get_kind
+
+        kind = get_kind(self.kind_id) or self.kind
+        return f"{kind.name}: {self.value}/10 - {self.assessment.company.vat_number}"
+
+
+class SyncJob(UUIDMixin, models.Model):
+    """
+    Esecuzione in background di una sincronizzazione con un servizio esterno.
+    Un vincolo parziale impedisce che due job dello stesso tipo siano attivi insieme.
+    """
+    KIND_CHOICES = [
+        ('CONTRACTORS', 'Contractor'),
+    ]
+
+    STATUS_PENDING = 'PENDING'
+    STATUS_RUNNING = 'RUNNING'
+    STATUS_SUCCEEDED = 'SUCCEEDED'
+    STATUS_FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'In attesa'),
+        (STATUS_RUNNING, 'In esecuzione'),
+        (STATUS_SUCCEEDED, 'Completato'),
+        (STATUS_FAILED, 'Fallito'),
+    ]
+    ACTIVE_STATUSES = [STATUS_PENDING, STATUS_RUNNING]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='CONTRACTORS')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+
+    # Avanzamento
+    processed = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    # Righe identiche a quelle salvate (impronta invariata), non riscritte
+    unchanged = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # Aziende del feed non più presenti, marcate a fine sincronizzazione
+    missing = models.PositiveIntegerField(default=0)
+    pages = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    # Aggiornato a ogni blocco: un job RUNNING senza heartbeat recenti è considerato abbandonato
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Sync Job'
+        verbose_name_plural = 'Sync Jobs'
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind'],
+                condition=models.Q(status__in=['PENDING', 'RUNNING']),
+                name='unique_active_sync_job',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} - {self.get_status_display()} ({self.created_at:%Y-%m-%d %H:%M})"
+
+
+class PortfolioAggregate(UUIDMixin, models.Model):
+    """
+    Aggregati di portafoglio per anno, regione, forma giuridica e sezione Ateco,
+    mantenuti da company_info.portfolio. Le medie si ricavano da somme e conteggi.
+    """
+    underwriting_year = models.IntegerField()
+    region = models.CharField(max_length=100, blank=True)
+    legal_form = models.CharField(max_length=10)
+    # Lettera della sezione Ateco, vuota se il codice non è riconosciuto
+    ateco_section = models.CharField(max_length=1, blank=True)
+
+    assessments = models.PositiveIntegerField(default=0)
+    total_turnover = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    risk_score_sum = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    risk_score_count = models.PositiveIntegerField(default=0)
+    win_probability_sum = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    win_probability_count = models.PositiveIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Aggregato di portafoglio'
+        verbose_name_plural = 'Aggregati di portafoglio'
+        ordering = ['underwriting_year', 'region', 'legal_form', 'ateco_section']
+        constraints = [
+            # Chiave del gruppo, usata anche come indice per le letture per anno
+            models.UniqueConstraint(fields=['underwriting_year', 'region', 'legal_form', 'ateco_section'],
+                                    name='portfolio_aggregate_key'),
+        ]
+
+    @property
+    def average_risk_score(self):
+        if not self.risk_score_count:
+            return None
+        return (self.risk_score_sum / self.risk_score_count).quantize(Decimal('0.01'))
+
+    @property
+    def average_win_probability(self):
+        if not self.win_probability_count:
+            return None
+        return (self.win_probability_sum / self.win_probability_count).quantize(Decimal('0.01'))
+
+    def __str__(self):
+        return f"{self.underwriting_year} {self.region} {self.legal_form} {self.ateco_section}"
+
+
+class CompanyImport(UUIDMixin, models.Model):
+    """
+    Importazione massiva di aziende da file (vedi company_info.imports), con il
+    report CSV delle righe scartate.
+    """
+    filename = models.CharField(max_length=255)
+    dry_run = models.BooleanField(default=False)
+
+    rows = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    # Righe scartate: riga, partita IVA, campo, errore
+    error_report = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    duration = models.DurationField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'Importazione aziende'
+        verbose_name_plural = 'Importazioni aziende'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.created_at:%Y-%m-%d %H:%M})"
+
+
+class CompanySimilarity(UUIDMixin, models.Model):
+    """
+    Caratteristiche di un'azienda per la ricerca delle aziende simili,
+    mantenute da company_info.similarity.
+    """
+    company = models.OneToOneField(Company, on_delete=models.CASCADE, related_name='similarity')
+    # Codice Ateco (solo cifre), divisione (prime due cifre) e sezione, vuota se sconosciuta
+    ateco_code = models.CharField(max_length=10, blank=True)
+    ateco_division = models.CharField(max_length=2, blank=True)
+    ateco_section = models.CharField(max_length=1, blank=True)
+    # log10(1 + valore), NULL se il valore manca
+    log_turnover = models.FloatField(blank=True, null=True)
+    log_employees = models.FloatField(blank=True, null=True)
+    region = models.CharField(max_length=100, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Indice di similarità'
+        verbose_name_plural = 'Indice di similarità'
+
     def __str__(self):
-        return f"{self.kind.name}: {self.value}/10 - {self.assessment.company.vat_number}"
+        return f"{self.company_id} ({self.ateco_code})"
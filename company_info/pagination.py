@@ -0,0 +1,190 @@
+"""
+Paginazione keyset (a cursore) per gli endpoint di lista.
+
+A differenza della paginazione per offset, ogni pagina viene letta con una
+condizione sulla chiave di ordinamento dell'ultima riga vista, per cui il
+costo resta proporzionale alla dimensione della pagina anche in profondità.
+L'ordinamento deve essere totale: l'ultimo campo deve essere univoco.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework import exceptions
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginazione keyset su una tupla di campi (ordering). I cursori codificano i
+    valori della chiave e la direzione di lettura (un cursore non valido risponde
+    400); il numero di righe per pagina si può scegliere con `?page_size=`.
+    """
+    ordering = ('-created_at', '-uuid')
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Cursore non valido'
+
+    def get_ordering(self, view):
+        return getattr(view, 'keyset_ordering', self.ordering)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(view)
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, queryset.model)
+
+        ordering = [self._invert(field) for field in self.ordering] if reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else position is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Cursore della pagina (dai link next/previous)',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Righe per pagina (massimo {self.max_page_size})',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+    # Cursori
+
+    def encode_cursor(self, row, reverse):
+        position = [_to_json(_value(row, field.lstrip('-'))) for field in self.ordering]
+        payload = json.dumps({'p': position, 'r': reverse}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            position = payload['p']
+            if len(position) != len(self.ordering):
+                raise ValueError
+            values = [
+                _to_python(model, field.lstrip('-'), value)
+                for field, value in zip(self.ordering, position)
+            ]
+            return values, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error, ValidationError):
+            raise exceptions.ValidationError({self.cursor_query_param: [self.invalid_cursor_message]})
+
+    # Condizioni keyset
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _after(ordering, position):
+        """
+        (a, b, c) > (x, y, z) espanso in OR di uguaglianze sui prefissi,
+        rispettando la direzione di ciascun campo.
+        """
+        condition = Q()
+        for index in reversed(range(len(ordering))):
+            field = ordering[index]
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            strict = Q(**{f'{name}__{lookup}': position[index]})
+            if index == len(ordering) - 1:
+                condition = strict
+            else:
+                condition = strict | (Q(**{name: position[index]}) & condition)
+        return condition
+
+
+def _value(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def _to_json(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (UUID, Decimal)):
+        return str(value)
+    return value
+
+
+def _to_python(model, name, value):
+    try:
+        return model._meta.get_field(name).to_python(value)
+    except FieldDoesNotExist:
+        # Campo calcolato (annotazione): il valore JSON è già utilizzabile
+        return value
+
+
+class CompanyCursorPagination(KeysetPagination):
+    ordering = ('-created_at', '-uuid')
+
+
+class AssessmentCursorPagination(KeysetPagination):
+    ordering = ('-underwriting_year', '-uuid')
@@ -0,0 +1,175 @@
+"""
+Aggregati di portafoglio materializzati (PortfolioAggregate).
+
+Una riga per combinazione di anno di underwriting, regione, forma giuridica e
+sezione Ateco, con numero di valutazioni, fatturato totale e somme/conteggi di
+risk_score e win_probability (le medie si ricavano da questi, così gli
+aggiornamenti restano esatti).
+
+Gli aggregati vengono aggiornati in modo incrementale: ogni scrittura su Company
+o UnderwritingAssessment che tocca campi aggregati (vedi i QuerySet e i metodi
+save/delete in company_info.models) gira dentro `refreshing()`, che ricalcola
+solo i gruppi in cui gli assessment coinvolti si trovavano prima e dopo la
+modifica. `rebuild()` ricostruisce l'intera tabella con un'unica query.
+"""
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, CharField, Count, Q, Sum, Value, When
+
+from .models import PortfolioAggregate, UnderwritingAssessment
+
+# Sezioni Ateco (NACE): intervalli di divisioni (prime due cifre del codice)
+ATECO_SECTIONS = {
+    'A': (1, 3), 'B': (5, 9), 'C': (10, 33), 'D': (35, 35), 'E': (36, 39),
+    'F': (41, 43), 'G': (45, 47), 'H': (49, 53), 'I': (55, 56), 'J': (58, 63),
+    'K': (64, 66), 'L': (68, 68), 'M': (69, 75), 'N': (77, 82), 'O': (84, 84),
+    'P': (85, 85), 'Q': (86, 88), 'R': (90, 93), 'S': (94, 96), 'T': (97, 98),
+    'U': (99, 99),
+}
+
+KEY_FIELDS = ('underwriting_year', 'region', 'legal_form', 'ateco_section')
+METRIC_FIELDS = (
+    'assessments', 'total_turnover', 'risk_score_sum', 'risk_score_count',
+    'win_probability_sum', 'win_probability_count',
+)
+_CENTS = Decimal('0.01')
+# Gruppi per query nel ricalcolo incrementale
+KEY_BATCH_SIZE = 200
+
+
+def ateco_section_range(section):
+    """
+    Intervallo [inizio, fine) dei codici Ateco della sezione: ':' segue le cifre
+    e il punto, quindi comprende tutti i codici dell'ultima divisione.
+    """
+    first, last = ATECO_SECTIONS[section]
+    return f'{first:02d}', f'{last:02d}:'
+
+
+def ateco_section_case(field='company__ateco_code'):
+    """
+    Espressione SQL con la sezione Ateco del codice in `field` ('' se sconosciuta).
+    """
+    whens = []
+    for section in ATECO_SECTIONS:
+        start, end = ateco_section_range(section)
+        whens.append(When(Q(**{f'{field}__gte': start, f'{field}__lt': end}), then=Value(section)))
+    return Case(*whens, default=Value(''), output_field=CharField())
+
+
+def _grouped(assessments):
+    return (
+        assessments
+        .order_by()
+        .annotate(ateco_section=ateco_section_case())
+        .values('underwriting_year', 'company__region', 'company__legal_form', 'ateco_section')
+    )
+
+
+def group_keys(assessments):
+    """
+    Chiavi (anno, regione, forma giuridica, sezione) dei gruppi degli assessment.
+    """
+    return set(_grouped(assessments).distinct().values_list(
+        'underwriting_year', 'company__region', 'company__legal_form', 'ateco_section'
+    ))
+
+
+def compute(assessments):
+    """
+    Aggregati degli assessment per gruppo, come istanze (non salvate) di PortfolioAggregate.
+    """
+    rows = _grouped(assessments).annotate(
+        assessments=Count('uuid'),
+        total_turnover=Sum('company__annual_turnover'),
+        risk_score_sum=Sum('risk_score'),
+        risk_score_count=Count('risk_score'),
+        win_probability_sum=Sum('win_probability'),
+        win_probability_count=Count('win_probability'),
+    )
+    return [
+        PortfolioAggregate(
+            underwriting_year=row['underwriting_year'],
+            region=row['company__region'],
+            legal_form=row['company__legal_form'],
+            ateco_section=row['ateco_section'],
+            assessments=row['assessments'],
+            total_turnover=_decimal(row['total_turnover']),
+            risk_score_sum=_decimal(row['risk_score_sum']),
+            risk_score_count=row['risk_score_count'],
+            win_probability_sum=_decimal(row['win_probability_sum']),
+            win_probability_count=row['win_probability_count'],
+        )
+        for row in rows
+    ]
+
+
+def _decimal(value):
+    return Decimal(value or 0).quantize(_CENTS)
+
+
+def _key(aggregate):
+    return tuple(getattr(aggregate, field) for field in KEY_FIELDS)
+
+
+def refresh(keys):
+    """
+    Ricalcola i gruppi indicati: aggiorna (o crea) quelli con assessment ed
+    elimina quelli rimasti vuoti.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    # Filtro sulle sole terne (anno, regione, forma giuridica) coinvolte, a
+    # blocchi per non comporre condizioni troppo lunghe; la sezione (ricavata
+    # dal codice Ateco) viene filtrata sul risultato
+    triples = list({key[:3] for key in keys})
+    aggregates = []
+    for start in range(0, len(triples), KEY_BATCH_SIZE):
+        condition = Q()
+        for year, region, legal_form in triples[start:start + KEY_BATCH_SIZE]:
+            condition |= Q(underwriting_year=year, company__region=region, company__legal_form=legal_form)
+        candidates = UnderwritingAssessment.objects.filter(condition)
+        aggregates += [aggregate for aggregate in compute(candidates) if _key(aggregate) in keys]
+
+    with transaction.atomic():
+        if aggregates:
+            PortfolioAggregate.objects.bulk_create(
+                aggregates,
+                update_conflicts=True,
+                unique_fields=list(KEY_FIELDS),
+                update_fields=[*METRIC_FIELDS, 'updated_at'],
+            )
+        empty = list(keys - {_key(aggregate) for aggregate in aggregates})
+        for start in range(0, len(empty), KEY_BATCH_SIZE):
+            condition = Q()
+            for key in empty[start:start + KEY_BATCH_SIZE]:
+                condition |= Q(**dict(zip(KEY_FIELDS, key)))
+            PortfolioAggregate.objects.filter(condition).delete()
+
+
+@contextmanager
+def refreshing(assessments):
+    """
+    Aggiorna, al termine del blocco, i gruppi in cui si trovavano gli
+    `assessments` prima e dopo il blocco. Il queryset viene valutato due volte:
+    deve individuare gli stessi assessment anche dopo la modifica (ad esempio
+    filtrando per chiave primaria).
+    """
+    with transaction.atomic():
+        before = group_keys(assessments)
+        yield
+        refresh(before | group_keys(assessments))
+
+
+def rebuild():
+    """
+    Ricostruisce da zero tutti gli aggregati. Restituisce il numero di gruppi.
+    """
+    aggregates = compute(UnderwritingAssessment.objects.all())
+    with transaction.atomic():
+        PortfolioAggregate.objects.all().delete()
+        PortfolioAggregate.objects.bulk_create(aggregates, batch_size=1000)
+    return len(aggregates)
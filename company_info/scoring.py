@@ -0,0 +1,219 @@
+"""
+Calcolo massivo di UnderwritingAssessment.risk_score.
+
+Per ogni assessment, date le voci di checklist con valore v (0-10), peso
+w = ChecklistKind.rating (0-10) e conformità:
+
+    qualità    = Σ w·v / Σ w            (media semplice dei valori se Σ w = 0)
+    rischio    = (10 - qualità) · 10     (0 = nessun rischio, 100 = massimo)
+    penalità   = Σ_{non conformi} RISK_SCORE_NON_COMPLIANT_PENALTY · w / 10
+    risk_score = min(100, rischio + penalità)
+
+Gli assessment senza checklist hanno risk_score NULL.
+
+Le somme vengono calcolate dal database con un'unica query aggregata
+(GROUP BY assessment); i punteggi sono poi calcolati in memoria colonna per
+colonna e scritti con bulk_update a blocchi, solo per gli assessment il cui
+punteggio è effettivamente cambiato.
+
+Ricalcolo incrementale: ogni modifica alla checklist (anche massiva) o al rating
+di un ChecklistKind segna gli assessment coinvolti con risk_score_dirty (vedi
+i QuerySet in company_info.models). Al commit viene pianificato un ricalcolo
+che raccoglie tutte le modifiche arrivate nel frattempo:
+- 'command' (predefinito): gli assessment segnati vengono ricalcolati da
+  `manage.py compute_risk_scores --dirty --watch`, fuori dai processi web;
+- 'thread': un timer nel processo, dopo RISK_SCORE_RECOMPUTE_DELAY secondi
+  (0 = subito, nello stesso thread). Il timer scrive nel database da un thread
+  in background: va usato solo dove non ci sono altri processi che scrivono
+  (ad esempio in sviluppo); cancel_scheduled() annulla il ricalcolo pendente.
+Con 'thread' il risk_score letto è in ritardo al più del tempo di attesa più
+la durata di un ricalcolo. Con 'command' il ritardo dipende dal comando: se
+`compute_risk_scores --dirty --watch` non è in esecuzione gli assessment
+restano segnati (e il risk_score vecchio) senza limite di tempo, finché un
+ricalcolo (incrementale o completo) non li riprende.
+"""
+import logging
+import threading
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, When
+
+from .models import UnderwritingAssessment, UnderwritingChecklist
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 2000
+DEFAULT_RECOMPUTE_DELAY = 2
+DEFAULT_RECOMPUTE_RUNNER = 'command'
+MAX_RISK_SCORE = 100
+_CENTS = Decimal('0.01')
+
+_timer = None
+_timer_lock = threading.Lock()
+
+
+def get_penalty():
+    return getattr(settings, 'RISK_SCORE_NON_COMPLIANT_PENALTY', 5)
+
+
+def compute_risk_scores(weighted, weights, values, counts, penalty_weights, penalty=None):
+    """
+    Calcola i punteggi a partire dalle colonne aggregate (liste parallele, una
+    posizione per assessment). Restituisce una lista di Decimal o None.
+    """
+    penalty = get_penalty() if penalty is None else penalty
+    scores = []
+    for weighted_sum, weight, value_sum, count, penalty_weight in zip(
+            weighted, weights, values, counts, penalty_weights):
+        if not count:
+            scores.append(None)
+            continue
+        quality = weighted_sum / weight if weight else value_sum / count
+        score = (10 - quality) * 10 + penalty * penalty_weight / 10
+        scores.append(Decimal(min(MAX_RISK_SCORE, max(0, score))).quantize(_CENTS))
+    return scores
+
+
+def aggregate_checklists(checklist_filter):
+    """
+    Somme per assessment delle voci di checklist che soddisfano `checklist_filter`,
+    come colonne parallele.
+    """
+    rows = (
+        UnderwritingChecklist.objects
+        .filter(**checklist_filter)
+        .order_by()
+        .values('assessment_id')
+        .annotate(
+            weighted=Sum(F('value') * F('kind__rating')),
+            weight=Sum('kind__rating'),
+            value_sum=Sum('value'),
+            count=Count('uuid'),
+            penalty_weight=Sum(Case(
+                When(is_compliant=False, then=F('kind__rating')),
+                default=0,
+                output_field=IntegerField(),
+            )),
+        )
+        .values_list('assessment_id', 'weighted', 'weight', 'value_sum', 'count', 'penalty_weight')
+    )
+    return list(zip(*rows)) or [(), (), (), (), (), ()]
+
+
+def recompute_risk_scores(underwriting_year=None, assessment_ids=None, batch_size=None):
+    """
+    Ricalcola il risk_score degli assessment di un anno di underwriting (o di tutti,
+    senza argomenti) con due query di lettura, oppure di quelli indicati in
+    `assessment_ids`, a blocchi. Restituisce i conteggi degli assessment valutati
+    e di quelli aggiornati.
+    """
+    batch_size = batch_size or getattr(settings, 'RISK_SCORE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    assessments = UnderwritingAssessment.objects.order_by()
+    checklist_filter = {}
+    if underwriting_year is not None:
+        assessments = assessments.filter(underwriting_year=underwriting_year)
+        checklist_filter['assessment__underwriting_year'] = underwriting_year
+
+    if assessment_ids is None:
+        return _recompute(assessments, checklist_filter, batch_size)
+
+    assessment_ids = list(assessment_ids)
+    result = {'scored': 0, 'updated': 0}
+    for start in range(0, len(assessment_ids), batch_size):
+        ids = assessment_ids[start:start + batch_size]
+        batch_result = _recompute(
+            assessments.filter(pk__in=ids), dict(checklist_filter, assessment_id__in=ids), batch_size
+        )
+        result['scored'] += batch_result['scored']
+        result['updated'] += batch_result['updated']
+    return result
+
+
+def _recompute(assessments, checklist_filter, batch_size):
+    with transaction.atomic():
+        # Come in recompute_dirty, il segno viene tolto prima di leggere la
+        # checklist: gli assessment ricalcolati qui non vengono ripresi dal
+        # ricalcolo incrementale, una modifica concorrente lo rimette
+        assessments.filter(risk_score_dirty=True).update(risk_score_dirty=False)
+        current = dict(assessments.values_list('pk', 'risk_score'))
+        assessment_ids, weighted, weights, values, counts, penalty_weights = aggregate_checklists(checklist_filter)
+        new_scores = dict.fromkeys(current)
+        new_scores.update(zip(assessment_ids, compute_risk_scores(weighted, weights, values, counts, penalty_weights)))
+
+        changed = [
+            UnderwritingAssessment(pk=pk, risk_score=score)
+            for pk, score in new_scores.items()
+            if pk in current and current[pk] != score
+        ]
+        if changed:
+            UnderwritingAssessment.objects.bulk_update(changed, ['risk_score'], batch_size=batch_size)
+    return {'scored': len(current), 'updated': len(changed)}
+
+
+def recompute_dirty(batch_size=None):
+    """
+    Ricalcola gli assessment segnati come da ricalcolare, a blocchi, finché ce
+    ne sono. Il segno viene tolto prima di leggere la checklist: una modifica
+    concorrente lo rimette e l'assessment viene ripreso al giro successivo.
+    """
+    batch_size = batch_size or getattr(settings, 'RISK_SCORE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    result = {'scored': 0, 'updated': 0}
+    while True:
+        with transaction.atomic():
+            ids = list(
+                UnderwritingAssessment.objects.filter(risk_score_dirty=True)
+                .order_by().values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                return result
+            UnderwritingAssessment.objects.filter(pk__in=ids).update(risk_score_dirty=False)
+            batch_result = recompute_risk_scores(assessment_ids=ids, batch_size=batch_size)
+        result['scored'] += batch_result['scored']
+        result['updated'] += batch_result['updated']
+
+
+def schedule_recompute():
+    """
+    Pianifica il ricalcolo degli assessment segnati. Le chiamate ravvicinate
+    vengono unite in un unico ricalcolo.
+    """
+    global _timer
+    if getattr(settings, 'RISK_SCORE_RECOMPUTE_RUNNER', DEFAULT_RECOMPUTE_RUNNER) != 'thread':
+        return
+    delay = getattr(settings, 'RISK_SCORE_RECOMPUTE_DELAY', DEFAULT_RECOMPUTE_DELAY)
+    if delay <= 0:
+        recompute_dirty()
+        return
+    with _timer_lock:
+        if _timer is not None:
+            return
+        _timer = threading.Timer(delay, _run_timer)
+        _timer.daemon = True
+        _timer.start()
+
+
+def cancel_scheduled():
+    """
+    Annulla il ricalcolo pianificato dal timer, se non è ancora partito.
+    """
+    global _timer
+    with _timer_lock:
+        timer, _timer = _timer, None
+    if timer is not None:
+        timer.cancel()
+        timer.join()
+
+
+def _run_timer():
+    global _timer
+    with _timer_lock:
+        _timer = None
+    try:
+        result = recompute_dirty()
+        logger.debug("Ricalcolo risk_score: %(scored)s calcolati, %(updated)s aggiornati", result)
+    except Exception:
+        logger.exception("Ricalcolo dei risk_score non riuscito")
+    finally:
+        connection.close()
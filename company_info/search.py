@@ -0,0 +1,205 @@
+"""
+Ricerca full-text sulle aziende.
+
+Su SQLite l'indice è una tabella virtuale FTS5 a contenuto esterno, allineata
+alla tabella delle aziende da trigger di INSERT/UPDATE/DELETE: resta quindi
+aggiornata anche con l'upsert massivo e con QuerySet.update(). Su PostgreSQL
+si usa un indice GIN sull'espressione to_tsvector dei campi indicizzati.
+
+L'indice viene (ri)creato da `install()` dopo ogni migrate, perché su SQLite
+alcune migrazioni ricostruiscono la tabella delle aziende eliminandone i trigger.
+
+Su SQLite l'indice fa riferimento alle aziende tramite il rowid implicito (la
+chiave primaria è un UUID): VACUUM può rinumerare i rowid e disallineare
+l'indice. Il database va quindi compattato con `manage.py rebuild_search_index
+--vacuum`, che dopo VACUUM ricostruisce l'indice (vedi `rebuild()`).
+"""
+import re
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Company
+
+SEARCH_FIELDS = (
+    'vat_number', 'activity', 'activity_description', 'address', 'city',
+    'contact_person', 'email', 'phone',
+)
+
+TABLE = Company._meta.db_table
+FTS_TABLE = f'{TABLE}_fts'
+PG_CONFIG = 'italian'
+PG_INDEX = 'company_search_idx'
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def _pg_document(alias=TABLE):
+    columns = " || ' ' || ".join(f'coalesce("{alias}"."{field}", \'\')' for field in SEARCH_FIELDS)
+    return f"to_tsvector('{PG_CONFIG}', {columns})"
+
+
+def _sqlite_insert_trigger():
+    columns = ', '.join(SEARCH_FIELDS)
+    new_values = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.rowid, {new_values}); END"
+    )
+
+
+def _sqlite_statements():
+    columns = ', '.join(SEARCH_FIELDS)
+    new_values = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+    old_values = ', '.join(f'old.{field}' for field in SEARCH_FIELDS)
+    delete_old = (
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+        f"VALUES ('delete', old.rowid, {old_values});"
+    )
+    insert_new = f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.rowid, {new_values});"
+    # Gli upsert riscrivono spesso righe identiche: l'indice si aggiorna solo se
+    # cambia un campo indicizzato
+    changed = ' OR '.join(f'old.{field} IS NOT new.{field}' for field in SEARCH_FIELDS)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({columns}, "
+        f"content='{TABLE}', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')",
+        _sqlite_insert_trigger(),
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN {delete_old} END",
+        f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+        f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {TABLE} WHEN {changed} "
+        f"BEGIN {delete_old} {insert_new} END",
+    ]
+
+
+def install(using=None, **kwargs):
+    """
+    Crea l'indice full-text se assente (idempotente). Su SQLite, se i trigger
+    mancavano, l'indice viene ricostruito dal contenuto della tabella.
+    """
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    if TABLE not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                [f'{FTS_TABLE}_a_'],
+            )
+            had_triggers = cursor.fetchone()[0] == 3
+            for statement in _sqlite_statements():
+                cursor.execute(statement)
+            if not had_triggers:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {PG_INDEX} ON "{TABLE}" USING GIN (({_pg_document()}))')
+
+
+def rebuild(using=None, vacuum=False):
+    """
+    Ricostruisce l'indice full-text dal contenuto della tabella delle aziende,
+    eseguendo prima VACUUM se richiesto. Su PostgreSQL l'indice GIN è
+    sull'espressione e non dipende dalla posizione delle righe: viene solo
+    eseguito VACUUM.
+    """
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    with connection.cursor() as cursor:
+        if vacuum:
+            cursor.execute('VACUUM')
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+@contextmanager
+def bulk_indexing(using=None):
+    """
+    Per gli inserimenti massivi su SQLite: il trigger di INSERT viene sospeso e
+    le nuove righe vengono indicizzate con un'unica istruzione chiamando la
+    funzione restituita, dopo ogni blocco scritto (un ordine di grandezza più
+    veloce del trigger riga per riga). Le righe nuove vanno indicizzate prima di
+    aggiornarle o eliminarle, perché i trigger presuppongono che siano già nell'indice.
+    Tutto avviene in una transazione, quindi le altre connessioni non vedono mai
+    la tabella senza trigger. Sugli altri database non fa nulla.
+    """
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    if connection.vendor != 'sqlite':
+        yield lambda: None
+        return
+
+    columns = ', '.join(SEARCH_FIELDS)
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(f'SELECT coalesce(max(rowid), 0) FROM "{TABLE}"')
+        last_rowid = [cursor.fetchone()[0]]
+        cursor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai')
+
+        def index_new_rows():
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE}(rowid, {columns}) '
+                f'SELECT rowid, {columns} FROM "{TABLE}" WHERE rowid > %s',
+                last_rowid,
+            )
+            cursor.execute(f'SELECT coalesce(max(rowid), 0) FROM "{TABLE}"')
+            last_rowid[0] = cursor.fetchone()[0]
+
+        yield index_new_rows
+        index_new_rows()
+        cursor.execute(_sqlite_insert_trigger())
+
+
+def build_query(text, vendor):
+    """
+    Traduce il testo libero in una query full-text: ogni parola è cercata come
+    prefisso (utile per la ricerca durante la digitazione) e tutte devono comparire.
+    Restituisce None se il testo non contiene parole.
+    """
+    tokens = _TOKEN.findall(text)
+    if not tokens:
+        return None
+    if vendor == 'postgresql':
+        return ' & '.join(f'{token}:*' for token in tokens)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_queryset(queryset, text, rank=True):
+    """
+    Filtra `queryset` (di Company) sulle aziende che corrispondono a `text` e,
+    con rank=True, aggiunge l'annotazione `search_rank` (più alto = più rilevante).
+    """
+    connection = connections[queryset.db]
+    query = build_query(text, connection.vendor)
+    if query is None:
+        return queryset.none()
+
+    if connection.vendor == 'postgresql':
+        tsquery = f"to_tsquery('{PG_CONFIG}', %s)"
+        queryset = queryset.filter(RawSQL(f'{_pg_document()} @@ {tsquery}', [query], output_field=BooleanField()))
+        if rank:
+            queryset = queryset.annotate(
+                search_rank=RawSQL(f'ts_rank({_pg_document()}, {tsquery})', [query], output_field=FloatField())
+            )
+        return queryset
+
+    if connection.vendor != 'sqlite':
+        # Nessun indice full-text disponibile: ricerca semplice sui campi
+        condition = Q()
+        for token in _TOKEN.findall(text):
+            token_condition = Q()
+            for field in SEARCH_FIELDS:
+                token_condition |= Q(**{f'{field}__icontains': token})
+            condition &= token_condition
+        queryset = queryset.filter(condition)
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())) if rank else queryset
+
+    queryset = queryset.filter(RawSQL(
+        f'"{TABLE}".rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)',
+        [query], output_field=BooleanField(),
+    ))
+    if rank:
+        # bm25 è negativo e più basso per i risultati migliori
+        queryset = queryset.annotate(search_rank=RawSQL(
+            f'(SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = "{TABLE}".rowid)',
+            [query], output_field=FloatField(),
+        ))
+    return queryset
@@ -1,9 +1,152 @@
 # serializers.py
 from rest_framework import serializers
-from .models import Company
+from rest_framework.reverse import reverse
+from .checklist_kinds import get_kind, get_kinds
+from .models import (
+    ChecklistKind, Company, CompanyImport, PortfolioAggregate, SyncJob, UnderwritingAssessment, UnderwritingChecklist,
+)
 
 
-class CompanySerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Permette al client di richiedere solo alcuni campi con `?fields=a,b,c`.
+    Vale solo per il serializer principale, non per quelli annidati.
+    """
+    fields_query_param = 'fields'
+
+    @classmethod
+    def get_requested_fields(cls, request):
+        """
+        Campi richiesti con `?fields=`, oppure None se il parametro è assente.
+        Solleva ValidationError per i campi sconosciuti.
+        """
+        if request is None or cls.fields_query_param not in request.query_params:
+            return None
+        requested = [name.strip() for name in request.query_params[cls.fields_query_param].split(',') if name.strip()]
+        available = cls().fields
+        unknown = [name for name in requested if name not in available]
+        if unknown:
+            raise serializers.ValidationError({cls.fields_query_param: [f"Campi sconosciuti: {', '.join(unknown)}"]})
+        return requested
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Il contesto con la request è disponibile solo per il serializer principale
+        request = self.context.get('request')
+        if request is not None and request.method == 'GET':
+            requested = self.get_requested_fields(request)
+            if requested is not None:
+                for name in set(self.fields) - set(requested):
+                    self.fields.pop(name)
+
+
+class CompanySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Company
         fields = '__all__'  # o lista specifica di campi
+
+
+class SyncJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SyncJob
+        fields = '__all__'
+
+
+class CompanyImportSerializer(serializers.ModelSerializer):
+    error_report_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CompanyImport
+        exclude = ['error_report']
+
+    def get_error_report_url(self, obj):
+        if not obj.failed:
+            return None
+        return reverse('company-import-errors', args=[obj.pk], request=self.context.get('request'))
+
+
+class PortfolioAggregateSerializer(serializers.ModelSerializer):
+    average_risk_score = serializers.DecimalField(max_digits=5, decimal_places=2, read_only=True)
+    average_win_probability = serializers.DecimalField(max_digits=5, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = PortfolioAggregate
+        fields = [
+            'underwriting_year', 'region', 'legal_form', 'ateco_section', 'assessments', 'total_turnover',
+            'average_risk_score', 'average_win_probability', 'updated_at',
+        ]
+
+
+class ChecklistKindSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChecklistKind
+        fields = '__all__'
+
+
+class RegistryKindField(serializers.Field):
+    """
+    Tipo di checklist in sola lettura, con la stessa rappresentazione di
+    ChecklistKindSerializer ma letto dal registro in memoria, senza query.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'kind_id')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        kind = get_kind(value)
+        if kind is None:
+            return None
+        return {'uuid': str(kind.uuid), 'name': kind.name, 'rating': kind.rating}
+
+
+class UnderwritingChecklistSerializer(serializers.ModelSerializer):
+    kind = RegistryKindField()
+
+    class Meta:
+        model = UnderwritingChecklist
+        exclude = ['assessment']
+
+
+class ChecklistSubmissionItemSerializer(serializers.ModelSerializer):
+    """
+    Voce della checklist inviata in blocco per un assessment: il tipo è indicato
+    per uuid e viene verificato sul registro in memoria dei tipi.
+    """
+    kind = serializers.UUIDField()
+
+    class Meta:
+        model = UnderwritingChecklist
+        fields = ['kind', 'value', 'is_compliant', 'notes', 'completed_by']
+
+
+class ChecklistSubmissionSerializer(serializers.Serializer):
+    items = ChecklistSubmissionItemSerializer(many=True, allow_empty=True)
+
+    def validate_items(self, items):
+        kinds = [item['kind'] for item in items]
+        if len(set(kinds)) != len(kinds):
+            raise serializers.ValidationError("Ogni tipo di checklist può comparire una sola volta")
+        known = get_kinds()
+        # Un tipo assente dal registro potrebbe essere stato appena creato altrove
+        unknown = {kind for kind in kinds if kind not in known and get_kind(kind) is None}
+        if unknown:
+            raise serializers.ValidationError(
+                f"Tipi di checklist inesistenti: {', '.join(sorted(str(kind) for kind in unknown))}"
+            )
+        return items
+
+
+class UnderwritingAssessmentSerializer(serializers.ModelSerializer):
+    """
+    Assessment con la checklist annidata (in sola lettura). Il viewset deve
+    precaricare company e checklist_items per evitare query N+1 (i tipi
+    vengono dal registro in memoria).
+    """
+    company_vat_number = serializers.CharField(source='company.vat_number', read_only=True)
+    checklist_items = UnderwritingChecklistSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = UnderwritingAssessment
+        fields = '__all__'
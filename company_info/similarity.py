@@ -0,0 +1,381 @@
+"""
+Indice di similarità tra aziende e stima delle trattative simili.
+
+Le caratteristiche di ogni azienda sono precalcolate in CompanySimilarity:
+- codice Ateco (solo cifre) con divisione (prime due cifre) e sezione;
+- log10(1 + fatturato) e log10(1 + addetti);
+- regione.
+La tabella viene aggiornata in modo incrementale: ogni scrittura su Company che
+tocca questi campi (vedi i QuerySet e save() in company_info.models) gira
+dentro `refreshing()`, che ricalcola le righe delle aziende coinvolte;
+`rebuild()` le ricalcola tutte.
+
+Distanza tra due aziende, somma pesata (WEIGHTS) di:
+    ateco      0 stesso codice, 0.25 stesso gruppo (tre cifre), 0.5 stessa
+               divisione, 0.75 stessa sezione, 1 altrimenti
+    fatturato  |Δ log10|, cioè le decadi di differenza (MISSING se manca)
+    addetti    |Δ log10| (MISSING se manca)
+    regione    0 se uguale, 1 altrimenti
+
+SimilarityIndex tiene in memoria le righe ordinate per fatturato, divise in
+blocchi per ogni livello della gerarchia Ateco (codice, gruppo, divisione,
+sezione, tutte). La ricerca dei k più vicini visita un blocco per livello,
+quello dell'azienda, fermandosi quando la distanza Ateco del livello supera
+la k-esima trovata; in ogni blocco la finestra si allarga attorno al
+fatturato dell'azienda finché nessuna riga fuori finestra può essere più
+vicina. Il risultato è esatto, ma di solito si visita una piccola parte dell'indice.
+
+`fill_similar_deals()` compila per un anno di underwriting, dalle trattative
+delle aziende più simili (assessment degli anni fino a quello indicato, vinte
+se hanno conversion_time):
+    similar_deals_won  trattative vinte
+    win_probability    percentuale di trattative vinte
+    average_deal_size  fatturato medio delle aziende delle trattative vinte
+"""
+import heapq
+import math
+from bisect import bisect_left
+from collections import namedtuple
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Q
+
+from .models import Company, CompanySimilarity, UnderwritingAssessment
+from .portfolio import ATECO_SECTIONS
+
+WEIGHTS = {'ateco': 2.0, 'turnover': 1.0, 'employees': 0.5, 'region': 0.5}
+# Differenza (in decadi) usata quando a una delle due aziende manca il valore
+MISSING = 1.0
+
+# Livelli della gerarchia Ateco: distanza Ateco tra righe dello stesso blocco
+# (ma non del blocco del livello precedente) e chiave del blocco
+ATECO_LEVELS = (
+    (0.0, lambda row: row.ateco_code),
+    (0.25, lambda row: row.ateco_code[:3]),
+    (0.5, lambda row: row.ateco_division),
+    (0.75, lambda row: row.ateco_section),
+    (1.0, lambda row: ''),
+)
+
+DEFAULT_NEIGHBOURS = 20
+DEFAULT_BATCH_SIZE = 2000
+FEATURE_FIELDS = ('ateco_code', 'ateco_division', 'ateco_section', 'log_turnover', 'log_employees', 'region')
+_CENTS = Decimal('0.01')
+
+Features = namedtuple('Features', ('company_id', *FEATURE_FIELDS))
+
+
+def get_batch_size(batch_size=None):
+    return batch_size or getattr(settings, 'SIMILARITY_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def _log(value):
+    return math.log10(1 + float(value)) if value is not None else None
+
+
+def ateco_section(division):
+    if division.isdigit():
+        for section, (first, last) in ATECO_SECTIONS.items():
+            if first <= int(division) <= last:
+                return section
+    return ''
+
+
+def company_features(ateco_code, annual_turnover, employees, region):
+    """
+    Valori dei campi di CompanySimilarity per un'azienda.
+    """
+    digits = ''.join(char for char in ateco_code or '' if char.isdigit())
+    return {
+        'ateco_code': digits,
+        'ateco_division': digits[:2],
+        'ateco_section': ateco_section(digits[:2]),
+        'log_turnover': _log(annual_turnover),
+        'log_employees': _log(employees),
+        'region': region or '',
+    }
+
+
+def refresh(companies, batch_size=None):
+    """
+    Ricalcola (o crea) le caratteristiche delle aziende del queryset `companies`.
+    """
+    batch_size = get_batch_size(batch_size)
+    rows = companies.order_by().values_list('pk', 'ateco_code', 'annual_turnover', 'employees', 'region')
+    batch = []
+    with transaction.atomic():
+        for pk, *values in rows.iterator(chunk_size=batch_size):
+            batch.append(CompanySimilarity(company_id=pk, **company_features(*values)))
+            if len(batch) >= batch_size:
+                _save(batch)
+                batch = []
+        if batch:
+            _save(batch)
+
+
+def _save(batch):
+    CompanySimilarity.objects.bulk_create(
+        batch, update_conflicts=True, unique_fields=['company'], update_fields=[*FEATURE_FIELDS, 'updated_at'],
+    )
+
+
+@contextmanager
+def refreshing(companies):
+    """
+    Ricalcola, al termine del blocco, le caratteristiche delle aziende del
+    queryset `companies` (valutato dopo la modifica). Le righe delle aziende
+    eliminate vengono eliminate in cascata.
+    """
+    with transaction.atomic():
+        yield
+        refresh(companies)
+
+
+def rebuild(batch_size=None):
+    """
+    Ricalcola le caratteristiche di tutte le aziende. Restituisce il numero di aziende.
+    """
+    refresh(Company.objects.all(), batch_size)
+    return CompanySimilarity.objects.count()
+
+
+def refresh_missing(batch_size=None):
+    """
+    Calcola le caratteristiche delle aziende che non le hanno ancora (ad esempio
+    quelle create prima dell'indice).
+    """
+    refresh(Company.objects.filter(similarity__isnull=True), batch_size)
+
+
+def _difference(a, b):
+    return MISSING if a is None or b is None else abs(a - b)
+
+
+def ateco_distance(a, b):
+    if a.ateco_code == b.ateco_code:
+        return 0.0
+    if a.ateco_division != b.ateco_division:
+        return 0.75 if a.ateco_section and a.ateco_section == b.ateco_section else 1.0
+    return 0.25 if a.ateco_code[:3] == b.ateco_code[:3] else 0.5
+
+
+def distance(a, b):
+    return (
+        WEIGHTS['ateco'] * ateco_distance(a, b)
+        + WEIGHTS['turnover'] * _difference(a.log_turnover, b.log_turnover)
+        + WEIGHTS['employees'] * _difference(a.log_employees, b.log_employees)
+        + WEIGHTS['region'] * (a.region != b.region)
+    )
+
+
+class _Block:
+    """
+    Righe di un blocco: quelle con fatturato, ordinate per fatturato, e quelle senza.
+    """
+
+    def __init__(self):
+        self.turnovers = []
+        self.rows = []
+        self.unknown = []
+
+    def add(self, row):
+        if row.log_turnover is None:
+            self.unknown.append(row)
+        else:
+            self.turnovers.append(row.log_turnover)
+            self.rows.append(row)
+
+
+class _Nearest:
+    """
+    I k candidati più vicini visti finora (heap con la distanza cambiata di segno).
+    """
+
+    def __init__(self, target, k, exclude):
+        self.target = target
+        self.k = k
+        self.exclude = exclude
+        self.heap = []
+
+    def bound(self):
+        # Distanza da battere per entrare tra i k più vicini
+        return -self.heap[0][0] if len(self.heap) >= self.k else math.inf
+
+    def offer(self, row):
+        if row.company_id in self.exclude:
+            return
+        item = (-distance(self.target, row), row.company_id)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, item)
+        elif item > self.heap[0]:
+            heapq.heapreplace(self.heap, item)
+
+    def result(self):
+        return sorted((-negative, company_id) for negative, company_id in self.heap)
+
+
+class SimilarityIndex:
+    """
+    Indice in memoria delle righe di CompanySimilarity (vedi modulo).
+    """
+
+    def __init__(self, rows):
+        self.features = {}
+        # Per ogni livello della gerarchia Ateco, blocchi per chiave del livello
+        self.levels = [{} for _ in ATECO_LEVELS]
+        for row in rows:
+            self.features[row.company_id] = row
+            for blocks, (_, key) in zip(self.levels, ATECO_LEVELS):
+                block = blocks.get(key(row))
+                if block is None:
+                    block = blocks[key(row)] = _Block()
+                block.add(row)
+
+    @classmethod
+    def load(cls, queryset=None):
+        """
+        Indice delle righe di `queryset` (default: tutte), lette con un'unica query
+        già ordinate per fatturato.
+        """
+        queryset = CompanySimilarity.objects.all() if queryset is None else queryset
+        # Le righe senza fatturato, comunque ordinate dal database, finiscono a parte
+        rows = queryset.order_by('log_turnover').values_list('company_id', *FEATURE_FIELDS)
+        return cls(Features(*row) for row in rows.iterator(chunk_size=DEFAULT_BATCH_SIZE))
+
+    def __len__(self):
+        return len(self.features)
+
+    def nearest(self, target, k, exclude=()):
+        """
+        Le `k` aziende più vicine a `target` (Features), escluse quelle in
+        `exclude`, come coppie (distanza, uuid dell'azienda) in ordine di distanza.
+        """
+        nearest = _Nearest(target, k, set(exclude))
+        # Le righe del livello precedente sono già state valutate
+        visited = None
+        for blocks, (level_distance, key) in zip(self.levels, ATECO_LEVELS):
+            floor = WEIGHTS['ateco'] * level_distance
+            if floor >= nearest.bound():
+                break
+            value = key(target)
+            if level_distance == 0.75 and not value:
+                # Senza sezione le divisioni diverse distano già 1
+                continue
+            if value in blocks:
+                self._search(blocks[value], nearest, floor, visited)
+            visited = (key, value)
+        return nearest.result()
+
+    def _search(self, block, nearest, floor, visited):
+        target = nearest.target.log_turnover
+
+        def offer(row):
+            if visited is None or visited[0](row) != visited[1]:
+                nearest.offer(row)
+
+        # Le righe senza fatturato distano almeno floor + MISSING
+        if floor + WEIGHTS['turnover'] * MISSING < nearest.bound():
+            for row in block.unknown:
+                offer(row)
+        if target is None:
+            if floor + WEIGHTS['turnover'] * MISSING < nearest.bound():
+                for row in block.rows:
+                    offer(row)
+            return
+
+        # Finestra che si allarga attorno al fatturato, verso il lato più vicino
+        turnovers = block.turnovers
+        right = bisect_left(turnovers, target)
+        left = right - 1
+        while left >= 0 or right < len(turnovers):
+            left_gap = target - turnovers[left] if left >= 0 else math.inf
+            right_gap = turnovers[right] - target if right < len(turnovers) else math.inf
+            if floor + WEIGHTS['turnover'] * min(left_gap, right_gap) >= nearest.bound():
+                return
+            if left_gap <= right_gap:
+                offer(block.rows[left])
+                left -= 1
+            else:
+                offer(block.rows[right])
+                right += 1
+
+
+def _reference_deals(underwriting_year):
+    """
+    Trattative di riferimento per azienda: (trattative, vinte, fatturato).
+    """
+    rows = (
+        UnderwritingAssessment.objects
+        .filter(underwriting_year__lte=underwriting_year)
+        .order_by()
+        .values('company_id')
+        .annotate(
+            deals=Count('uuid'),
+            won=Count('uuid', filter=Q(conversion_time__isnull=False)),
+            turnover=Max('company__annual_turnover'),
+        )
+        .values_list('company_id', 'deals', 'won', 'turnover')
+    )
+    return {company_id: (deals, won, turnover) for company_id, deals, won, turnover in rows}
+
+
+def similar_deals(neighbours, deals):
+    """
+    (similar_deals_won, average_deal_size, win_probability) dalle trattative
+    delle aziende `neighbours`, oppure tre None se non ce ne sono.
+    """
+    total = won = sized = 0
+    turnover_sum = Decimal(0)
+    for _, company_id in neighbours:
+        company_deals, company_won, turnover = deals[company_id]
+        total += company_deals
+        won += company_won
+        if company_won and turnover is not None:
+            sized += company_won
+            turnover_sum += company_won * turnover
+    if not total:
+        return None, None, None
+    average = (turnover_sum / sized).quantize(_CENTS) if sized else None
+    return won, average, (Decimal(100 * won) / total).quantize(_CENTS)
+
+
+def fill_similar_deals(underwriting_year, neighbours=None, batch_size=None):
+    """
+    Compila similar_deals_won, average_deal_size e win_probability degli
+    assessment di `underwriting_year` dalle trattative delle `neighbours`
+    aziende più simili. Restituisce i conteggi degli assessment valutati e di
+    quelli aggiornati.
+    """
+    neighbours = neighbours or getattr(settings, 'SIMILAR_DEALS_NEIGHBOURS', DEFAULT_NEIGHBOURS)
+    batch_size = get_batch_size(batch_size)
+    refresh_missing(batch_size)
+
+    deals = _reference_deals(underwriting_year)
+    index = SimilarityIndex.load(CompanySimilarity.objects.filter(
+        company__in=UnderwritingAssessment.objects.filter(underwriting_year__lte=underwriting_year).values('company_id')
+    ))
+    assessments = UnderwritingAssessment.objects.filter(underwriting_year=underwriting_year).order_by().values_list(
+        'pk', 'company_id', 'similar_deals_won', 'average_deal_size', 'win_probability',
+    )
+
+    scored = 0
+    changed = []
+    for pk, company_id, *current in assessments.iterator(chunk_size=batch_size):
+        scored += 1
+        target = index.features.get(company_id)
+        nearest = index.nearest(target, neighbours, exclude={company_id}) if target is not None else []
+        values = similar_deals(nearest, deals)
+        if tuple(current) != values:
+            won, average, probability = values
+            changed.append(UnderwritingAssessment(
+                pk=pk, similar_deals_won=won, average_deal_size=average, win_probability=probability,
+            ))
+    if changed:
+        with transaction.atomic():
+            UnderwritingAssessment.objects.bulk_update(
+                changed, ['similar_deals_won', 'average_deal_size', 'win_probability'], batch_size=batch_size,
+            )
+    return {'scored': scored, 'updated': len(changed)}
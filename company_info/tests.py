@@ -1,3 +1,1503 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import gzip
+import io
+import json
+import random
+import threading
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from unittest import skipUnless
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db import connections, transaction
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from . import lookup_cache
+from .admin import EstimatedCountPaginator, estimate_row_count
+from .checklist_kinds import KindRegistry, check_cache, get_kind, get_kinds
+from .contractors import ContractorsFeed, iter_json_array
+from .async_external import CompanyWriteBatcher, httpx
+from .benchmarks.data import DatasetSize, generate_companies, italian_vat_number, vat_check_digit
+from .benchmarks.runner import compare, run_benchmarks
+from .db_routing import PIN_COOKIE, reset_health
+from .external import CompanyNotFound, fetch_company_data
+from .fast_serialization import FastJSONRenderer
+from .filters import CompanyFilterBackend
+from .jobs import run_sync_job
+from .metrics import REGISTRY
+from . import portfolio, scoring
+from .models import (
+    ChecklistKind, Company, CompanySimilarity, PortfolioAggregate, SyncJob, UnderwritingAssessment,
+    UnderwritingChecklist,
+)
+from .scoring import recompute_risk_scores
+from . import search
+from .search import search_queryset
+from . import similarity
+from .serializers import CompanySerializer, UnderwritingChecklistSerializer
+from .upsert import bulk_upsert_companies, mark_missing
+
+
+class CompanyInfoStubHandler(BaseHTTPRequestHandler):
+    """
+    Stub del servizio esterno di informazioni aziendali:
+    - le partite IVA che iniziano con '404' non esistono;
+    - quelle che iniziano con 'FLAKY' rispondono 503 alla prima chiamata;
+    - le risposte hanno un ETag e rispondono 304 alle richieste condizionali.
+    """
+    protocol_version = 'HTTP/1.1'
+    calls = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        vat_number = parse_qs(urlparse(self.path).query)['vat_number'][0]
+        calls = self.calls[vat_number] = self.calls.get(vat_number, 0) + 1
+        if vat_number.startswith('404'):
+            return self.send_json(404, {'detail': 'Not found'})
+        if vat_number.startswith('FLAKY') and calls == 1:
+            return self.send_json(503, {'detail': 'Unavailable'})
+        etag = f'"{vat_number}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            return self.end_headers()
+        self.send_json(200, {
+            'vat_number': vat_number,
+            'legal_form': 'SRL',
+            'ateco_code': '47.11',
+            'activity': 'Commercio al dettaglio',
+            'annual_turnover': '1250000.00',
+            'employees': 12,
+            'city': 'Milano',
+        })
+
+    def send_json(self, status_code, data):
+        body = json.dumps(data).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        if status_code == 200:
+            self.send_header('ETag', f'"{data["vat_number"]}"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class CompanyInfoStubMixin:
+    """
+    Avvia lo stub del servizio esterno e vi punta le impostazioni.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), CompanyInfoStubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.service_url = f'http://127.0.0.1:{cls.server.server_port}/company-info'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        CompanyInfoStubHandler.calls = {}
+        settings_override = override_settings(
+            COMPANY_INFO_SERVICE_URL=self.service_url,
+            COMPANY_INFO_SERVICE_BACKOFF=0,
+            COMPANY_INFO_SERVICE_MAX_WORKERS=4,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        caches['company_lookups'].clear()
+        lookup_cache.reset_stats()
+
+
+class FetchFromExternalBatchTests(CompanyInfoStubMixin, TestCase):
+
+    def test_batch_lookup_reports_status_per_vat(self):
+        Company.objects.create(vat_number='00000000002', legal_form='SPA', ateco_code='10.11')
+
+        response = self.client.post(
+            '/api/companies/fetch_from_external_batch/',
+            {'vat_numbers': ['00000000001', '00000000002', '40400000000', '00000000001']},
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(result['vat_number'], result['status']) for result in response.json()['results']],
+            [('00000000001', 'created'), ('00000000002', 'updated'), ('40400000000', 'not_found')],
+        )
+        self.assertEqual(response.json()['summary'], {'created': 1, 'updated': 1, 'not_found': 1})
+        self.assertEqual(Company.objects.get(vat_number='00000000002').legal_form, 'SRL')
+
+    def test_transient_errors_are_retried(self):
+        response = self.client.post(
+            '/api/companies/fetch_from_external_batch/',
+            {'vat_numbers': ['FLAKY0000001']},
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.json()['results'][0]['status'], 'created')
+        self.assertEqual(CompanyInfoStubHandler.calls['FLAKY0000001'], 2)
+
+    def test_vat_number_is_normalized_before_saving(self):
+        url = '/api/companies/fetch_from_external/'
+        response = self.client.post(url, {'vat_number': 'IT 012.345.678.90'}, content_type='application/json')
+        self.assertEqual((response.status_code, response.json()['vat_number']), (201, '01234567890'))
+        response = self.client.post(url, {'vat_number': '01234567890'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(
+            '/api/companies/fetch_from_external_batch/',
+            {'vat_numbers': ['it01234567890', '01234567890', '00000000001']},
+            content_type='application/json',
+        )
+        self.assertEqual(
+            [result['vat_number'] for result in response.json()['results']], ['01234567890', '00000000001'],
+        )
+        self.assertEqual(Company.objects.filter(vat_number='01234567890').count(), 1)
+        self.assertEqual(Company.objects.count(), 2)
+
+    def test_single_lookup_of_unknown_vat_returns_404(self):
+        response = self.client.post(
+            '/api/companies/fetch_from_external/',
+            {'vat_number': '40400000000'},
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(SYNC_JOB_RUNNER='db', SYNC_JOB_STALE_AFTER=600)
+class SyncJobTests(TestCase):
+    url = '/api/companies/fetch_contractors/'
+
+    def make_stale(self, job, field):
+        SyncJob.objects.filter(pk=job.pk).update(**{field: timezone.now() - timedelta(seconds=601)})
+
+    def test_fetch_contractors_returns_job(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertEqual(job['status'], SyncJob.STATUS_PENDING)
+
+        response = self.client.get(response['Location'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['uuid'], response.json()['status']), (job['uuid'], 'PENDING'))
+
+    def test_concurrent_sync_conflicts(self):
+        job = self.client.get(self.url).json()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['job']['uuid'], job['uuid'])
+
+    def test_stale_jobs_are_expired(self):
+        running = SyncJob.objects.create(status=SyncJob.STATUS_RUNNING, heartbeat_at=timezone.now())
+        self.make_stale(running, 'heartbeat_at')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        running.refresh_from_db()
+        self.assertEqual(running.status, SyncJob.STATUS_FAILED)
+
+        pending = SyncJob.objects.get(pk=response.json()['uuid'])
+        self.assertEqual(self.client.get(self.url).status_code, 409)
+        self.make_stale(pending, 'created_at')
+        self.assertEqual(self.client.get(self.url).status_code, 202)
+        pending.refresh_from_db()
+        self.assertEqual((pending.status, pending.error), (SyncJob.STATUS_FAILED, "Job scaduto: mai avviato"))
+
+
+def company_info_mock_transport(calls):
+    """
+    httpx.MockTransport con le stesse risposte di CompanyInfoStubHandler; le
+    partite IVA che iniziano con 'DOWN' rispondono sempre 503. Conta le
+    chiamate per partita IVA in `calls`.
+    """
+    def handler(request):
+        vat_number = request.url.params['vat_number']
+        calls[vat_number] = calls.get(vat_number, 0) + 1
+        if vat_number.startswith('404'):
+            return httpx.Response(404, json={'detail': 'Not found'})
+        if vat_number.startswith('DOWN') or (vat_number.startswith('FLAKY') and calls[vat_number] == 1):
+            return httpx.Response(503, json={'detail': 'Unavailable'})
+        return httpx.Response(200, headers={'ETag': f'"{vat_number}"'}, json={
+            'vat_number': vat_number,
+            'legal_form': 'SRL',
+            'ateco_code': '47.11',
+            'activity': 'Commercio al dettaglio',
+            'annual_turnover': '1250000.00',
+            'employees': 12,
+            'city': 'Milano',
+        })
+    return httpx.MockTransport(handler)
+
+
+@skipUnless(httpx, "Le view asincrone richiedono httpx")
+class AsyncViewsTests(TestCase):
+
+    def setUp(self):
+        self.calls = {}
+        settings_override = override_settings(
+            COMPANY_INFO_SERVICE_URL='http://company-info.test/company-info',
+            COMPANY_INFO_SERVICE_BACKOFF=0,
+            COMPANY_INFO_ASYNC_TRANSPORT=company_info_mock_transport(self.calls),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        caches['company_lookups'].clear()
+        lookup_cache.reset_stats()
+
+    def capture_inserts(self):
+        inserts = []
+        wrapper = connection.execute_wrapper(
+            lambda execute, sql, *args: (
+                sql.startswith('INSERT INTO "company_info_company"') and inserts.append(sql)
+            ) or execute(sql, *args)
+        )
+        return wrapper, inserts
+
+    @override_settings(SYNC_JOB_RUNNER='db')
+    def test_fetch_contractors_starts_job(self):
+        response = self.client.get('/api/async/companies/fetch_contractors/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'PENDING')
+        self.assertIn(f"/api/sync-jobs/{response.json()['uuid']}/", response['Location'])
+
+        response = self.client.get('/api/async/companies/fetch_contractors/')
+        self.assertEqual(response.status_code, 409)
+
+    def test_write_batcher_groups_concurrent_saves(self):
+        Company.objects.create(vat_number='00000000002', legal_form='SPA')
+        batcher = CompanyWriteBatcher(delay=0)
+
+        async def save_all():
+            return await asyncio.gather(*(
+                batcher.save({'vat_number': vat_number, 'legal_form': 'SRL'})
+                for vat_number in ('00000000001', '00000000002', '00000000003')
+            ))
+
+        wrapper, inserts = self.capture_inserts()
+        with wrapper:
+            results = async_to_sync(save_all)()
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual([outcome for outcome, _ in results], ['created', 'updated', 'created'])
+        self.assertEqual(results[1][1]['legal_form'], 'SRL')
+
+    def test_fetch_from_external_matches_sync_view(self):
+        url = '/api/async/companies/fetch_from_external/'
+        response = self.client.post(url, {'vat_number': '00000000001'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['vat_number'], '00000000001')
+        response = self.client.post(url, {'vat_number': '00000000001'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(url, {'vat_number': '40400000000'}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(COMPANY_INFO_SERVICE_RETRIES=2)
+    def test_transient_errors_are_retried(self):
+        response = self.client.post(
+            '/api/async/companies/fetch_from_external_batch/',
+            {'vat_numbers': ['00000000001', '40400000000', 'FLAKY0000001', 'DOWN00000001']},
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['summary'], {'created': 2, 'not_found': 1, 'error': 1})
+        self.assertEqual(self.calls, {'00000000001': 1, '40400000000': 1, 'FLAKY0000001': 2, 'DOWN00000001': 3})
+
+        response = self.client.post(
+            '/api/async/companies/fetch_from_external/', {'vat_number': 'DOWN00000002'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.calls['DOWN00000002'], 3)
+
+    @override_settings(COMPANY_ASYNC_WRITE_DELAY=0.05)
+    def test_concurrent_requests_share_one_write(self):
+        client = AsyncClient()
+
+        async def post_all():
+            return await asyncio.gather(*(
+                client.post(
+                    '/api/async/companies/fetch_from_external/', {'vat_number': vat_number},
+                    content_type='application/json',
+                )
+                for vat_number in ('00000000001', '00000000002', 'FLAKY0000001')
+            ))
+
+        wrapper, inserts = self.capture_inserts()
+        with wrapper:
+            responses = async_to_sync(post_all)()
+        self.assertEqual([response.status_code for response in responses], [201, 201, 201])
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Company.objects.filter(legal_form='SRL').count(), 3)
+
+
+class LookupCacheTests(CompanyInfoStubMixin, TestCase):
+
+    def test_repeated_lookups_hit_the_cache(self):
+        fetch_company_data('00000000001')
+        data = fetch_company_data('IT 000.000.000.01')
+
+        self.assertEqual(data['vat_number'], '00000000001')
+        self.assertEqual(CompanyInfoStubHandler.calls['00000000001'], 1)
+        self.assertEqual(lookup_cache.get_stats()['hits'], 1)
+
+    def test_unknown_vat_is_cached_as_negative(self):
+        for _ in range(2):
+            with self.assertRaises(CompanyNotFound):
+                fetch_company_data('40400000000')
+
+        self.assertEqual(CompanyInfoStubHandler.calls['40400000000'], 1)
+        self.assertEqual(lookup_cache.get_stats()['negative_hits'], 1)
+
+    @override_settings(COMPANY_LOOKUP_CACHE_TTL=0)
+    def test_expired_entry_is_revalidated_with_etag(self):
+        first = fetch_company_data('00000000001')
+        second = fetch_company_data('00000000001')
+
+        self.assertEqual(first, second)
+        self.assertEqual(CompanyInfoStubHandler.calls['00000000001'], 2)
+        self.assertEqual(lookup_cache.get_stats()['revalidated'], 1)
+
+
+class CompanyFilterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Company.objects.bulk_create([
+            Company(vat_number='00000000001', legal_form='SRL', ateco_code='47.11', region='Lazio',
+                    seasonality='NONE', annual_turnover=100000),
+            Company(vat_number='00000000002', legal_form='SPA', ateco_code='47.19', region='Veneto',
+                    seasonality='SUMMER', annual_turnover=900000),
+            Company(vat_number='00000000003', legal_form='SRL', ateco_code='10.11', region='Veneto',
+                    seasonality='NONE', annual_turnover=500000),
+        ])
+
+    def filtered(self, query):
+        request = Request(APIRequestFactory().get('/api/companies/', query))
+        return CompanyFilterBackend().filter_queryset(request, Company.objects.all(), None)
+
+    def vat_numbers(self, query):
+        return sorted(self.filtered(query).values_list('vat_number', flat=True))
+
+    def test_filters(self):
+        self.assertEqual(self.vat_numbers({'ateco_code': '47.*'}), ['00000000001', '00000000002'])
+        self.assertEqual(self.vat_numbers({'ateco_code': '10.11'}), ['00000000003'])
+        self.assertEqual(self.vat_numbers({'region': 'Lazio,Veneto', 'legal_form': 'SRL'}),
+                         ['00000000001', '00000000003'])
+        self.assertEqual(self.vat_numbers({'seasonality': 'SUMMER'}), ['00000000002'])
+        self.assertEqual(self.vat_numbers({'turnover_min': '200000', 'turnover_max': '900000'}),
+                         ['00000000002', '00000000003'])
+
+    def test_invalid_turnover_returns_400(self):
+        for query in ({'turnover_min': 'abc'}, {'turnover_min': 'NaN'}, {'turnover_max': 'Infinity'},
+                      {'turnover_max': '-inf'}, {'turnover_min': 'sNaN'}):
+            with self.subTest(query=query):
+                response = self.client.get('/api/companies/', query)
+
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {name: ["Importo non valido"] for name in query})
+
+    @skipUnless(connection.vendor == 'sqlite', "Il piano di esecuzione è specifico di SQLite")
+    def test_each_filter_uses_an_index(self):
+        queries = {
+            'company_ateco_idx': {'ateco_code': '47.*'},
+            'company_region_ateco_idx': {'region': 'Lazio'},
+            'company_legal_turnover_idx': {'legal_form': 'SRL'},
+            'company_seasonality_idx': {'seasonality': 'SUMMER'},
+            'company_turnover_idx': {'turnover_min': '1000', 'turnover_max': '5000'},
+        }
+        for index_name, query in queries.items():
+            with self.subTest(query=query):
+                # Stessa forma della query della lista paginata
+                plan = self.filtered(query).order_by('-created_at', '-uuid')[:51].explain()
+                self.assertIn(f'USING INDEX {index_name}', plan)
+                self.assertNotIn('SCAN company_info_company', plan)
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.company = Company.objects.create(vat_number='00000000001', legal_form='SRL', ateco_code='47.11')
+        self.url = f'/api/companies/{self.company.pk}/'
+
+    def test_detail_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        etag = response['ETag']
+        self.company.city = 'Roma'
+        self.company.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get('/api/companies/not-a-uuid/').status_code, 404)
+
+    def test_list_etag_follows_filters_updates_and_deletes(self):
+        etag = self.client.get('/api/companies/')['ETag']
+        self.assertEqual(self.client.get('/api/companies/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get('/api/companies/', {'region': 'Lazio'})['ETag'], etag)
+        self.assertNotEqual(self.client.get('/api/companies/', {'fields': 'vat_number'})['ETag'], etag)
+
+        other = Company.objects.create(vat_number='00000000002', legal_form='SPA', ateco_code='10.11')
+        with_other = self.client.get('/api/companies/')['ETag']
+        self.assertNotEqual(with_other, etag)
+        Company.objects.filter(pk=other.pk).update(city='Roma')
+        updated = self.client.get('/api/companies/')['ETag']
+        self.assertNotEqual(updated, with_other)
+        other.delete()
+        self.assertNotEqual(self.client.get('/api/companies/', HTTP_IF_NONE_MATCH=updated).status_code, 304)
+
+    @override_settings(COMPANY_RESPONSE_CACHE='default')
+    def test_shared_cache_invalidated_by_writes(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+        self.assertEqual(cached.content, first.content)
+        self.assertEqual(cached['ETag'], first['ETag'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Company.objects.filter(pk=self.company.pk).update(city='Roma')
+        self.assertEqual(self.client.get(self.url).json()['city'], 'Roma')
+
+
+class FastSerializationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Company.objects.create(vat_number='00000000001', legal_form='SRL', ateco_code='47.11',
+                               activity='Caffè "Roma"\u2028\x01', annual_turnover=Decimal('1234.5'), employees=3)
+        Company.objects.create(vat_number='00000000002', legal_form='ALTRO', ateco_code='10.11', city='Forlì')
+
+    def expected(self, response, query):
+        request = Request(APIRequestFactory().get('/api/companies/', query))
+        companies = Company.objects.order_by('-created_at', '-uuid')
+        data = response.json()
+        data['results'] = CompanySerializer(companies, many=True, context={'request': request}).data
+        return JSONRenderer().render(data)
+
+    def test_list_is_byte_compatible_with_serializer(self):
+        for query in ({}, {'fields': 'uuid,annual_turnover,updated_at'}, {'page_size': 1}):
+            with self.subTest(query=query):
+                response = self.client.get('/api/companies/', query)
+                if 'page_size' in query:
+                    self.assertEqual(len(response.json()['results']), 1)
+                    self.assertEqual(self.client.get(response.json()['next']).json()['results'][0]['vat_number'],
+                                     '00000000001')
+                    continue
+                self.assertEqual(response.content, self.expected(response, query))
+
+    def test_renderer_matches_json_renderer(self):
+        data = {'text': 'à\u2029"\\\n\x1f', 'uuid': uuid.uuid4(), 'amount': Decimal('1.50'), 'big': 2 ** 70,
+                'when': timezone.now(), 'items': [1, None, True, 2.5]}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=2'),
+                         JSONRenderer().render(data, 'application/json; indent=2'))
+
+
+class ContractorsStubHandler(BaseHTTPRequestHandler):
+    """
+    Stub del feed dei contractor: /pages/ risponde in stile DRF paginato su due
+    pagine, /array/ con un unico array JSON.
+    """
+    protocol_version = 'HTTP/1.1'
+    contractors = [{'vat_number': f'0000000000{index}', 'yearly_revenues': index * 1.5} for index in range(5)]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/array/':
+            data = self.contractors
+        elif parse_qs(url.query).get('page') == ['2']:
+            data = {'next': None, 'results': self.contractors[3:]}
+        else:
+            next_url = f'http://127.0.0.1:{self.server.server_port}/pages/?page=2'
+            data = {'next': next_url, 'results': self.contractors[:3]}
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ContractorsFeedTests(TestCase):
+    PAYLOAD = '[2.5, -1e3, 10, true, null, "a,]", {"vat_number": "00000000001", "items": [1.25e-2, false]}] '
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ContractorsStubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def chunked(self, text, size):
+        return [text[start:start + size] for start in range(0, len(text), size)]
+
+    def test_array_parsed_at_any_chunk_size(self):
+        expected = json.loads(self.PAYLOAD)
+        for size in (1, 2, 3, 5, 8, len(self.PAYLOAD)):
+            with self.subTest(size=size):
+                self.assertEqual(list(iter_json_array(self.chunked(self.PAYLOAD, size))), expected)
+
+    def test_truncated_array_is_rejected(self):
+        for size in (1, 3):
+            with self.subTest(size=size), self.assertRaises(ValueError):
+                list(iter_json_array(self.chunked('[1, 2.5', size)))
+        with self.assertRaises(ValueError):
+            list(iter_json_array(['{"results": []}']))
+
+    def test_paginated_feed_follows_next(self):
+        feed = ContractorsFeed(url=f'{self.base_url}/pages/', headers={})
+
+        self.assertEqual(list(feed), ContractorsStubHandler.contractors)
+        self.assertEqual(feed.pages, 2)
+
+    def test_array_feed(self):
+        feed = ContractorsFeed(url=f'{self.base_url}/array/', headers={})
+
+        self.assertEqual(list(feed), ContractorsStubHandler.contractors)
+        self.assertEqual(feed.pages, 1)
+
+
+class StaticFeed(list):
+    pages = 1
+
+
+class BulkUpsertTests(TestCase):
+
+    def test_mixed_insert_and_update(self):
+        Company.objects.create(vat_number='00000000001', legal_form='SRL', ateco_code='47.11', city='Roma')
+
+        result = bulk_upsert_companies([
+            {'vat_number': '00000000001', 'legal_form': 'SPA'},
+            {'vat_number': '00000000002', 'legal_form': 'SRL', 'ateco_code': '10.11', 'city': 'Milano'},
+            {'vat_number': '00000000003', 'legal_form': 'XYZ'},
+            {'legal_form': 'SRL'},
+        ], batch_size=2)
+
+        self.assertEqual((result.created, result.updated, result.failed), (1, 1, 2))
+        self.assertEqual({error['vat_number'] for error in result.errors}, {'00000000003', None})
+        updated = Company.objects.get(vat_number='00000000001')
+        # I campi non forniti restano invariati
+        self.assertEqual((updated.legal_form, updated.ateco_code, updated.city), ('SPA', '47.11', 'Roma'))
+        self.assertEqual(Company.objects.get(vat_number='00000000002').city, 'Milano')
+        self.assertFalse(Company.objects.filter(vat_number='00000000003').exists())
+
+    def test_duplicate_vat_numbers_in_a_batch(self):
+        result = bulk_upsert_companies([
+            {'vat_number': '00000000001', 'legal_form': 'SRL', 'city': 'Roma'},
+            {'vat_number': '00000000001', 'legal_form': 'SPA'},
+            {'vat_number': '00000000002', 'legal_form': 'SRL', 'city': 'Roma'},
+            {'vat_number': '00000000001', 'legal_form': 'SAS', 'city': 'Milano'},
+            {'vat_number': '00000000002', 'legal_form': 'SRL', 'city': 'Torino'},
+        ])
+
+        self.assertEqual((result.created, result.updated, result.failed), (2, 0, 0))
+        self.assertEqual(
+            sorted(Company.objects.values_list('vat_number', 'legal_form', 'city')),
+            [('00000000001', 'SAS', 'Milano'), ('00000000002', 'SRL', 'Torino')],
+        )
+
+        result = bulk_upsert_companies([
+            {'vat_number': '00000000001', 'city': 'Napoli'},
+            {'vat_number': '00000000001', 'legal_form': 'SPA'},
+        ])
+
+        self.assertEqual((result.created, result.updated), (0, 1))
+        self.assertEqual(
+            Company.objects.filter(vat_number='00000000001').values_list('legal_form', 'city').get(),
+            ('SPA', 'Napoli'),
+        )
+
+
+@override_settings(CONTRACTORS_SYNC_FLAG_MISSING=True)
+class DeltaSyncTests(TestCase):
+
+    def contractor(self, vat_number, revenues='1000.00'):
+        return {'vat_number': vat_number, 'activity': '47.11', 'activity_full_description': 'Commercio',
+                'yearly_revenues': revenues, 'city': 'Milano', 'province': 'Lombardia'}
+
+    def sync(self, *contractors):
+        job = run_sync_job(SyncJob.objects.create(status=SyncJob.STATUS_RUNNING), StaticFeed(contractors))
+        self.assertEqual(job.status, SyncJob.STATUS_SUCCEEDED, job.error)
+        return (job.created, job.updated, job.unchanged, job.missing)
+
+    def test_unchanged_rows_are_not_rewritten(self):
+        self.assertEqual(self.sync(self.contractor('80000000001'), self.contractor('80000000002')), (2, 0, 0, 0))
+        updated_at = dict(Company.objects.values_list('vat_number', 'updated_at'))
+
+        self.assertEqual(self.sync(self.contractor('80000000001'), self.contractor('80000000002')), (0, 0, 2, 0))
+        self.assertEqual(dict(Company.objects.values_list('vat_number', 'updated_at')), updated_at)
+
+        self.assertEqual(self.sync(self.contractor('80000000001', revenues='2000.00')), (0, 1, 0, 1))
+        company = Company.objects.get(vat_number='80000000001')
+        self.assertEqual(company.annual_turnover, Decimal('2000.00'))
+        self.assertIsNotNone(Company.objects.get(vat_number='80000000002').missing_from_feed_at)
+
+        # Un'azienda che ricompare viene riscritta per togliere il contrassegno
+        self.assertEqual(self.sync(self.contractor('80000000001', revenues='2000.00'),
+                                   self.contractor('80000000002')), (0, 1, 1, 0))
+        self.assertIsNone(Company.objects.get(vat_number='80000000002').missing_from_feed_at)
+
+    def test_local_edits_are_overwritten_by_the_next_sync(self):
+        self.sync(self.contractor('80000000001'))
+        company = Company.objects.get(vat_number='80000000001')
+        data = CompanySerializer(company).data
+        data.update(city='Roma', annual_turnover='5.00')
+
+        response = self.client.put(f'/api/companies/{company.pk}/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        Company.objects.filter(pk=company.pk).update(region='Lazio')
+
+        self.assertEqual(self.sync(self.contractor('80000000001')), (0, 1, 0, 0))
+        company.refresh_from_db()
+        self.assertEqual((company.city, company.region, company.annual_turnover),
+                         ('Milano', 'Lombardia', Decimal('1000.00')))
+        self.assertEqual(self.sync(self.contractor('80000000001')), (0, 0, 1, 0))
+
+    def test_seen_companies_are_stamped_with_the_job(self):
+        self.sync(self.contractor('80000000001'), self.contractor('80000000002'))
+        job = run_sync_job(SyncJob.objects.create(status=SyncJob.STATUS_RUNNING),
+                           StaticFeed([self.contractor('80000000001')]))
+
+        self.assertEqual(Company.objects.get(vat_number='80000000001').last_seen_sync, job.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(mark_missing(job.pk), 0)
+        self.assertEqual(job.missing, 1)
+
+    def test_companies_not_from_feed_are_never_missing(self):
+        Company.objects.create(vat_number='80000000009', legal_form='SPA', ateco_code='10.11')
+        self.assertEqual(self.sync(self.contractor('80000000001')), (1, 0, 0, 0))
+        self.assertIsNone(Company.objects.get(vat_number='80000000009').missing_from_feed_at)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    # Nei test la replica è un mirror del database di default
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        reset_health()
+        Company.objects.create(vat_number='70000000001', region='Lombardia')
+
+    def replica_queries(self, method, url, **kwargs):
+        queries = []
+        with connections['replica'].execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            response = getattr(self.client, method)(url, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 300)
+        return response, len(queries)
+
+    def test_safe_reads_use_replica(self):
+        company = Company.objects.get()
+        for url in ('/api/companies/', f'/api/companies/{company.pk}/', '/api/companies/export/',
+                    '/api/assessments/'):
+            with self.subTest(url=url):
+                self.assertGreater(self.replica_queries('get', url)[1], 0)
+        # Le azioni non dichiarate restano sul primario
+        self.assertEqual(self.replica_queries('get', '/api/sync-jobs/')[1], 0)
+
+    def test_reads_after_write_stay_on_primary(self):
+        response, queries = self.replica_queries(
+            'post', '/api/companies/', data={'vat_number': '70000000002', 'legal_form': 'SRL', 'ateco_code': '47.11'},
+            content_type='application/json',
+        )
+        self.assertEqual(queries, 0)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        # Il cookie aggancia al primario anche le letture successive
+        self.assertEqual(self.replica_queries('get', '/api/companies/')[1], 0)
+        self.client.cookies.pop(PIN_COOKIE)
+        self.assertGreater(self.replica_queries('get', '/api/companies/')[1], 0)
+
+    @override_settings(DATABASE_REPLICA_ALIAS='missing')
+    def test_unconfigured_replica_falls_back_to_primary(self):
+        self.assertEqual(self.replica_queries('get', '/api/companies/')[1], 0)
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        for index in range(3):
+            Company.objects.create(vat_number=f'6000000000{index}', region='Lombardia')
+
+    def test_request_labels_and_query_count(self):
+        labels = '{view="CompanyViewSet",action="list"}'
+        before = REGISTRY.db_queries.values.get(('CompanyViewSet', 'list'), 0)
+        self.assertEqual(self.client.get('/api/companies/').status_code, 200)
+        self.assertGreater(REGISTRY.db_queries.values[('CompanyViewSet', 'list')], before)
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        content = response.content.decode()
+        self.assertIn(f'company_info_request_duration_seconds_count{labels}', content)
+        self.assertIn(f'company_info_db_queries_total{labels}', content)
+        self.assertIn(f'company_info_response_bytes_total{labels}', content)
+
+    def test_serialization_time_covers_every_renderer(self):
+        labels = ('CompanyViewSet', 'list')
+        for query in ('', '?format=api', '?format=json&fields=vat_number,region'):
+            with self.subTest(query=query):
+                before = REGISTRY.serialization_seconds.values.get(labels, 0)
+                self.assertEqual(self.client.get(f'/api/companies/{query}').status_code, 200)
+                self.assertGreater(REGISTRY.serialization_seconds.values[labels], before)
+
+    @override_settings(METRICS_SLOW_REQUEST_THRESHOLD=0)
+    def test_slow_request_is_logged_with_top_queries(self):
+        with self.assertLogs('company_info.metrics', 'WARNING') as logs:
+            self.client.get('/api/companies/')
+        self.assertIn('GET /api/companies/', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+
+class CompanySearchTests(TestCase):
+
+    def search(self, text):
+        return sorted(search_queryset(Company.objects.all(), text).values_list('vat_number', flat=True))
+
+    def test_index_follows_save_bulk_upsert_and_delete(self):
+        Company.objects.create(vat_number='00000000001', legal_form='SRL', ateco_code='10.71',
+                               activity='Panetteria', city='Roma')
+        bulk_upsert_companies([{'vat_number': '00000000002', 'legal_form': 'SRL', 'ateco_code': '10.71',
+                                'activity_description': 'Produzione di pasticceria fresca', 'city': 'Roma'}])
+        self.assertEqual(self.search('roma'), ['00000000001', '00000000002'])
+        self.assertEqual(self.search('pastic'), ['00000000002'])
+
+        bulk_upsert_companies([{'vat_number': '00000000002', 'city': 'Milano'}])
+        Company.objects.filter(vat_number='00000000001').delete()
+        self.assertEqual(self.search('roma'), [])
+        self.assertEqual(self.search('milano pasticceria'), ['00000000002'])
+
+    def test_api_results_are_ranked(self):
+        Company.objects.create(vat_number='00000000001', legal_form='SRL', ateco_code='10.71',
+                               activity='Pasticceria', activity_description='Torte e pasticceria mignon')
+        Company.objects.create(vat_number='00000000002', legal_form='SRL', ateco_code='10.71',
+                               activity='Panetteria', activity_description='Anche pasticceria')
+
+        response = self.client.get('/api/companies/', {'search': 'pasticceria', 'fields': 'vat_number'})
+
+        self.assertEqual([row['vat_number'] for row in response.json()['results']],
+                         ['00000000001', '00000000002'])
+
+
+class SearchIndexRebuildTests(TransactionTestCase):
+
+    def test_rebuild_after_vacuum(self):
+        Company.objects.create(vat_number='00000000001', legal_form='SRL', ateco_code='10.71', city='Roma')
+        Company.objects.create(vat_number='00000000002', legal_form='SRL', ateco_code='10.71', city='Milano')
+        Company.objects.filter(vat_number='00000000001').delete()
+        if connection.vendor == 'sqlite':
+            # Indice disallineato, come dopo una rinumerazione dei rowid
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}) VALUES ('delete-all')")
+
+        call_command('rebuild_search_index', '--vacuum', stdout=io.StringIO())
+
+        self.assertEqual(list(search_queryset(Company.objects.all(), 'milano').values_list('vat_number', flat=True)),
+                         ['00000000002'])
+
+
+class UnderwritingAssessmentApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        kinds = ChecklistKind.objects.bulk_create([
+            ChecklistKind(name=f'Verifica {index}', rating=index) for index in range(3)
+        ])
+        for index in range(10):
+            company = Company.objects.create(vat_number=f'{index:011d}', legal_form='SRL', ateco_code='47.11')
+            assessment = UnderwritingAssessment.objects.create(company=company, underwriting_year=2024)
+            UnderwritingChecklist.objects.bulk_create([
+                UnderwritingChecklist(assessment=assessment, kind=kind, value=5) for kind in kinds
+            ])
+
+    def test_nested_representation(self):
+        response = self.client.get('/api/assessments/', {'page_size': 1})
+
+        assessment = response.json()['results'][0]
+        self.assertEqual(len(assessment['checklist_items']), 3)
+        self.assertIn('name', assessment['checklist_items'][0]['kind'])
+        self.assertTrue(assessment['company_vat_number'])
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        get_kinds()
+        for page_size in (1, 5, 10):
+            with self.subTest(page_size=page_size):
+                # Una query per la pagina (con l'azienda) e una per le checklist:
+                # i tipi vengono dal registro in memoria
+                with self.assertNumQueries(2):
+                    response = self.client.get('/api/assessments/', {'page_size': page_size})
+                self.assertEqual(len(response.json()['results']), page_size)
+
+
+class CompanyListApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Company.objects.bulk_create([
+            Company(vat_number=f'{index:011d}', legal_form='SRL', ateco_code='47.11', city='Milano')
+            for index in range(7)
+        ])
+        # Stessa chiave di ordinamento per tutte: decide l'uuid
+        Company.objects.update(created_at=timezone.now())
+
+    def pages(self, url, data=None):
+        while url:
+            response = self.client.get(url, data)
+            self.assertEqual(response.status_code, 200)
+            yield response.json()
+            url, data = response.json()['next'], None
+
+    def test_cursor_pages_cover_ties_once(self):
+        pages = list(self.pages('/api/companies/', {'page_size': 3}))
+
+        vat_numbers = [company['vat_number'] for page in pages for company in page['results']]
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(sorted(vat_numbers), [f'{index:011d}' for index in range(7)])
+        expected = Company.objects.order_by('-created_at', '-uuid').values_list('vat_number', flat=True)
+        self.assertEqual(vat_numbers, list(expected))
+
+    def test_previous_cursor_returns_the_same_page(self):
+        first = self.client.get('/api/companies/', {'page_size': 3}).json()
+        second = self.client.get(first['next']).json()
+
+        self.assertIsNone(first['previous'])
+        self.assertEqual(self.client.get(second['previous']).json()['results'], first['results'])
+
+    def test_invalid_cursor_returns_400(self):
+        # Non base64, chiave di lunghezza errata, valori non convertibili
+        payloads = [b'not json', b'{"p": [1]}', b'{"p": ["ieri", "x"]}']
+        for cursor in ['not-a-cursor'] + [base64.urlsafe_b64encode(payload).decode() for payload in payloads]:
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/companies/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cursor', response.json())
+
+    def test_sparse_fields(self):
+        first = Company.objects.order_by('-created_at', '-uuid').first()
+
+        response = self.client.get('/api/companies/', {'fields': 'vat_number, city', 'page_size': 1})
+
+        self.assertEqual(response.json()['results'], [{'vat_number': first.vat_number, 'city': 'Milano'}])
+
+    def test_unknown_fields_return_400(self):
+        response = self.client.get('/api/companies/', {'fields': 'vat_number,secret'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['fields'][0])
+
+
+class ChecklistKindRegistryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kind = ChecklistKind.objects.create(name='Antiriciclaggio', rating=4)
+        company = Company.objects.create(vat_number='00000000001', legal_form='SRL', ateco_code='47.11')
+        assessment = UnderwritingAssessment.objects.create(company=company, underwriting_year=2024)
+        UnderwritingChecklist.objects.create(assessment=assessment, kind=cls.kind, value=7)
+
+    def test_reads_without_queries(self):
+        items = list(UnderwritingChecklist.objects.select_related('assessment__company'))
+        get_kinds()
+        with self.assertNumQueries(0):
+            self.assertEqual(str(items[0]), 'Antiriciclaggio: 7/10 - 00000000001')
+            kind = UnderwritingChecklistSerializer(items, many=True).data[0]['kind']
+        self.assertEqual(kind, {'uuid': str(self.kind.pk), 'name': 'Antiriciclaggio', 'rating': 4})
+
+    def test_changes_invalidate_local_and_shared_copies(self):
+        other_process = KindRegistry()
+        other_process.all()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kind.rating = 9
+            self.kind.save()
+        self.assertEqual(get_kind(self.kind.pk).rating, 9)
+        self.assertEqual(other_process.all(check=True)[self.kind.pk].rating, 9)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new_kind = ChecklistKind.objects.create(name='Visura', rating=2)
+        self.assertEqual(other_process.get(new_kind.pk).name, 'Visura')
+
+    @override_settings(CHECKLIST_KIND_CACHE_CHECK_INTERVAL=0)
+    def test_local_cache_reloads_changes_from_other_processes(self):
+        registry = KindRegistry()
+        registry.all()
+        # Modifica di un altro processo: nessun hook e nessuna versione condivisa
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {ChecklistKind._meta.db_table} SET name = %s WHERE uuid = %s', ['Visura', self.kind.pk.hex]
+            )
+        self.assertEqual(registry.get(self.kind.pk).name, 'Visura')
+
+    def test_deploy_check_requires_shared_cache(self):
+        self.assertEqual([warning.id for warning in check_cache(None)], ['company_info.W001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_cache(None), [])
+
+    @override_settings(CHECKLIST_KIND_CACHE_CHECK_INTERVAL=0)
+    def test_rolled_back_changes_are_discarded(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            ChecklistKind.objects.filter(pk=self.kind.pk).update(name='Annullato')
+            self.assertEqual(get_kind(self.kind.pk).name, 'Annullato')
+            raise RuntimeError
+        self.assertEqual(get_kind(self.kind.pk).name, 'Antiriciclaggio')
+
+
+class RiskScoreTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.heavy = ChecklistKind.objects.create(name='Antincendio', rating=8)
+        cls.light = ChecklistKind.objects.create(name='Allarme', rating=2)
+        cls.company = Company.objects.create(vat_number='00000000001', legal_form='SRL', ateco_code='47.11')
+        cls.assessment = UnderwritingAssessment.objects.create(company=cls.company, underwriting_year=2024)
+        UnderwritingChecklist.objects.create(assessment=cls.assessment, kind=cls.heavy, value=9)
+        UnderwritingChecklist.objects.create(assessment=cls.assessment, kind=cls.light, value=4, is_compliant=False)
+        cls.empty = UnderwritingAssessment.objects.create(company=cls.company, underwriting_year=2023)
+
+    def test_weighted_score_with_penalty(self):
+        result = recompute_risk_scores(underwriting_year=2024)
+
+        self.assertEqual(result, {'scored': 1, 'updated': 1})
+        self.assertEqual(recompute_risk_scores(underwriting_year=2024)['updated'], 0)
+        # qualità (9·8 + 4·2) / 10 = 8 -> rischio 20, penalità 5·2/10 = 1
+        self.assertEqual(UnderwritingAssessment.objects.get(pk=self.assessment.pk).risk_score, Decimal('21.00'))
+
+    def test_assessment_without_checklist_has_no_score(self):
+        UnderwritingAssessment.objects.filter(pk=self.empty.pk).update(risk_score=50)
+
+        recompute_risk_scores()
+
+        self.assertIsNone(UnderwritingAssessment.objects.get(pk=self.empty.pk).risk_score)
+
+    def test_api_action(self):
+        response = self.client.post('/api/assessments/recompute_risk_scores/', {'underwriting_year': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/api/assessments/recompute_risk_scores/', {'underwriting_year': 2024})
+        self.assertEqual(response.json(), {'scored': 1, 'updated': 1})
+
+    def assertDirty(self, *assessments):
+        self.assertEqual(
+            set(UnderwritingAssessment.objects.filter(risk_score_dirty=True).values_list('pk', flat=True)),
+            {assessment.pk for assessment in assessments},
+        )
+
+    def test_checklist_changes_mark_only_affected_assessments(self):
+        UnderwritingAssessment.objects.update(risk_score_dirty=False)
+        other = UnderwritingChecklist.objects.create(assessment=self.empty, kind=self.light, value=1)
+        self.assertDirty(self.empty)
+
+        UnderwritingAssessment.objects.update(risk_score_dirty=False)
+        other.notes = 'Solo note'
+        other.save()
+        UnderwritingChecklist.objects.filter(pk=other.pk).update(notes='Altre note')
+        self.assertDirty()
+
+        UnderwritingChecklist.objects.filter(assessment=self.assessment).update(value=7)
+        self.assertDirty(self.assessment)
+
+        UnderwritingAssessment.objects.update(risk_score_dirty=False)
+        ChecklistKind.objects.filter(pk=self.heavy.pk).update(rating=3)
+        self.assertDirty(self.assessment)
+
+        UnderwritingAssessment.objects.update(risk_score_dirty=False)
+        self.light.rating = 4
+        self.light.save()
+        self.assertDirty(self.assessment, self.empty)
+
+    def test_full_recompute_clears_dirty_flags(self):
+        UnderwritingChecklist.objects.filter(assessment__in=[self.assessment, self.empty]).update(value=7)
+        UnderwritingChecklist.objects.create(assessment=self.empty, kind=self.light, value=1)
+        self.assertDirty(self.assessment, self.empty)
+
+        recompute_risk_scores(underwriting_year=2024)
+        self.assertDirty(self.empty)
+        recompute_risk_scores(assessment_ids=[self.empty.pk])
+        self.assertDirty()
+
+    @override_settings(RISK_SCORE_RECOMPUTE_RUNNER='thread', RISK_SCORE_RECOMPUTE_DELAY=0)
+    def test_recompute_on_commit(self):
+        recompute_risk_scores()
+        item = UnderwritingChecklist.objects.get(assessment=self.assessment, kind=self.light)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.is_compliant = True
+            item.save()
+
+        assessment = UnderwritingAssessment.objects.get(pk=self.assessment.pk)
+        self.assertEqual(assessment.risk_score, Decimal('20.00'))
+        self.assertFalse(assessment.risk_score_dirty)
+
+    def test_no_background_recompute_by_default(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            UnderwritingChecklist.objects.filter(assessment=self.assessment).update(value=7)
+
+        self.assertIsNone(scoring._timer)
+        self.assertDirty(self.assessment)
+
+    @override_settings(RISK_SCORE_RECOMPUTE_RUNNER='thread', RISK_SCORE_RECOMPUTE_DELAY=60)
+    def test_cancel_scheduled_recompute(self):
+        self.addCleanup(scoring.cancel_scheduled)
+        with self.captureOnCommitCallbacks(execute=True):
+            UnderwritingChecklist.objects.filter(assessment=self.assessment).update(value=7)
+        timer = scoring._timer
+        self.assertTrue(timer.is_alive())
+
+        scoring.cancel_scheduled()
+
+        self.assertFalse(timer.is_alive())
+        self.assertIsNone(scoring._timer)
+
+
+class ChecklistSubmissionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kinds = ChecklistKind.objects.bulk_create([
+            ChecklistKind(name=f'Verifica {index}', rating=index % 11) for index in range(40)
+        ])
+        company = Company.objects.create(vat_number='00000000001', legal_form='SRL', ateco_code='47.11')
+        cls.assessment = UnderwritingAssessment.objects.create(company=company, underwriting_year=2024)
+        cls.url = f'/api/assessments/{cls.assessment.pk}/checklist/'
+
+    def submit(self, items):
+        return self.client.put(self.url, {'items': items}, content_type='application/json')
+
+    def test_full_checklist_in_one_request(self):
+        items = [{'kind': str(kind.pk), 'value': 5} for kind in self.kinds]
+        response = self.submit(items)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['summary'], {'created': 40, 'updated': 0, 'deleted': 0, 'unchanged': 0})
+        self.assertEqual(len(response.json()['items']), 40)
+
+        items[0]['value'] = 9
+        response = self.submit(items[:-2])
+
+        self.assertEqual(response.json()['summary'], {'created': 0, 'updated': 1, 'deleted': 2, 'unchanged': 37})
+        self.assertEqual(self.assessment.checklist_items.count(), 38)
+        self.assertEqual(self.assessment.checklist_items.get(kind=self.kinds[0]).value, 9)
+
+    def test_invalid_checklist_is_rejected_as_a_whole(self):
+        items = [{'kind': str(kind.pk), 'value': 5} for kind in self.kinds[:3]]
+        items[1]['value'] = 11
+
+        response = self.submit(items)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('value', response.json()['items'][1])
+        self.assertFalse(self.assessment.checklist_items.exists())
+
+        response = self.submit(items[:1] * 2)
+        self.assertEqual(response.status_code, 400)
+
+    def test_concurrent_submission_conflicts(self):
+        concurrent = []
+
+        def insert_concurrently(execute, sql, *args):
+            # Un altro invio crea la stessa voce subito prima dell'INSERT
+            if sql.startswith('INSERT INTO "company_info_underwritingchecklist"') and not concurrent:
+                concurrent.append(sql)
+                UnderwritingChecklist.objects.create(assessment=self.assessment, kind=self.kinds[0], value=1)
+            return execute(sql, *args)
+
+        with connection.execute_wrapper(insert_concurrently):
+            response = self.submit([{'kind': str(self.kinds[0].pk), 'value': 5}])
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(self.assessment.checklist_items.exists())
+
+
+class CompanyExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.retail = Company.objects.create(
+            vat_number='00000000001', legal_form='SRL', ateco_code='47.11', activity='Pizzeria "Da Mario", snc',
+        )
+        Company.objects.create(vat_number='00000000002', legal_form='SPA', ateco_code='10.11')
+        for year in (2023, 2024):
+            UnderwritingAssessment.objects.create(company=cls.retail, underwriting_year=year, risk_score=10)
+
+    def test_csv_joins_assessments(self):
+        response = self.client.get('/api/companies/export/')
+
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 3)
+        retail = [row for row in rows if row['vat_number'] == '00000000001']
+        self.assertEqual({row['assessment_underwriting_year'] for row in retail}, {'2023', '2024'})
+        self.assertEqual(retail[0]['activity'], 'Pizzeria "Da Mario", snc')
+        other = [row for row in rows if row['vat_number'] == '00000000002']
+        self.assertEqual(other[0]['assessment_uuid'], '')
+
+    def test_ndjson_gzip_with_filters(self):
+        response = self.client.get('/api/companies/export/', {'output': 'ndjson', 'gzip': '1', 'legal_form': 'SPA'})
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).splitlines()
+        self.assertEqual([json.loads(line)['vat_number'] for line in lines], ['00000000002'])
+
+        self.assertEqual(self.client.get('/api/companies/export/', {'output': 'xml'}).status_code, 400)
+
+    def test_search_filters_without_ranking(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/companies/export/', {'output': 'ndjson', 'search': 'pizzeria'})
+            lines = b''.join(response.streaming_content).splitlines()
+
+        self.assertEqual({json.loads(line)['vat_number'] for line in lines}, {'00000000001'})
+        self.assertFalse([query for query in queries if 'bm25' in query['sql'] or 'ts_rank' in query['sql']])
+
+
+class CompanyImportTests(TestCase):
+    CSV = (
+        'P.IVA;Forma giuridica;Codice Ateco;activity;annual_turnover;email\n'
+        '00000000001;srl;47.11;Pizzeria;1.234,50;info@pizzeria.it\n'
+        '00000000002;XYZ;47.11;Bar;;non-valida\n'
+        '00000000003;SPA;10.11;Panificio;900;\n'
+    )
+
+    def upload(self, content, **data):
+        upload = SimpleUploadedFile('aziende.csv', content.encode())
+        return self.client.post('/api/companies/import/', {'file': upload, **data})
+
+    def test_import_with_error_report(self):
+        Company.objects.create(vat_number='00000000003', legal_form='SRL', ateco_code='10.11', city='Roma')
+
+        response = self.upload(self.CSV)
+
+        self.assertEqual(response.status_code, 201)
+        result = response.json()
+        self.assertEqual((result['rows'], result['created'], result['updated'], result['failed']), (3, 1, 1, 1))
+        pizzeria = Company.objects.get(vat_number='00000000001')
+        self.assertEqual((pizzeria.legal_form, pizzeria.annual_turnover), ('SRL', Decimal('1234.50')))
+        # Le colonne assenti dal file non vengono toccate
+        self.assertEqual(Company.objects.get(vat_number='00000000003').city, 'Roma')
+        self.assertEqual(search_queryset(Company.objects.all(), 'panificio').count(), 1)
+
+        report = list(csv.reader(io.StringIO(self.client.get(result['error_report_url']).content.decode())))
+        self.assertEqual(report[0], ['row', 'vat_number', 'field', 'error'])
+        self.assertEqual({(row[0], row[2]) for row in report[1:]}, {('3', 'legal_form'), ('3', 'email')})
+
+    def test_dry_run_does_not_write(self):
+        response = self.upload(self.CSV, dry_run='1')
+
+        self.assertEqual(response.json()['created'], 2)
+        self.assertFalse(Company.objects.exists())
+
+    def test_missing_required_columns(self):
+        response = self.upload('activity\nBar\n')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_cp1252_file(self):
+        content = self.CSV.replace('Pizzeria', 'Caffè Già').encode('cp1252')
+        upload = SimpleUploadedFile('aziende.csv', content)
+
+        response = self.client.post('/api/companies/import/', {'file': upload})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Company.objects.get(vat_number='00000000001').activity, 'Caffè Già')
+
+    def test_undecodable_file(self):
+        content = self.CSV.encode() + b'00000000004;srl;47.11;Bar \x81;;\n'
+        upload = SimpleUploadedFile('aziende.csv', content)
+
+        response = self.client.post('/api/companies/import/', {'file': upload})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('riga 5', response.json()['error'])
+        self.assertFalse(Company.objects.exists())
+
+
+class PortfolioAggregateTests(TestCase):
+
+    def setUp(self):
+        self.retail = Company.objects.create(
+            vat_number='00000000001', legal_form='SRL', region='Lazio', ateco_code='47.11', annual_turnover=100,
+        )
+        self.farm = Company.objects.create(
+            vat_number='00000000002', legal_form='SRL', region='Lazio', ateco_code='01.11', annual_turnover=50,
+        )
+        for company in (self.retail, self.farm):
+            UnderwritingAssessment.objects.create(company=company, underwriting_year=2024, win_probability=40)
+
+    def snapshot(self):
+        return sorted(PortfolioAggregate.objects.values_list(
+            'underwriting_year', 'region', 'legal_form', 'ateco_section', 'assessments', 'total_turnover',
+            'risk_score_sum', 'risk_score_count', 'win_probability_sum', 'win_probability_count',
+        ))
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        portfolio.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_incremental_updates_match_rebuild(self):
+        self.assertEqual(
+            {(row[3], row[4]) for row in self.snapshot()}, {('G', 1), ('A', 1)}
+        )
+        self.retail.region = 'Toscana'
+        self.retail.save()
+        self.assertMatchesRebuild()
+
+        Company.objects.filter(pk=self.farm.pk).update(ateco_code='47.19')
+        self.assertMatchesRebuild()
+
+        UnderwritingAssessment.objects.filter(company=self.farm).update(risk_score=30)
+        bulk_upsert_companies([{'vat_number': '00000000002', 'legal_form': 'SPA', 'ateco_code': '47.19'}])
+        self.assertMatchesRebuild()
+
+        self.retail.delete()
+        self.assertMatchesRebuild()
+        self.assertEqual(PortfolioAggregate.objects.count(), 1)
+
+    def test_import_refreshes_groups(self):
+        content = 'vat_number;legal_form;ateco_code;region\n00000000001;SRL;47.11;Toscana\n'
+        upload = SimpleUploadedFile('aziende.csv', content.encode())
+
+        self.client.post('/api/companies/import/', {'file': upload})
+
+        self.assertIn('Toscana', {row[1] for row in self.snapshot()})
+        self.assertMatchesRebuild()
+
+    def test_refresh_only_touches_the_given_groups(self):
+        other = Company.objects.create(vat_number='00000000003', legal_form='SPA', region='Veneto', ateco_code='47.11')
+        UnderwritingAssessment.objects.create(company=other, underwriting_year=2023, win_probability=10)
+        # Gruppo del prodotto cartesiano (2024, Veneto, SPA) non richiesto: resta com'è
+        stale = PortfolioAggregate.objects.create(
+            underwriting_year=2024, region='Veneto', legal_form='SPA', ateco_section='G', assessments=99,
+        )
+        self.addCleanup(setattr, portfolio, 'KEY_BATCH_SIZE', portfolio.KEY_BATCH_SIZE)
+        portfolio.KEY_BATCH_SIZE = 1
+        PortfolioAggregate.objects.exclude(pk=stale.pk).update(assessments=0)
+
+        portfolio.refresh({(2024, 'Lazio', 'SRL', 'G'), (2024, 'Lazio', 'SRL', 'A'), (2023, 'Veneto', 'SPA', 'G')})
+
+        self.assertEqual(
+            set(PortfolioAggregate.objects.values_list('underwriting_year', 'region', 'ateco_section', 'assessments')),
+            {(2024, 'Lazio', 'G', 1), (2024, 'Lazio', 'A', 1), (2023, 'Veneto', 'G', 1), (2024, 'Veneto', 'G', 99)},
+        )
+
+    def test_summary_endpoint(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/portfolio-summary/', {'underwriting_year': 2024, 'ateco_section': 'G'})
+
+        self.assertEqual(response.json(), [{
+            'underwriting_year': 2024, 'region': 'Lazio', 'legal_form': 'SRL', 'ateco_section': 'G',
+            'assessments': 1, 'total_turnover': '100.00', 'average_risk_score': None,
+            'average_win_probability': '40.00', 'updated_at': response.json()[0]['updated_at'],
+        }])
+
+
+class SimilarityTests(TestCase):
+
+    def snapshot(self):
+        return sorted(CompanySimilarity.objects.values_list('company__vat_number', *similarity.FEATURE_FIELDS))
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        similarity.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_incremental_updates_match_rebuild(self):
+        company = Company.objects.create(vat_number='00000000001', legal_form='SRL', ateco_code='47.11',
+                                         annual_turnover=999, employees=9, region='Lazio')
+        self.assertEqual(self.snapshot(), [('00000000001', '4711', '47', 'G', 3.0, 1.0, 'Lazio')])
+
+        company.employees = 99
+        company.save()
+        self.assertMatchesRebuild()
+
+        Company.objects.filter(pk=company.pk).update(ateco_code='01.11')
+        bulk_upsert_companies([
+            {'vat_number': '00000000001', 'legal_form': 'SRL', 'ateco_code': '01.11', 'annual_turnover': '9'},
+            {'vat_number': '00000000002', 'legal_form': 'SPA', 'ateco_code': '10.11'},
+        ])
+        self.assertMatchesRebuild()
+
+        Company.objects.bulk_update([Company(pk=company.pk, region='Toscana')], ['region'])
+        self.assertMatchesRebuild()
+        company.delete()
+        self.assertEqual(CompanySimilarity.objects.count(), 1)
+
+    def test_import_updates_index(self):
+        Company.objects.create(vat_number='00000000001', legal_form='SRL', ateco_code='47.11', region='Lazio')
+        content = (
+            'vat_number;legal_form;ateco_code;annual_turnover\n'
+            '00000000001;SRL;01.11;999\n'
+            '00000000002;SPA;10.11;\n'
+        )
+        upload = SimpleUploadedFile('aziende.csv', content.encode())
+
+        self.client.post('/api/companies/import/', {'file': upload})
+
+        self.assertEqual(CompanySimilarity.objects.count(), 2)
+        self.assertMatchesRebuild()
+
+    def test_nearest_matches_exhaustive_search(self):
+        rng = random.Random(3)
+        companies = generate_companies(rng, 300)
+        for company in companies[::7]:
+            company.annual_turnover = None
+        Company.objects.bulk_create(companies)
+        index = similarity.SimilarityIndex.load()
+        self.assertEqual(len(index), 300)
+
+        for target in rng.sample(list(index.features.values()), 20):
+            expected = sorted(
+                similarity.distance(target, row) for row in index.features.values()
+                if row.company_id != target.company_id
+            )[:10]
+            nearest = index.nearest(target, 10, exclude={target.company_id})
+            self.assertEqual([distance for distance, _ in nearest], expected)
+
+    def test_fill_similar_deals(self):
+        def assessment(vat_number, turnover, year, won):
+            company = Company.objects.create(vat_number=vat_number, legal_form='SRL', ateco_code='47.11',
+                                             annual_turnover=turnover, region='Lazio')
+            return UnderwritingAssessment.objects.create(
+                company=company, underwriting_year=year,
+                conversion_time=timedelta(days=30) if won else None,
+            )
+
+        target = assessment('00000000001', 1000, 2024, won=False)
+        assessment('00000000002', 1100, 2023, won=True)
+        assessment('00000000003', 900, 2024, won=True)
+        assessment('00000000004', 1000, 2024, won=False)
+        # Più lontana e di un anno successivo: esclusa
+        assessment('00000000005', 10 ** 6, 2025, won=True)
+
+        result = similarity.fill_similar_deals(2024, neighbours=3)
+
+        self.assertEqual(result, {'scored': 3, 'updated': 3})
+        target.refresh_from_db()
+        self.assertEqual(target.similar_deals_won, 2)
+        self.assertEqual(target.average_deal_size, Decimal('1000.00'))
+        self.assertEqual(target.win_probability, Decimal('66.67'))
+        self.assertEqual(similarity.fill_similar_deals(2024, neighbours=3), {'scored': 3, 'updated': 0})
+
+
+class BenchmarkTests(TestCase):
+
+    def test_vat_numbers_have_valid_check_digit(self):
+        self.assertEqual(vat_check_digit('0048841001'), '0')
+        rng = random.Random(1)
+        vat_numbers = [italian_vat_number(rng, serial) for serial in range(1, 50)]
+        self.assertEqual(len(set(vat_numbers)), 49)
+        self.assertTrue(all(vat_check_digit(vat[:10]) == vat[10] for vat in vat_numbers))
+
+    def test_run_and_compare(self):
+        size = DatasetSize(companies=30, assessments=40, kinds=4, checklist_items=3)
+        result = run_benchmarks(size, ['list', 'fetch_contractors', 'scoring_dirty'], repeat=1, contractors=20)
+
+        self.assertEqual(result['dataset'], {'companies': 30, 'assessments': 40, 'kinds': 4, 'checklist_items': 120})
+        self.assertEqual(set(result['scenarios']), {'list', 'fetch_contractors', 'scoring_dirty'})
+        self.assertEqual(Company.objects.count(), 50)
+        json.dumps(result)
+
+        baseline = {'scenarios': {'list': dict(result['scenarios']['list'], median_ms=0.001)}}
+        [(name, previous, current, ratio, regression)] = compare(result, baseline)
+        self.assertEqual(name, 'list')
+        self.assertTrue(regression)
+
+
+class AdminChangelistQueryTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.kinds = ChecklistKind.objects.bulk_create([
+            ChecklistKind(name=f'Verifica {index}', rating=index) for index in range(5)
+        ])
+        self.created = 0
+
+    def add_assessments(self, count):
+        for index in range(self.created, self.created + count):
+            company = Company.objects.create(vat_number=f'{index:011d}', legal_form='SRL', ateco_code='47.11')
+            assessment = UnderwritingAssessment.objects.create(company=company, underwriting_year=2024,
+                                                               risk_score=index % 7)
+            UnderwritingChecklist.objects.bulk_create([
+                UnderwritingChecklist(assessment=assessment, kind=kind, value=5) for kind in self.kinds
+            ])
+        self.created += count
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=0)
+    def test_unfiltered_count_is_estimated_from_table_statistics(self):
+        self.add_assessments(3)
+        self.assertIsNone(estimate_row_count(Company))
+        self.assertEqual(EstimatedCountPaginator(Company.objects.all(), 100).count, 3)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.add_assessments(2)
+        self.assertEqual(estimate_row_count(Company), 3)
+        self.assertEqual(EstimatedCountPaginator(Company.objects.all(), 100).count, 3)
+        self.assertEqual(EstimatedCountPaginator(Company.objects.filter(legal_form='SRL'), 100).count, 5)
+
+    def test_changelists_and_forms_do_not_grow_with_rows(self):
+        urls = [
+            '/admin/company_info/underwritingchecklist/',
+            '/admin/company_info/underwritingchecklist/add/',
+            '/admin/company_info/underwritingassessment/',
+            '/admin/company_info/underwritingassessment/add/',
+            '/admin/company_info/company/',
+        ]
+        self.add_assessments(2)
+        for url in urls:
+            # Il primo caricamento popola le cache (es. content type)
+            self.count_queries(url)
+        baseline = {url: self.count_queries(url) for url in urls}
+        self.add_assessments(20)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), baseline[url])
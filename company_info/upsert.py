@@ -0,0 +1,246 @@
+"""
+Upsert massivo di Company, con chiave sulla partita IVA (vat_number).
+
+Le righe vengono scritte a blocchi con un singolo INSERT ... ON CONFLICT
+per blocco, all'interno di un'unica transazione. Ogni blocco gira in un
+savepoint: un errore del database invalida solo il blocco corrente. Le righe
+di un blocco con la stessa partita IVA vengono unite in una sola.
+
+Con `skip_unchanged` (sincronizzazione dal feed dei contractor) ogni riga
+riceve l'impronta dei campi forniti (content_fingerprint): le impronte del
+blocco vengono confrontate con una sola query con quelle salvate e le righe
+identiche non vengono riscritte, così updated_at e le cache restano invariati.
+Ogni altra scrittura di Company azzera l'impronta (vedi FEED_SYNC_FIELDS in
+company_info.models), così le modifiche locali vengono sovrascritte dal feed.
+Tutte le aziende viste dal job vengono marcate con il suo id (last_seen_sync):
+a fine job `mark_missing` segna con un solo UPDATE quelle non viste, senza
+tenere in memoria le partite IVA del feed.
+"""
+import hashlib
+import json
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, models, transaction
+from django.utils import timezone
+
+from .models import Company
+
+DEFAULT_BATCH_SIZE = 500
+# Numero massimo di errori riportati nel risultato, per non far crescere la memoria
+MAX_REPORTED_ERRORS = 100
+
+# Campi mai sovrascritti in caso di conflitto
+PROTECTED_FIELDS = {'uuid', 'vat_number', 'created_at'}
+
+
+@dataclass
+class UpsertResult:
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+    # Esito riga per riga (vat_number, 'created' | 'updated' | 'unchanged' | 'failed'),
+    # solo per il singolo blocco
+    outcomes: list = field(default_factory=list)
+
+    def merge(self, other):
+        self.created += other.created
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        self.failed += other.failed
+        self.errors.extend(other.errors[:MAX_REPORTED_ERRORS - len(self.errors)])
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def get_batch_size(batch_size=None):
+    return batch_size or getattr(settings, 'COMPANY_UPSERT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def build_company(company_info):
+    """
+    Costruisce un'istanza Company (non salvata) a partire da un dizionario di campi.
+    Solleva ValidationError se un campo non è valido.
+    """
+    values = {}
+    errors = {}
+    for name, value in company_info.items():
+        model_field = Company._meta.get_field(name)
+        if value is None and not model_field.null:
+            # I campi testuali opzionali accettano la stringa vuota, non NULL
+            value = model_field.get_default() if model_field.has_default() else ''
+        try:
+            values[name] = model_field.clean(value, None)
+        except ValidationError as e:
+            errors[name] = e.messages
+    if errors:
+        raise ValidationError(errors)
+    return Company(**values)
+
+
+def bulk_upsert_companies(rows, batch_size=None):
+    """
+    Crea o aggiorna le aziende descritte da `rows` (iterabile di dizionari con
+    i campi di Company) e restituisce un UpsertResult con i conteggi.
+    """
+    result = UpsertResult()
+    with transaction.atomic():
+        for chunk_result in iter_upsert_companies(rows, batch_size):
+            result.merge(chunk_result)
+    return result
+
+
+def iter_upsert_companies(rows, batch_size=None, skip_unchanged=False, update_fields=None, sync_id=None):
+    """
+    Generatore che esegue l'upsert un blocco alla volta, consumando `rows` in
+    modo pigro, e produce un UpsertResult (con l'esito riga per riga) per blocco.
+    Con `skip_unchanged` le righe con impronta invariata non vengono scritte e
+    tutte le aziende viste vengono marcate con `sync_id` (vedi modulo).
+    `update_fields` limita i campi aggiornati in caso di conflitto (di default
+    quelli presenti in ciascuna riga). La transazione che racchiude i blocchi è
+    a carico del chiamante.
+    """
+    batch_size = get_batch_size(batch_size)
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            break
+        yield _upsert_changed(chunk, sync_id) if skip_unchanged else _upsert_chunk(chunk, update_fields)
+
+
+def fingerprint(company_info):
+    """
+    Impronta dei campi di una riga, indipendente dall'ordine delle chiavi.
+    """
+    content = json.dumps(company_info, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+def _upsert_changed(chunk, sync_id=None):
+    # Le righe senza partita IVA proseguono per essere segnalate come scartate;
+    # a parità di partita IVA vince l'ultima riga, come nell'upsert
+    changed = [company_info for company_info in chunk if not company_info.get('vat_number')]
+    latest = {company_info['vat_number']: company_info for company_info in chunk if company_info.get('vat_number')}
+    saved = {
+        vat_number: (content_fingerprint, missing_from_feed_at is None)
+        for vat_number, content_fingerprint, missing_from_feed_at in Company.objects.filter(
+            vat_number__in=latest.keys()
+        ).values_list('vat_number', 'content_fingerprint', 'missing_from_feed_at')
+    }
+
+    result = UpsertResult()
+    for vat_number, company_info in latest.items():
+        content_fingerprint = fingerprint(company_info)
+        if saved.get(vat_number) == (content_fingerprint, True):
+            result.unchanged += 1
+            result.outcomes.append((vat_number, 'unchanged'))
+        else:
+            # Un'azienda ricomparsa nel feed perde il contrassegno di assenza
+            changed.append(dict(
+                company_info, content_fingerprint=content_fingerprint, last_seen_sync=sync_id,
+                missing_from_feed_at=None,
+            ))
+    if changed:
+        changed_result = _upsert_chunk(changed)
+        result.merge(changed_result)
+        result.outcomes.extend(changed_result.outcomes)
+    # Anche le aziende non riscritte (invariate o scartate) sono state viste:
+    # l'update diretto non tocca updated_at né le cache
+    seen = [vat_number for vat_number, outcome in result.outcomes if vat_number and outcome in ('unchanged', 'failed')]
+    if sync_id is not None and seen:
+        models.QuerySet(Company).filter(vat_number__in=seen).update(last_seen_sync=sync_id)
+    return result
+
+
+def mark_missing(sync_id):
+    """
+    Marca come assenti dal feed (missing_from_feed_at) le aziende sincronizzate
+    dal feed che il job `sync_id` non ha visto. Restituisce il numero di aziende
+    marcate.
+    """
+    return Company.objects.filter(
+        last_seen_sync__isnull=False, missing_from_feed_at__isnull=True,
+    ).exclude(last_seen_sync=sync_id).update(missing_from_feed_at=timezone.now())
+
+
+def _upsert_chunk(chunk, update_fields=None):
+    result = UpsertResult()
+    # A parità di partita IVA le righe vengono unite nell'ordine (per ogni campo
+    # vince l'ultimo valore), come se fossero scritte una dopo l'altra: ogni
+    # azienda finisce in un solo gruppo ed è contata una volta sola
+    merged, rows = {}, []
+    for company_info in chunk:
+        vat_number = company_info.get('vat_number')
+        if not vat_number:
+            rows.append(company_info)
+        elif vat_number in merged:
+            merged[vat_number].update(company_info)
+        else:
+            merged[vat_number] = dict(company_info)
+            rows.append(merged[vat_number])
+    # Le righe con gli stessi campi vengono scritte insieme, così in caso di
+    # conflitto si aggiornano solo i campi effettivamente forniti
+    groups = {}
+    for company_info in rows:
+        groups.setdefault(frozenset(company_info), []).append(company_info)
+    for keys, rows in groups.items():
+        fields = keys if update_fields is None else keys & set(update_fields)
+        rows_result = _upsert_rows(rows, sorted((fields - PROTECTED_FIELDS) | {'updated_at'}))
+        result.merge(rows_result)
+        result.outcomes.extend(rows_result.outcomes)
+    return result
+
+
+def _upsert_rows(rows, update_fields):
+    result = UpsertResult()
+    # A parità di partita IVA vince l'ultima riga
+    companies = {}
+    for company_info in rows:
+        vat_number = company_info.get('vat_number')
+        try:
+            if not vat_number:
+                raise ValidationError({'vat_number': ['Partita IVA mancante']})
+            companies[vat_number] = build_company(company_info)
+        except ValidationError as e:
+            result.failed += 1
+            result.errors.append({'vat_number': vat_number, 'error': e.message_dict})
+            result.outcomes.append((vat_number, 'failed'))
+
+    if not companies:
+        return result
+
+    try:
+        with transaction.atomic():
+            existing = set(
+                Company.objects.filter(vat_number__in=companies.keys()).values_list('vat_number', flat=True)
+            )
+            Company.objects.bulk_create(
+                companies.values(),
+                update_conflicts=True,
+                unique_fields=['vat_number'],
+                update_fields=update_fields,
+            )
+    except DatabaseError as e:
+        result.failed += len(companies)
+        result.errors.append({'vat_number': None, 'error': str(e)})
+        result.outcomes.extend((vat_number, 'failed') for vat_number in companies)
+        return result
+
+    result.updated += len(existing)
+    result.created += len(companies) - len(existing)
+    result.outcomes.extend(
+        (vat_number, 'updated' if vat_number in existing else 'created') for vat_number in companies
+    )
+    return result
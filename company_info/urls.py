@@ -1,10 +1,26 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CompanyViewSet
+
+from . import async_external, async_views
+from .views import CompanyImportViewSet, CompanyViewSet, PortfolioSummaryViewSet, SyncJobViewSet, UnderwritingAssessmentViewSet
 
 router = DefaultRouter()
 router.register(r'companies', CompanyViewSet, basename='company')
+router.register(r'assessments', UnderwritingAssessmentViewSet, basename='assessment')
+router.register(r'sync-jobs', SyncJobViewSet, basename='sync-job')
+router.register(r'company-imports', CompanyImportViewSet, basename='company-import')
+router.register(r'portfolio-summary', PortfolioSummaryViewSet, basename='portfolio-summary')
 
 urlpatterns = [
     path('', include(router.urls)),
 ]
+
+if async_external.httpx is not None:
+    # Versioni asincrone per ASGI (vedi company_info.async_views), solo con httpx installato
+    urlpatterns += [
+        path('async/companies/fetch_contractors/', async_views.fetch_contractors, name='async-company-fetch-contractors'),
+        path('async/companies/fetch_from_external/', async_views.fetch_from_external,
+             name='async-company-fetch-from-external'),
+        path('async/companies/fetch_from_external_batch/', async_views.fetch_from_external_batch,
+             name='async-company-fetch-from-external-batch'),
+    ]
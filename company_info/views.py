@@ -1,124 +1,147 @@
-from django.shortcuts import render
+import uuid
 
-from django.http import JsonResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 import requests
 
-from .models import Company
-from .serializers import CompanySerializer
+from . import exports, imports, lookup_cache, scoring
+from .checklists import ChecklistConflict, submit_checklist
+from .conditional import ConditionalGetMixin
+from .db_routing import ReplicaReadMixin
+from .fast_serialization import ValuesListMixin
+from .external import (
+    CompanyNotFound, company_data_to_company_info, fetch_company_data, lookup_companies, parse_vat_numbers,
+)
+from .filters import CompanyFilterBackend, CompanySearchFilter, filter_companies
+from .jobs import SyncJobConflict, start_contractors_sync
+from .models import Company, CompanyImport, PortfolioAggregate, SyncJob, UnderwritingAssessment, UnderwritingChecklist
+from .pagination import AssessmentCursorPagination, CompanyCursorPagination
+from .serializers import (
+    ChecklistSubmissionSerializer, CompanyImportSerializer, CompanySerializer, PortfolioAggregateSerializer, SyncJobSerializer,
+    UnderwritingAssessmentSerializer, UnderwritingChecklistSerializer,
+)
 
 
-class CompanyViewSet(viewsets.ModelViewSet):
+class CompanyViewSet(ReplicaReadMixin, ConditionalGetMixin, ValuesListMixin, viewsets.ModelViewSet):
     """
     ViewSet per gestire le operazioni CRUD su Company, con funzionalità
-    aggiuntiva di popolamento da servizio esterno.
+    aggiuntiva di popolamento da servizio esterno. Lista e dettaglio supportano
+    i GET condizionali (vedi company_info.conditional); la lista JSON usa il
+    percorso di lettura veloce (vedi company_info.fast_serialization). Lista,
+    dettaglio ed export leggono dalla replica (vedi company_info.db_routing).
     """
+    replica_actions = ('list', 'retrieve', 'export')
     queryset = Company.objects.all()
     serializer_class = CompanySerializer
+    pagination_class = CompanyCursorPagination
+    filter_backends = [CompanyFilterBackend, CompanySearchFilter]
 
-    def list(self, request):
+    @property
+    def keyset_ordering(self):
         """
-        Returns a list of all saved companies.
+        Ordinamento della paginazione: per rilevanza se c'è una ricerca full-text,
+        altrimenti per data di creazione.
         """
-        companies = self.get_queryset()
-        serializer = self.get_serializer(companies, many=True)
-        return Response(serializer.data)
+        if CompanySearchFilter.get_search_text(self.request):
+            return ('-search_rank', '-uuid')
+        return self.pagination_class.ordering
 
-    @action(detail=False, methods=['get'])
-    def fetch_contractors(self, request):
+    def get_queryset(self):
         """
-        Recupera informazioni sui contractor da un servizio esterno e popola/aggiorna
-        il modello Company.
+        Con `?fields=` nelle letture vengono caricate dal database solo le colonne
+        richieste (più quelle necessarie alla paginazione).
         """
-        # URL del servizio esterno
-        external_service_url = "https://staging-ayako.riskapp.it/midori/v02/negotiation/contractors/"
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            requested = self.get_serializer_class().get_requested_fields(self.request)
+            if requested is not None:
+                ordering = [
+                    field.lstrip('-') for field in self.keyset_ordering if field.lstrip('-') != 'search_rank'
+                ]
+                queryset = queryset.only(*dict.fromkeys(requested + ordering))
+        return queryset
 
-        try:
-            # Disable SSL verification warnings
-            import urllib3
-            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Esporta in streaming le aziende con le relative valutazioni di underwriting,
+        con gli stessi filtri della lista (vedi company_info.exports).
 
-            # Chiamata al servizio esterno
-            headers = {
-                'Authorization': 'JWT eyJ0eXAiOiJKV1QiLCJhbGciOiJIUzI1NiJ9.eyJ0b2tlbl90eXBlIjoiYWNjZXNzIiwiZXhwIjoxNzQzNzk1MzA2LCJqdGkiOiJmNTk1MmU1MGY2MjY0MjNmODMzNzMwMjg3OTVmYWYyOCIsInVzZXJuYW1lIjoidXNlci5hZG1pbiIsImlkIjo0MjgsInV1aWQiOiIxM2E0NmZiMC03NzdkLTQxNjUtYTc0MC1kNzA4NDc3ZDE4NzEiLCJlbWFpbCI6InRlc3RAdGVzdC50ZXN0IiwiZmlyc3RfbmFtZSI6IlVzZXIiLCJsYXN0X25hbWUiOiJBZG1pbiIsImxhbmd1YWdlIjoiaXQiLCJvcmdhbml6YXRpb24iOiJJbnRlc2EgU2FuUGFvbG8gQXNzaWN1cmEiLCJzbGFfbGV2ZWwiOiIwNTAwIiwic2xhX2V4cGlyZSI6IjIwMjctMTItMTYiLCJzdXJ2ZXlzIjp0cnVlLCJyaXNrZ3JhZGl…lYXRoZXJfZGF0YSI6ZmFsc2UsImNvbmRvbWluaXVtcyI6ZmFsc2UsImNvbXBhbmllcyI6dHJ1ZSwicHJpdmF0ZXMiOmZhbHNlLCJuZWdvdGlhdGlvbnMiOnRydWUsIm1hc3NpdmVfaW5zZXJ0aW9uIjp0cnVlLCJjb250cmFjdHNfYW5hbHl6ZXIiOmZhbHNlLCJpc19zc28iOmZhbHNlLCJuYXRjYXRfcmF0ZXMiOnRydWUsIm1hbmFnZXIiOnRydWUsImF2YXRhciI6Ii9tZWRpYS91c2VycHJvZmlsZS9hdmF0YXIvMTNhNDZmYjAtNzc3ZC00MTY1LWE3NDAtZDcwODQ3N2QxODcxL2RlZmF1bHQtYXZhdGFyLnBuZyIsImxvZ28iOiIiLCJqd3RzZXNzaWQiOiJmODhjMDU0Ny02MTFkLTQyZjAtODc4Ni1jODBlMzBhNmIzMDkifQ.Oo7NbfHLHtpp8DxXJPnccVx8TUPxsFPji479OmOasWE'
-            }
-            
-            response = requests.get(
-                external_service_url,
-                headers=headers,
-                verify=False,  # Disable SSL verification for development
-                timeout=30  # Add timeout
+        Parametri opzionali nella query string:
+        - output: 'csv' (default) oppure 'ndjson'
+        - gzip: 1 per comprimere il file
+        """
+        output = request.query_params.get('output', 'csv')
+        if output not in exports.FORMATS:
+            return Response(
+                {"error": f"Formato non supportato: {output}"},
+                status=status.HTTP_400_BAD_REQUEST
             )
+        compress = request.query_params.get('gzip') in ('1', 'true')
+        # Solo i filtri: il rank della ricerca full-text non serve all'esportazione
+        companies = filter_companies(Company.objects.all(), request.query_params)
 
-            # Check if the response is successful
-            if response.status_code != 200:
-                return Response(
-                    {"error": f"API returned status code {response.status_code}: {response.text}"},
-                    status=status.HTTP_503_SERVICE_UNAVAILABLE
-                )
-
-            try:
-                contractors_data = response.json()
-            except ValueError as e:
-                return Response(
-                    {"error": f"Invalid JSON response: {str(e)}"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-
-            if not isinstance(contractors_data, list):
-                return Response(
-                    {"error": "Expected a list of contractors in the response"},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+        filename = f'companies.{output}' + ('.gz' if compress else '')
+        response = StreamingHttpResponse(
+            exports.export_companies(companies, output, compress),
+            content_type='application/gzip' if compress else exports.FORMATS[output],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
-            created_companies = []
-            for contractor in contractors_data:
-                try:
-                    # Mappatura dei dati ricevuti al modello Company
-                    company_info = {
-                        'vat_number': contractor.get('vat_number'),
-                        'legal_form': 'ALTRO',  # Default value since it's not provided in the API
-                        'ateco_code': contractor.get('activity'),  # Using activity as ateco_code
-                        'activity': contractor.get('activity_full_description'),
-                        'activity_description': contractor.get('activity_full_description'),
-                        'annual_turnover': contractor.get('yearly_revenues'),
-                        'address': contractor.get('address'),
-                        'city': contractor.get('city'),
-                        'postal_code': contractor.get('postcode'),
-                        'region': contractor.get('province'),  # Using province as region
-                        'country': contractor.get('country'),
-                    }
-
-                    # Crea o aggiorna l'azienda nel database
-                    company, created = Company.objects.update_or_create(
-                        vat_number=contractor.get('vat_number'),
-                        defaults=company_info
-                    )
-                    created_companies.append(company)
-                except Exception as e:
-                    print(f"Error processing contractor {contractor.get('vat_number')}: {str(e)}")
-                    continue
+    @action(detail=False, methods=['post'], url_path='import', serializer_class=CompanyImportSerializer)
+    def import_file(self, request):
+        """
+        Importa (crea o aggiorna per partita IVA) le aziende da un file CSV o XLSX
+        (vedi company_info.imports).
 
-            # Prepara la risposta
-            result = CompanySerializer(created_companies, many=True).data
-            return Response(result, status=status.HTTP_200_OK)
+        Parametri nel corpo multipart:
+        - file: il file da importare
+        - dry_run: 1 per validare il file senza salvare nulla
 
-        except requests.exceptions.RequestException as e:
-            # Gestione degli errori di connessione o risposta
-            print(f"Request error: {str(e)}")
+        Restituisce i conteggi e, se ci sono righe scartate, il link al report degli errori.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
             return Response(
-                {"error": f"Errore nella comunicazione con il servizio esterno: {str(e)}"},
-                status=status.HTTP_503_SERVICE_UNAVAILABLE
+                {"error": "È necessario caricare un file"},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        except Exception as e:
-            # Gestione di altri errori
-            print(f"Unexpected error: {str(e)}")
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true')
+        try:
+            company_import = imports.import_companies(upload, upload.name, dry_run=dry_run)
+        except imports.ImportFileError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        data = CompanyImportSerializer(company_import, context={'request': request}).data
+        data['ignored_columns'] = company_import.ignored_columns
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def fetch_contractors(self, request):
+        """
+        Recupera informazioni sui contractor da un servizio esterno e popola/aggiorna
+        il modello Company.
+
+        La sincronizzazione viene eseguita in background: la risposta (202) contiene
+        il job creato, il cui avanzamento è consultabile su /api/sync-jobs/<id>/.
+        Se un'altra sincronizzazione è già in corso risponde 409 con il job attivo.
+        """
+        try:
+            job = start_contractors_sync()
+        except SyncJobConflict as e:
             return Response(
-                {"error": f"Errore durante l'elaborazione: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"error": "Sincronizzazione già in corso", "job": SyncJobSerializer(e.job).data if e.job else None},
+                status=status.HTTP_409_CONFLICT
             )
+        return Response(
+            SyncJobSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': reverse('sync-job-detail', args=[job.pk], request=request)}
+        )
 
     @action(detail=False, methods=['post'])
     def fetch_from_external(self, request):
@@ -130,47 +153,27 @@ class CompanyViewSet(viewsets.ModelViewSet):
         - vat_number: Partita IVA dell'azienda da cercare
         """
         vat_number = request.data.get('vat_number')
+        # Forma canonica per la ricerca e per il salvataggio: 'IT 01234567890' e
+        # '01234567890' sono la stessa azienda
+        vat_number = lookup_cache.normalize_vat_number(vat_number) if vat_number else None
         if not vat_number:
             return Response(
                 {"error": "È necessario fornire una partita IVA"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # URL del servizio esterno (da configurare nelle impostazioni)
-        external_service_url = "https://api.esempio-servizio.it/company-info"
-
         try:
-            # Chiamata al servizio esterno
-            response = requests.get(
-                external_service_url,
-                params={'vat_number': vat_number},
-                # Aggiungi eventuali headers necessari per l'autenticazione
-                # headers={'Authorization': 'Bearer your_token'}
-            )
-
-            # Verifica della risposta
-            response.raise_for_status()  # Solleva un'eccezione per risposte HTTP di errore
-            company_data = response.json()
+            # Chiamata al servizio esterno (sessione condivisa, con timeout e retry)
+            company_data = fetch_company_data(vat_number)
 
             # Mappatura dei dati ricevuti al modello Company
+            # (i campi assenti nella risposta non vengono toccati; la partita IVA
+            # richiesta è la chiave di ricerca e prevale su quella restituita)
             company_info = {
-                'vat_number': company_data.get('vat_number'),
-                'legal_form': company_data.get('legal_form'),
-                'ateco_code': company_data.get('ateco_code'),
-                'activity': company_data.get('activity'),
-                'activity_description': company_data.get('activity_description'),
-                'annual_turnover': company_data.get('annual_turnover'),
-                'employees': company_data.get('employees'),
-                'seasonality': company_data.get('seasonality'),
-                'address': company_data.get('address'),
-                'city': company_data.get('city'),
-                'postal_code': company_data.get('postal_code'),
-                'region': company_data.get('region'),
-                'country': company_data.get('country'),
-                'email': company_data.get('email'),
-                'phone': company_data.get('phone'),
-                'contact_person': company_data.get('contact_person'),
+                name: value for name, value in company_data_to_company_info(company_data).items()
+                if value is not None
             }
+            company_info['vat_number'] = vat_number
 
             # Crea o aggiorna l'azienda nel database
             company, created = Company.objects.update_or_create(
@@ -184,6 +187,11 @@ class CompanyViewSet(viewsets.ModelViewSet):
 
             return Response(result, status=status_code)
 
+        except CompanyNotFound:
+            return Response(
+                {"error": f"Nessuna azienda trovata per la partita IVA {vat_number}"},
+                status=status.HTTP_404_NOT_FOUND
+            )
         except requests.exceptions.RequestException as e:
             # Gestione degli errori di connessione o risposta
             return Response(
@@ -196,3 +204,159 @@ class CompanyViewSet(viewsets.ModelViewSet):
                 {"error": f"Errore durante l'elaborazione: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+    @action(detail=False, methods=['post'])
+    def fetch_from_external_batch(self, request):
+        """
+        Variante massiva di fetch_from_external: le partite IVA vengono cercate in
+        parallelo sul servizio esterno e le aziende trovate salvate con un upsert massivo.
+
+        Parametri richiesti nel request.data:
+        - vat_numbers: lista delle partite IVA da cercare
+
+        Restituisce l'esito per ogni partita IVA e i conteggi per esito.
+        """
+        try:
+            vat_numbers = parse_vat_numbers(request.data.get('vat_numbers'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(lookup_companies(vat_numbers), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def lookup_cache_stats(self, request):
+        """
+        Contatori della cache delle ricerche sul servizio esterno: hit, hit negativi,
+        miss, rivalidazioni condizionali e chiamate effettive al servizio.
+        """
+        return Response(lookup_cache.get_stats())
+
+
+class SyncJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Stato e avanzamento dei job di sincronizzazione in background.
+    """
+    queryset = SyncJob.objects.all()
+    serializer_class = SyncJobSerializer
+
+
+class CompanyImportViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Importazioni di aziende da file, con il report delle righe scartate.
+    """
+    queryset = CompanyImport.objects.defer('error_report')
+    serializer_class = CompanyImportSerializer
+
+    @action(detail=True, methods=['get'])
+    def errors(self, request, pk=None):
+        """
+        Report CSV delle righe scartate (riga, partita IVA, campo, errore).
+        """
+        company_import = self.get_object()
+        response = HttpResponse(company_import.error_report, content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="errori-{company_import.pk}.csv"'
+        return response
+
+
+class PortfolioSummaryViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Riepilogo del portafoglio per anno, regione, forma giuridica e sezione Ateco,
+    letto dagli aggregati materializzati (vedi company_info.portfolio).
+
+    Filtri opzionali: `?underwriting_year=`, `?region=`, `?legal_form=`, `?ateco_section=`.
+    """
+    queryset = PortfolioAggregate.objects.all()
+    serializer_class = PortfolioAggregateSerializer
+    filter_params = ('region', 'legal_form', 'ateco_section')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        underwriting_year = self.request.query_params.get('underwriting_year')
+        if underwriting_year:
+            if not underwriting_year.isdigit():
+                raise ValidationError({'underwriting_year': ["Anno non valido"]})
+            queryset = queryset.filter(underwriting_year=underwriting_year)
+        for name in self.filter_params:
+            if name in self.request.query_params:
+                queryset = queryset.filter(**{name: self.request.query_params[name]})
+        return queryset
+
+
+class UnderwritingAssessmentViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
+    """
+    ViewSet per le valutazioni di underwriting, con checklist e tipi annidati.
+    Le relazioni sono precaricate e i tipi vengono dal registro in memoria: una
+    pagina costa un numero costante di query, indipendentemente dalla sua
+    dimensione. Lista e dettaglio leggono dalla replica.
+    """
+    queryset = UnderwritingAssessment.objects.select_related('company').prefetch_related('checklist_items')
+    serializer_class = UnderwritingAssessmentSerializer
+    pagination_class = AssessmentCursorPagination
+
+    def get_queryset(self):
+        """
+        Filtri opzionali: `?underwriting_year=` e `?company=` (uuid dell'azienda).
+        """
+        queryset = super().get_queryset()
+        underwriting_year = self.request.query_params.get('underwriting_year')
+        if underwriting_year:
+            if not underwriting_year.isdigit():
+                raise ValidationError({'underwriting_year': ["Anno non valido"]})
+            queryset = queryset.filter(underwriting_year=underwriting_year)
+        company = self.request.query_params.get('company')
+        if company:
+            try:
+                queryset = queryset.filter(company=uuid.UUID(company))
+            except ValueError:
+                raise ValidationError({'company': ["UUID non valido"]})
+        return queryset
+
+    @action(detail=True, methods=['put'], serializer_class=ChecklistSubmissionSerializer)
+    def checklist(self, request, pk=None):
+        """
+        Sostituisce in blocco la checklist dell'assessment, in un'unica transazione.
+
+        Parametri richiesti nel request.data:
+        - items: lista delle voci, ciascuna con kind (uuid del tipo), value (0-10)
+          e facoltativamente is_compliant, notes, completed_by
+
+        Le voci esistenti di tipi non presenti in `items` vengono eliminate.
+        Restituisce i conteggi per esito e la checklist risultante, oppure 409
+        se un invio concorrente ha modificato la checklist.
+        """
+        assessment = self.get_object()
+        serializer = ChecklistSubmissionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            summary = submit_checklist(assessment, serializer.validated_data['items'])
+        except ChecklistConflict:
+            return Response(
+                {"error": "Checklist modificata da un'altra richiesta, riprovare"},
+                status=status.HTTP_409_CONFLICT
+            )
+        items = UnderwritingChecklist.objects.filter(assessment=assessment)
+        return Response({
+            'summary': summary,
+            'items': UnderwritingChecklistSerializer(items, many=True).data,
+        })
+
+    @action(detail=False, methods=['post'])
+    def recompute_risk_scores(self, request):
+        """
+        Ricalcola il risk_score a partire dalle checklist, per tutte le valutazioni
+        o per quelle di un anno di underwriting.
+
+        Parametri opzionali nel request.data:
+        - underwriting_year: anno da ricalcolare
+
+        Restituisce il numero di valutazioni calcolate e di quelle aggiornate.
+        """
+        underwriting_year = request.data.get('underwriting_year')
+        if underwriting_year is not None:
+            if not str(underwriting_year).isdigit():
+                return Response(
+                    {"error": "Anno di underwriting non valido"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            underwriting_year = int(underwriting_year)
+        return Response(scoring.recompute_risk_scores(underwriting_year=underwriting_year))
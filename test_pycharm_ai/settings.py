@@ -44,6 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Per primo, così misura l'intera richiesta (vedi company_info.metrics)
+    'company_info.metrics.MetricsMiddleware',
+    'company_info.db_routing.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,13 +80,29 @@ WSGI_APPLICATION = 'test_pycharm_ai.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Connessioni persistenti (secondi), verificate prima del riuso. Con ASGI
+# conviene CONN_MAX_AGE = 0 e il pooling del database.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # Replica in sola lettura (vedi company_info.db_routing). In locale è una
+    # copia del file principale: cp db.sqlite3 db-replica.sqlite3. Se il file
+    # non esiste le letture restano sul primario.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / 'db-replica.sqlite3'}?mode=ro",
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['company_info.db_routing.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -128,6 +147,11 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
+    # Stesso output di JSONRenderer, con orjson se installato
+    'DEFAULT_RENDERER_CLASSES': [
+        'company_info.fast_serialization.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 # Swagger settings
@@ -141,3 +165,119 @@ SWAGGER_SETTINGS = {
     },
     'USE_SESSION_AUTH': False,
 }
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Ricerche sul servizio esterno di informazioni aziendali (LRU limitata)
+    'company_lookups': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'company_lookups',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
+# Company info
+# Servizio esterno dei contractor
+CONTRACTORS_SERVICE_URL = "https://staging-ayako.riskapp.it/midori/v02/negotiation/contractors/"
+CONTRACTORS_SERVICE_AUTHORIZATION = 'JWT eyJ0eXAiOiJKV1QiLCJhbGciOiJIUzI1NiJ9.eyJ0b2tlbl90eXBlIjoiYWNjZXNzIiwiZXhwIjoxNzQzNzk1MzA2LCJqdGkiOiJmNTk1MmU1MGY2MjY0MjNmODMzNzMwMjg3OTVmYWYyOCIsInVzZXJuYW1lIjoidXNlci5hZG1pbiIsImlkIjo0MjgsInV1aWQiOiIxM2E0NmZiMC03NzdkLTQxNjUtYTc0MC1kNzA4NDc3ZDE4NzEiLCJlbWFpbCI6InRlc3RAdGVzdC50ZXN0IiwiZmlyc3RfbmFtZSI6IlVzZXIiLCJsYXN0X25hbWUiOiJBZG1pbiIsImxhbmd1YWdlIjoiaXQiLCJvcmdhbml6YXRpb24iOiJJbnRlc2EgU2FuUGFvbG8gQXNzaWN1cmEiLCJzbGFfbGV2ZWwiOiIwNTAwIiwic2xhX2V4cGlyZSI6IjIwMjctMTItMTYiLCJzdXJ2ZXlzIjp0cnVlLCJyaXNrZ3JhZGl…lYXRoZXJfZGF0YSI6ZmFsc2UsImNvbmRvbWluaXVtcyI6ZmFsc2UsImNvbXBhbmllcyI6dHJ1ZSwicHJpdmF0ZXMiOmZhbHNlLCJuZWdvdGlhdGlvbnMiOnRydWUsIm1hc3NpdmVfaW5zZXJ0aW9uIjp0cnVlLCJjb250cmFjdHNfYW5hbHl6ZXIiOmZhbHNlLCJpc19zc28iOmZhbHNlLCJuYXRjYXRfcmF0ZXMiOnRydWUsIm1hbmFnZXIiOnRydWUsImF2YXRhciI6Ii9tZWRpYS91c2VycHJvZmlsZS9hdmF0YXIvMTNhNDZmYjAtNzc3ZC00MTY1LWE3NDAtZDcwODQ3N2QxODcxL2RlZmF1bHQtYXZhdGFyLnBuZyIsImxvZ28iOiIiLCJqd3RzZXNzaWQiOiJmODhjMDU0Ny02MTFkLTQyZjAtODc4Ni1jODBlMzBhNmIzMDkifQ.Oo7NbfHLHtpp8DxXJPnccVx8TUPxsFPji479OmOasWE'
+
+# Dimensione dei blocchi per l'upsert massivo delle aziende
+COMPANY_UPSERT_BATCH_SIZE = 500
+
+# Job di sincronizzazione in background: 'thread' (worker nel processo) oppure
+# 'db' (job prelevati da `manage.py sync_contractors --worker`)
+SYNC_JOB_RUNNER = 'thread'
+# Secondi senza heartbeat (o, per i job in attesa, dalla creazione) dopo i quali
+# un job è considerato abbandonato
+SYNC_JOB_STALE_AFTER = 600
+
+# Servizio esterno di informazioni aziendali
+COMPANY_INFO_SERVICE_URL = "https://api.esempio-servizio.it/company-info"
+# Timeout (secondi) per singola chiamata e retry con backoff esponenziale
+COMPANY_INFO_SERVICE_TIMEOUT = 10
+COMPANY_INFO_SERVICE_RETRIES = 3
+COMPANY_INFO_SERVICE_BACKOFF = 0.5
+# Chiamate contemporanee (e connessioni nel pool) per le ricerche massive
+COMPANY_INFO_SERVICE_MAX_WORKERS = 16
+COMPANY_INFO_BATCH_MAX_SIZE = 10000
+
+# Cache delle ricerche sul servizio esterno (TTL in secondi)
+COMPANY_LOOKUP_CACHE = 'company_lookups'
+COMPANY_LOOKUP_CACHE_TTL = 3600
+COMPANY_LOOKUP_CACHE_NEGATIVE_TTL = 600
+# Per quanto tempo una voce scaduta con ETag/Last-Modified resta rivalidabile
+COMPANY_LOOKUP_CACHE_REVALIDATE_WINDOW = 86400
+
+# Oltre questa soglia di righe le changelist non filtrate dell'admin usano un
+# conteggio stimato dalle statistiche del database (ANALYZE) invece di COUNT(*)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 10000
+
+# Calcolo massivo del risk_score (vedi company_info.scoring): penalità per le
+# voci non conformi (scalata sul rating del tipo) e dimensione dei blocchi
+RISK_SCORE_NON_COMPLIANT_PENALTY = 5
+RISK_SCORE_BATCH_SIZE = 2000
+# Ricalcolo incrementale dopo le modifiche alle checklist: 'command'
+# (`manage.py compute_risk_scores --dirty --watch`) oppure 'thread' (timer nel
+# processo, dopo RISK_SCORE_RECOMPUTE_DELAY secondi; solo per lo sviluppo).
+# Con 'command' il comando deve restare in esecuzione: altrimenti i risk_score
+# delle checklist modificate restano vecchi senza limite di tempo
+RISK_SCORE_RECOMPUTE_RUNNER = 'command'
+RISK_SCORE_RECOMPUTE_DELAY = 2
+
+# Righe lette dal database (e scritte nel flusso) per blocco nelle esportazioni
+EXPORT_CHUNK_SIZE = 2000
+
+# Righe per blocco nell'importazione di aziende da file
+COMPANY_IMPORT_BATCH_SIZE = 2000
+
+# Cache condivisa delle risposte di lista e dettaglio delle aziende (alias di
+# CACHES, None per disattivarla), invalidata a ogni scrittura su Company
+COMPANY_RESPONSE_CACHE = None
+COMPANY_RESPONSE_CACHE_TTL = 300
+
+# Strumentazione delle richieste ed endpoint /metrics (vedi company_info.metrics):
+# le richieste più lente della soglia (secondi) vengono registrate nel log con
+# le query più costose
+METRICS_ENABLED = True
+METRICS_SLOW_REQUEST_THRESHOLD = 1.0
+METRICS_SLOW_REQUEST_TOP_QUERIES = 5
+
+# View asincrone per ASGI (vedi company_info.async_views, richiedono httpx:
+# senza il pacchetto le route /api/async/ non vengono registrate): ricerche
+# in volo sul servizio esterno per processo e scritture raggruppate tra
+# richieste concorrenti (righe per blocco, attesa in secondi)
+COMPANY_INFO_ASYNC_MAX_CONCURRENCY = 200
+COMPANY_ASYNC_WRITE_BATCH_SIZE = 100
+COMPANY_ASYNC_WRITE_DELAY = 0.005
+
+# Letture su replica (vedi company_info.db_routing): alias della replica (None
+# per disattivarla), secondi in cui le letture restano sul primario dopo una
+# scrittura e intervallo (secondi) tra i controlli di raggiungibilità
+DATABASE_REPLICA_ALIAS = 'replica'
+DATABASE_REPLICA_PIN_SECONDS = 5
+DATABASE_REPLICA_HEALTH_CHECK_INTERVAL = 10
+
+# Sincronizzazione dei contractor: a fine job marca (missing_from_feed_at) le
+# aziende del feed che non vi compaiono più
+CONTRACTORS_SYNC_FLAG_MISSING = True
+
+# Registro in memoria dei tipi di checklist (vedi company_info.checklist_kinds):
+# alias di CACHES della versione condivisa tra i processi (in produzione una
+# cache condivisa, ad esempio Redis: con locmem ogni processo ricarica i tipi a
+# ogni intervallo) e intervallo (secondi) tra i controlli
+CHECKLIST_KIND_CACHE = 'default'
+CHECKLIST_KIND_CACHE_CHECK_INTERVAL = 5
+
+# Trattative simili (vedi company_info.similarity): aziende più simili da cui
+# si ricavano similar_deals_won, average_deal_size e win_probability, e
+# dimensione dei blocchi per indice e scritture
+SIMILAR_DEALS_NEIGHBOURS = 20
+SIMILARITY_BATCH_SIZE = 2000